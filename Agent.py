@@ -1,14 +1,35 @@
 from Brain import Brain
+from Normalizer import Normalizer, normalizer_file
 from ReplayBuffer import ReplayBuffer
-from keras.models import load_model
+from ShardedReplayBuffer import ShardedReplayBuffer
 import numpy as np
+import os
+
+
+def apex_epsilons(n_actors, base=0.4, alpha=7):
+    """
+    Per-actor exploration rates of the Ape-X schedule, epsilon_i = base ** (1 + alpha * i / (N - 1)).
+
+    Args:
+        n_actors (int): Number of actors.
+        base (float): Exploration rate of the first actor.
+        alpha (float): Exponent spreading the rates of the other actors.
+
+    Returns:
+        numpy.ndarray: The exploration rate of every actor.
+    """
+    if n_actors == 1:
+        return np.array([base])
+    return base ** (1 + alpha * np.arange(n_actors) / (n_actors - 1))
+
 
 class Agent(object):
     """Agent interacting with and learning from the environment."""
 
     def __init__(self, alpha, gamma, n_actions, epsilon, batch_size,
                  input_dims, epsilon_dec, epsilon_min,
-                 mem_size, replace_target, fname='model/model.keras'):
+                 mem_size, replace_target, fname='model/model.keras', tau=None, brain_options=None,
+                 normalizer=None, replay_shards=1):
         """
         Initialize the agent.
 
@@ -22,8 +43,16 @@ class Agent(object):
             epsilon_dec (float): Rate at which epsilon is decremented.
             epsilon_min (float): Minimum value of epsilon.
             mem_size (int): Size of the memory buffer.
-            replace_target (float): Target for updating the target network.
+            replace_target (int): Number of gradient steps between two copies of the
+                evaluation network into the target network.
             fname (str): File name for saving and loading the model.
+            tau (float): If set, the target network is Polyak averaged towards the
+                evaluation network with this weight after every gradient step instead.
+            brain_options (dict): Extra keyword arguments of both Brain networks.
+            normalizer (Normalizer): Optional preprocessing of the states and rewards. It is
+                saved next to the model and loaded with it.
+            replay_shards (int): Number of shards of the replay buffer. With more than one,
+                every concurrent collector passes its own shard to remember.
         """
         self.action_space = [i for i in range(n_actions)]
         self.n_actions = n_actions
@@ -35,19 +64,33 @@ class Agent(object):
         self.batch_size = batch_size
         self.model_file = fname
         self.replace_target = replace_target
-        self.memory = ReplayBuffer(mem_size, input_dims, n_actions, discrete=True)
+        self.tau = tau
+        self.learn_step_counter = 0
+        self.normalizer = normalizer
+        if replay_shards > 1:
+            self.memory = ShardedReplayBuffer(mem_size, input_dims, n_actions, replay_shards, discrete=True)
+        else:
+            self.memory = ReplayBuffer(mem_size, input_dims, n_actions, discrete=True)
 
-        self.brain_eval = Brain(input_dims, n_actions, alpha, batch_size)
-        self.brain_target = Brain(input_dims, n_actions, alpha, batch_size)
+        brain_options = brain_options or {}
+        self.brain_eval = Brain(input_dims, n_actions, alpha, batch_size, **brain_options)
+        self.brain_target = Brain(input_dims, n_actions, alpha, batch_size, **brain_options)
 
-    def remember(self, state, action, reward, new_state, done):
-        """Store a transition in the memory buffer."""
-        self.memory.store_transition(state, action, reward, new_state, done)
+    def remember(self, state, action, reward, new_state, done, shard=0):
+        """Store a transition in the memory buffer, in the shard of its collector if it is sharded."""
+        if isinstance(self.memory, ShardedReplayBuffer):
+            self.memory.store_transition(state, action, reward, new_state, done, shard=shard)
+        else:
+            self.memory.store_transition(state, action, reward, new_state, done)
+        if self.normalizer is not None:
+            self.normalizer.update(state, new_state, reward, done)
 
     def get_action(self, state):
         """Return the action to be taken based on the current state."""
         state = np.array(state)
         state = state[np.newaxis, :]
+        if self.normalizer is not None:
+            state = self.normalizer.normalize(state)
 
         rand = np.random.random()
         if rand < self.epsilon:
@@ -58,10 +101,51 @@ class Agent(object):
 
         return action
 
-    def learn(self):
-        """Train the model using the experiences in the memory buffer."""
-        if self.memory.mem_cntr > self.batch_size:
-            state, action, reward, new_state, done = self.memory.sample_buffer(self.batch_size)
+    def get_actions(self, states, epsilons=None):
+        """
+        Return the actions to be taken for a batch of states.
+
+        All states go through the network in a single forward pass, and the
+        epsilon-greedy exploration is drawn for every row at once.
+
+        Args:
+            states (numpy.ndarray): States of shape (N, input_dims).
+            epsilons (float or numpy.ndarray): Exploration rate shared by all rows or one
+                per row, for example from apex_epsilons. Defaults to the agent epsilon.
+
+        Returns:
+            numpy.ndarray: The action of every state.
+        """
+        states = np.asarray(states)
+        n = len(states)
+        epsilons = self.epsilon if epsilons is None else epsilons
+        explore = np.random.random(n) < np.broadcast_to(epsilons, (n,))
+
+        actions = np.random.randint(self.n_actions, size=n)
+        if not explore.all():
+            if self.normalizer is not None:
+                states = self.normalizer.normalize(states)
+            greedy = np.argmax(self.brain_eval.predict(states), axis=1)
+            actions = np.where(explore, actions, greedy)
+        return actions
+
+    def learn(self, batch=None):
+        """
+        Train the model using the experiences in the memory buffer.
+
+        Args:
+            batch (tuple): Optional batch in the format of ReplayBuffer.sample_buffer,
+                sampled from the memory buffer when not given.
+        """
+        if batch is None and self.memory.mem_cntr > self.batch_size:
+            batch = self.memory.sample_buffer(self.batch_size)
+        if batch is not None:
+            state, action, reward, new_state, done = batch
+            if self.normalizer is not None:
+                # The buffer keeps raw values, they follow the latest statistics
+                state = self.normalizer.normalize(state)
+                new_state = self.normalizer.normalize(new_state)
+                reward = self.normalizer.scale(reward)
 
             action_values = np.array(self.action_space, dtype=np.int8)
             action_indices = np.dot(action, action_values)
@@ -74,13 +158,20 @@ class Agent(object):
 
             q_target = q_pred
 
-            batch_index = np.arange(self.batch_size, dtype=np.int32)
+            batch_index = np.arange(len(state), dtype=np.int32)
 
             q_target[batch_index, action_indices] = reward + self.gamma * q_next[
                 batch_index, max_actions.astype(int)] * done
 
             _ = self.brain_eval.train(state, q_target)
 
+            # Synchronize the target network on a gradient step schedule
+            self.learn_step_counter += 1
+            if self.tau is not None:
+                self.brain_target.copy_weights(self.brain_eval, self.tau)
+            elif self.learn_step_counter % self.replace_target == 0:
+                self.update_network_parameters()
+
             self.epsilon = max(self.epsilon * self.epsilon_dec, self.epsilon_min)
 
     def update_network_parameters(self):
@@ -88,11 +179,18 @@ class Agent(object):
         self.brain_target.copy_weights(self.brain_eval)
 
     def save_model(self):
-        """Save the model to a file."""
+        """Save the model to a file, and the normalizer next to it."""
         self.brain_eval.model.save(self.model_file)
+        if self.normalizer is not None:
+            self.normalizer.save(normalizer_file(self.model_file))
 
     def load_model(self):
-        """Load the model from a file."""
+        """Load the model from a file, and its normalizer if it was saved with one."""
+        from keras.models import load_model
+
+        if os.path.exists(normalizer_file(self.model_file)):
+            self.normalizer = Normalizer.load(normalizer_file(self.model_file))
+
         self.brain_eval.model = load_model(self.model_file)
         self.brain_target.model = load_model(self.model_file)
 
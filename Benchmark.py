@@ -0,0 +1,261 @@
+import multiprocessing
+import time
+import numpy as np
+
+
+def benchmark_profile(name, updates=200, warmup=20, alpha=0.001, batch_size=512, input_dims=7, n_actions=7):
+    """
+    Measure the training throughput of a Brain with a CPU training profile.
+
+    Args:
+        name (str): Name of the profile in Profiles.CPU_PROFILES.
+        updates (int): Number of timed gradient steps.
+        warmup (int): Number of untimed gradient steps run first, to build and compile the model.
+        alpha (float): Learning rate of the agent before the profile scales it.
+        batch_size (int): Batch size of the agent before the profile changes it.
+        input_dims (int): Number of inputs of the network.
+        n_actions (int): Number of outputs of the network.
+
+    Returns:
+        dict: The profile, its batch size and learning rate, and the updates and samples per second.
+    """
+    from Brain import Brain, apply_profile
+
+    alpha, batch_size, brain_options = apply_profile(name, alpha, batch_size)
+    brain = Brain(input_dims, n_actions, alpha, batch_size, **brain_options)
+    updates_per_sec = time_updates(brain, updates, warmup)
+    return {"profile": name, "batch_size": batch_size, "alpha": alpha,
+            "updates_per_sec": updates_per_sec, "samples_per_sec": updates_per_sec * batch_size}
+
+
+def time_updates(brain, updates=200, warmup=20):
+    """
+    Measure the gradient steps per second of a Brain on random batches.
+
+    Args:
+        brain (Brain): The brain, its batch size and shapes set the batches.
+        updates (int): Number of timed gradient steps.
+        warmup (int): Number of untimed gradient steps run first, to build and compile the model.
+
+    Returns:
+        float: The updates per second.
+    """
+    rng = np.random.default_rng(0)
+    x = rng.random((brain.batch_size, brain.NbrStates), dtype=np.float32)
+    y = rng.random((brain.batch_size, brain.NbrActions), dtype=np.float32)
+    for _ in range(warmup):
+        brain.train(x, y)
+
+    start = time.perf_counter()
+    for _ in range(updates):
+        brain.train(x, y)
+    return updates / (time.perf_counter() - start)
+
+
+def benchmark_profiles(names, **kwargs):
+    """
+    Benchmark several CPU training profiles, each in a fresh process.
+
+    TensorFlow threads can only be configured once per process, so every
+    profile runs in its own spawned process.
+
+    Args:
+        names (list): Names of the profiles in Profiles.CPU_PROFILES.
+        **kwargs: Extra keyword arguments passed to benchmark_profile.
+
+    Returns:
+        list: The result of every profile, from the fastest to the slowest.
+    """
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    for name in names:
+        with ctx.Pool(1) as pool:
+            results.append(pool.apply(benchmark_profile, (name,), kwargs))
+    return sorted(results, key=lambda r: -r["updates_per_sec"])
+
+
+def benchmark_architecture(name, episodes=100, max_steps=5000, updates=200, seed=0, last=10):
+    """
+    Measure the training cost and the learning of a Q-network architecture.
+
+    Args:
+        name (str): Name of the architecture in Profiles.ARCHITECTURES.
+        episodes (int): Number of headless training episodes.
+        max_steps (int): Maximum number of simulation steps per episode.
+        updates (int): Number of timed gradient steps on random batches.
+        seed (int): Seed of the weights and of the exploration.
+        last (int): Number of last episodes the final completion is averaged over.
+
+    Returns:
+        dict: The architecture, its number of parameters, its updates per second and
+            its final and best lap completion.
+    """
+    import keras
+    from Brain import ARCHITECTURES, Brain
+    from Sweep import train_trial
+    from selfDrivingCarRL import BATCH_SIZE, LR
+
+    options = ARCHITECTURES[name]
+    brain = Brain(7, 7, LR, BATCH_SIZE, **options)
+    updates_per_sec = time_updates(brain, updates)
+
+    keras.utils.set_random_seed(seed)
+    trial = train_trial(0, {"brain_options": options}, episodes=episodes, max_steps=max_steps)
+    return {"architecture": name, "params": brain.model.count_params(), "updates_per_sec": updates_per_sec,
+            "completion": float(np.mean(trial["completions"][-last:])), "best": trial["best"]}
+
+
+def benchmark_architectures(names, **kwargs):
+    """
+    Benchmark several Q-network architectures, each in a fresh process.
+
+    Args:
+        names (list): Names of the architectures in Profiles.ARCHITECTURES.
+        **kwargs: Extra keyword arguments passed to benchmark_architecture.
+
+    Returns:
+        list: The result of every architecture, from the fastest to the slowest.
+    """
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    for name in names:
+        with ctx.Pool(1) as pool:
+            results.append(pool.apply(benchmark_architecture, (name,), kwargs))
+    return sorted(results, key=lambda r: -r["updates_per_sec"])
+
+
+def benchmark_policy(policy, states, batch_sizes=(1, 256, 4096), repeats=20000):
+    """
+    Measure the inference throughput of a policy.
+
+    Args:
+        policy (Policy): The policy, see Policy.load_policy.
+        states (numpy.ndarray): States the batches are taken from, one row per state.
+        batch_sizes (tuple): Timed batch sizes, 1 as in a rollout and larger as in a server.
+        repeats (int): Number of states timed per batch size, at least 20 batches.
+
+    Returns:
+        dict: The states per second of every batch size.
+    """
+    states = np.asarray(states, dtype=np.float32)
+    result = {}
+    for batch_size in batch_sizes:
+        batch = np.resize(states, (batch_size, states.shape[1]))
+        n = max(20, repeats // batch_size)
+        # Untimed call, to allocate the buffers of this batch size
+        policy.predict(batch)
+        start = time.perf_counter()
+        for _ in range(n):
+            policy.predict(batch)
+        result[batch_size] = n * batch_size / (time.perf_counter() - start)
+    return result
+
+
+def format_policy_table(results):
+    """
+    Format policy benchmark results as a plain text table.
+
+    Args:
+        results (dict): Results of benchmark_policy by policy name.
+
+    Returns:
+        str: The formatted table, in states per second.
+    """
+    batch_sizes = list(next(iter(results.values())))
+    width = max([len("policy")] + [len(name) for name in results])
+    lines = [f"{'policy':<{width}}" + "".join(f"  {f'batch {b} (states/s)':>22}" for b in batch_sizes)]
+    for name, result in results.items():
+        lines.append(f"{name:<{width}}" + "".join(f"  {result[b]:>22.0f}" for b in batch_sizes))
+    return "\n".join(lines)
+
+
+def benchmark_raytrace(map_file, poses=100, seed=0, scalar=True):
+    """
+    Measure the ray casting cost on a track at random poses along it.
+
+    Args:
+        map_file (str): File name of the track, see TrackGenerator for large tracks.
+        poses (int): Number of timed poses, each near a random checkpoint with a random heading.
+        seed (int): Seed of the poses.
+        scalar (bool): Whether to also time the scalar reference implementation.
+
+    Returns:
+        dict: The track, its number of walls and the microseconds per call of every method.
+    """
+    import os
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    from Environment import Environment
+
+    game = Environment(headless=True, map_file=map_file)
+    car = game.car
+    rng = np.random.default_rng(seed)
+    index = rng.integers(len(game.checkpoints), size=poses)
+    positions = [game.checkpoints[i].position for i in index]
+    angles = rng.integers(360, size=poses)
+
+    methods = {"raytrace_cameras": car.raytrace_cameras, "check_collision": car.check_collision}
+    if scalar:
+        methods["raytrace_cameras_scalar"] = car.raytrace_cameras_scalar
+    result = {"map": map_file, "walls": len(game.walls)}
+    for name, method in methods.items():
+        elapsed = 0.0
+        for (x, y), angle in zip(positions, angles):
+            car.x, car.y, car.angle = x, y, int(angle)
+            start = time.perf_counter()
+            method()
+            elapsed += time.perf_counter() - start
+        result[name] = elapsed / poses * 1e6
+    return result
+
+
+def format_table(results):
+    """
+    Format benchmark results as a plain text table.
+
+    Args:
+        results (list): Results returned by benchmark_profiles.
+
+    Returns:
+        str: The formatted table.
+    """
+    lines = ["profile       batch size  learning rate  updates/sec  samples/sec"]
+    for r in results:
+        lines.append(f"{r['profile']:<12}  {r['batch_size']:>10}  {r['alpha']:>13.5f}"
+                     f"  {r['updates_per_sec']:>11.1f}  {r['samples_per_sec']:>11.0f}")
+    return "\n".join(lines)
+
+
+def format_architecture_table(results):
+    """
+    Format architecture benchmark results as a plain text table.
+
+    Args:
+        results (list): Results returned by benchmark_architectures.
+
+    Returns:
+        str: The formatted table.
+    """
+    width = max([len("architecture")] + [len(r["architecture"]) for r in results])
+    lines = [f"{'architecture':<{width}}  parameters  updates/sec  completion   best"]
+    for r in results:
+        lines.append(f"{r['architecture']:<{width}}  {r['params']:>10}  {r['updates_per_sec']:>11.1f}"
+                     f"  {r['completion']:>10.3f}  {r['best']:>5.3f}")
+    return "\n".join(lines)
+
+
+def format_raytrace_table(results):
+    """
+    Format ray casting benchmark results as a plain text table.
+
+    Args:
+        results (list): Results returned by benchmark_raytrace.
+
+    Returns:
+        str: The formatted table, in microseconds per call.
+    """
+    width = max([len("map")] + [len(r["map"]) for r in results])
+    lines = [f"{'map':<{width}}   walls  raytrace (us)  check_collision (us)  scalar (us)"]
+    for r in results:
+        lines.append(f"{r['map']:<{width}}  {r['walls']:>6}  {r['raytrace_cameras']:>13.1f}"
+                     f"  {r['check_collision']:>20.1f}  {r.get('raytrace_cameras_scalar', float('nan')):>11.1f}")
+    return "\n".join(lines)
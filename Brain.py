@@ -1,11 +1,114 @@
-from keras.layers import Dense, Activation
+from keras.layers import Dense, Activation, Layer, LayerNormalization
 from keras.models import Sequential
 from keras.optimizers import Adam
+import keras
+import math
+import os
+import numpy as np
 import tensorflow as tf
+from Profiles import ARCHITECTURES, CPU_PROFILES  # noqa: F401, re-exported from Brain
+
+
+@keras.saving.register_keras_serializable(package="selfDrivingCarRL")
+class DuelingHead(Layer):
+    """
+    Dueling Q head: Q(s, a) = V(s) + A(s, a) - mean over a of A(s, a).
+
+    Saved models with this layer load once this module is imported.
+    """
+
+    def __init__(self, n_actions, **kwargs):
+        """
+        Initialize the head.
+
+        Args:
+            n_actions (int): Number of actions.
+        """
+        super().__init__(**kwargs)
+        self.n_actions = n_actions
+        self.value = Dense(1, dtype=self.dtype_policy)
+        self.advantage = Dense(n_actions, dtype=self.dtype_policy)
+
+    def build(self, input_shape):
+        self.value.build(input_shape)
+        self.advantage.build(input_shape)
+
+    def call(self, inputs):
+        advantage = self.advantage(inputs)
+        return self.value(inputs) + advantage - keras.ops.mean(advantage, axis=1, keepdims=True)
+
+    def compute_output_shape(self, input_shape):
+        return tuple(input_shape[:-1]) + (self.n_actions,)
+
+    def get_config(self):
+        config = super().get_config()
+        config["n_actions"] = self.n_actions
+        return config
+
+
+def configure_threads(intra_op, inter_op):
+    """
+    Set the number of threads TensorFlow uses in this process.
+
+    Must be called before any model is built or any operation is run.
+
+    Args:
+        intra_op (int): Threads used to parallelize a single operation.
+        inter_op (int): Threads used to run independent operations in parallel.
+    """
+    tf.config.threading.set_intra_op_parallelism_threads(intra_op)
+    tf.config.threading.set_inter_op_parallelism_threads(inter_op)
+
+
+def scale_learning_rate(alpha, batch_size, base_batch_size, rule=None):
+    """
+    Scale a learning rate tuned for one batch size to another batch size.
+
+    Args:
+        alpha (float): Learning rate tuned for base_batch_size.
+        batch_size (int): New batch size.
+        base_batch_size (int): Batch size alpha was tuned for.
+        rule (str): "linear", "sqrt" or None to keep alpha.
+
+    Returns:
+        float: The scaled learning rate.
+    """
+    if rule == "linear":
+        return alpha * batch_size / base_batch_size
+    if rule == "sqrt":
+        return alpha * math.sqrt(batch_size / base_batch_size)
+    return alpha
+
+
+def apply_profile(name, alpha, batch_size):
+    """
+    Apply a CPU training profile to this process and to the agent settings.
+
+    Configures the TensorFlow threads, so it must be called before any model is built.
+
+    Args:
+        name (str): Name of the profile in CPU_PROFILES.
+        alpha (float): Learning rate of the agent.
+        batch_size (int): Batch size of the agent.
+
+    Returns:
+        tuple: The learning rate, batch size and Brain options to create the agent with.
+    """
+    profile = CPU_PROFILES[name]
+    if "intra_op" in profile:
+        intra_op = profile["intra_op"] or os.cpu_count() or 1
+        configure_threads(intra_op, profile.get("inter_op", 1))
+
+    new_batch_size = profile.get("batch_size") or batch_size
+    alpha = scale_learning_rate(alpha, new_batch_size, batch_size, profile.get("lr_scaling"))
+    brain_options = {"jit_compile": profile.get("jit_compile", False),
+                     "mixed_precision": profile.get("mixed_precision", False)}
+    return alpha, new_batch_size, brain_options
 
 
 class Brain:
-    def __init__(self, NbrStates, NbrActions, alpha, batch_size=256):
+    def __init__(self, NbrStates, NbrActions, alpha, batch_size=256, jit_compile=False, mixed_precision=False,
+                 hidden=(256,), head="softmax", layer_norm=False):
         """
         Initialize the Brain.
 
@@ -14,12 +117,27 @@ class Brain:
             NbrActions (int): Number of actions.
             alpha (float): Learning rate.
             batch_size (int): Batch size for training the model.
+            jit_compile (bool): Whether to compile the training step with XLA.
+            mixed_precision (bool): Whether to compute the hidden layers in bfloat16,
+                the variables and the output layer stay in float32.
+            hidden (tuple): Number of units of every hidden layer.
+            head (str): Output layer, "softmax" (the original network), "linear" Q-values
+                or "dueling" value and advantage streams. See ARCHITECTURES.
+            layer_norm (bool): Whether to normalize every hidden layer before its activation.
         """
         self.NbrStates = NbrStates
         self.NbrActions = NbrActions
         self.alpha = alpha
         self.batch_size = batch_size
+        self.jit_compile = jit_compile
+        self.mixed_precision = mixed_precision
+        self.hidden = tuple(hidden)
+        self.head = head
+        self.layer_norm = layer_norm
         self.model = self.createModel()
+        # Compiled weight synchronization, keyed by the models it was built for
+        self._sync = None
+        self._sync_models = None
 
     def createModel(self):
         """
@@ -28,13 +146,26 @@ class Brain:
         Returns:
             model (Sequential): The created sequential model.
         """
-        # Create a simple neural network with 256 hidden units and softmax output
+        # Create a neural network of relu hidden layers, by default 256 units and a softmax output
+        hidden_dtype = "mixed_bfloat16" if self.mixed_precision else None
         model = Sequential()
-        model.add(Dense(256, activation=tf.nn.relu))  # prev 256
-        model.add(Dense(self.NbrActions, activation="softmax"))
+        for units in self.hidden:
+            if self.layer_norm:
+                model.add(Dense(units, dtype=hidden_dtype))
+                model.add(LayerNormalization(dtype=hidden_dtype))
+                model.add(Activation(tf.nn.relu, dtype=hidden_dtype))
+            else:
+                model.add(Dense(units, activation=tf.nn.relu, dtype=hidden_dtype))
+        # Keep the output in float32 so the Q-values and the loss are not rounded
+        if self.head == "dueling":
+            model.add(DuelingHead(self.NbrActions, dtype="float32"))
+        elif self.head in ("softmax", "linear"):
+            model.add(Dense(self.NbrActions, activation=self.head, dtype="float32"))
+        else:
+            raise ValueError(f"Unknown head {self.head}, expected softmax, linear or dueling")
         # Use Adam optimizer with the learning rate set to alpha
         optimizer = Adam(learning_rate=self.alpha)  # Use alpha as the learning rate
-        model.compile(loss="mse", optimizer=optimizer)
+        model.compile(loss="mse", optimizer=optimizer, jit_compile=self.jit_compile)
 
         return model
 
@@ -48,6 +179,9 @@ class Brain:
             epoch (int): Number of epochs to train.
             verbose (int): Verbosity mode.
         """
+        if len(x) <= self.batch_size:
+            # A single batch skips the per-call setup of fit
+            return self.model.train_on_batch(x, y)
         self.model.fit(x, y, batch_size=self.batch_size, verbose=verbose)
 
     def predict(self, s):
@@ -60,7 +194,8 @@ class Brain:
         Returns:
             numpy.ndarray: Predicted output.
         """
-        return self.model.predict(s)
+        # predict_on_batch skips the per-call dataset and progress bar setup of predict
+        return np.asarray(self.model.predict_on_batch(s))
 
     def predictOne(self, s):
         """
@@ -72,16 +207,38 @@ class Brain:
         Returns:
             numpy.ndarray: Predicted output.
         """
-        return self.model.predict(tf.reshape(s, [1, self.NbrStates])).flatten()
+        return np.asarray(self.model.predict_on_batch(tf.reshape(s, [1, self.NbrStates]))).flatten()
 
-    def copy_weights(self, TrainNet):
+    def copy_weights(self, TrainNet, tau=None):
         """
         Copy the weights from another Brain object.
 
+        The copy runs as one compiled TensorFlow function, so the weights never
+        leave the device. With tau, the weights are Polyak averaged instead:
+        w = tau * w_TrainNet + (1 - tau) * w.
+
         Args:
             TrainNet (Brain): The Brain object to copy the weights from.
+            tau (float): Weight of TrainNet in the soft update, None for a hard copy.
         """
-        variables1 = self.model.trainable_variables
-        variables2 = TrainNet.model.trainable_variables
-        for v1, v2 in zip(variables1, variables2):
-            v1.assign(v2.numpy())
+        # Rebuilt when a model is replaced (load_model) or built after the last call
+        models = (self.model, TrainNet.model, len(self.model.trainable_variables))
+        if models != self._sync_models:
+            variables1 = self.model.trainable_variables
+            variables2 = TrainNet.model.trainable_variables
+
+            @tf.function
+            def sync(tau, soft):
+                for v1, v2 in zip(variables1, variables2):
+                    if soft:
+                        v1.assign(tau * v2 + (1 - tau) * v1)
+                    else:
+                        v1.assign(v2)
+
+            self._sync = sync
+            self._sync_models = models
+
+        if tau is None:
+            self._sync(tf.constant(1.0), False)
+        else:
+            self._sync(tf.constant(float(tau)), True)
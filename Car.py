@@ -1,27 +1,46 @@
 import math
 import pygame
-from DataLoader import DataLoader
+from DataLoader import DataLoader, DEFAULT_MAP
+from Sensors import SensorSpec
 import numpy as np
-from shapely.geometry import LineString
 
 # If the car detect distance to the wall is less than 7 percent
 # then it is considered as collision
 COLLISION_THRESHOLD = 0.07
 
+# With a distance field the car collides when a point of its outline
+# is closer to a wall than this many pixels
+FIELD_COLLISION_MARGIN = 3
+
+# Two segments are treated as parallel when the sine of the angle between
+# them is below this, instead of testing the float denominator for exact zero
+PARALLEL_EPSILON = 1e-9
+
+# The angle of the car is always a whole number of degrees, so the sine and
+# cosine of every heading are looked up instead of computed at every step
+SIN = [math.sin(math.radians(angle)) for angle in range(360)]
+COS = [math.cos(math.radians(angle)) for angle in range(360)]
+
 class Car:
 
-    def __init__(self, screen):
+    def __init__(self, screen, sensors=None, map_file=DEFAULT_MAP):
         """
         Initialize the Car object.
 
         Args:
             screen (pygame.Surface): The screen surface to draw the car on.
+            sensors (SensorSpec): The sensors of the car, the original 7 cameras by default.
+            map_file (str): File name of the track the car drives on.
         """
         # Initialize the screen surface
         self.screen = screen
 
         # Load the walls from the data loader
-        self.walls = DataLoader().get_walls()
+        loader = DataLoader(map_file)
+        self.walls = loader.get_walls()
+        self.wall_array = loader.get_wall_array()
+        self.wall_segments = loader.get_wall_segments()
+        self.wall_geometry = loader.get_wall_geometry()
 
         # Set the initial position of the car to the first wall
         self.x = self.walls[0][0] + 30
@@ -34,7 +53,8 @@ class Car:
         self.angle = 180
 
         # Set the camera angles of the car
-        self.camera_angles = [-90, -60, -30, 0, 30, 60, 90]
+        self.sensors = sensors if sensors is not None else SensorSpec()
+        self.camera_angles = self.sensors.camera_angles()
 
         # Define the actions with format (speed, angle_change)
         self.actions = [
@@ -50,12 +70,29 @@ class Car:
         # Initialize the camera distances list
         self.camera_distances = []
 
+        # Speed of the last move, part of the state when the sensors include the velocity
+        self.speed = 0
+        self.MAX_SPEED = max(speed for speed, _ in self.actions)
+
         # Set the maximum distance for the camera
-        self.MAX_CAMERA_DISTANCE = 60
+        self.MAX_CAMERA_DISTANCE = self.sensors.max_distance
+
+        # Precompute the camera directions for every heading
+        self.camera_ends, self.camera_table = self.build_camera_table()
 
         # Initialize the next checkpoint counter
         self.next_checkpoint = 1
 
+        # Optional signed distance field of the track (see DistanceField)
+        self.distance_field = None
+
+        # Whether the state includes the clearance from the distance field
+        self.clearance_observation = False
+
+        # Outline points of the car relative to its center, used with the distance field
+        half_w, half_h = self.size[0] / 2, self.size[1] / 2
+        self.outline = [(dx * half_w, dy * half_h) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx or dy]
+
         # Load the car image
         self.image = pygame.image.load("img/car3.png")
 
@@ -63,22 +100,28 @@ class Car:
         self.image = pygame.transform.scale(self.image, self.size)
 
     # reset the Car initial position
-    def reset(self):
+    def reset(self, dx=0, dy=0, d_angle=0):
         """
         Reset the car to its initial position and reset the next checkpoint counter.
 
         This function resets the car's position to the first wall in the list of walls.
         It also sets the angle of the car to 180 degrees and resets the next checkpoint counter to 1.
+
+        Args:
+            dx (int): Offset added to the initial x position.
+            dy (int): Offset added to the initial y position.
+            d_angle (int): Offset in degrees added to the initial angle.
         """
         # Reset the car's position to the first wall
-        self.x = self.walls[0][0] + 30
-        self.y = self.walls[0][1]
+        self.x = self.walls[0][0] + 30 + dx
+        self.y = self.walls[0][1] + dy
 
         # Reset the next checkpoint counter
         self.next_checkpoint = 1
 
         # Set the angle of the car to 180 degrees
-        self.angle = 180
+        self.angle = 180 + d_angle
+        self.speed = 0
 
     def get_state(self):
         """
@@ -89,7 +132,26 @@ class Car:
         """
         # Get the state of the car
         # The state is a list of distances from each camera to the walls or the end point of the camera
-        return self.camera_distances
+        state = self.camera_distances
+        if self.clearance_observation:
+            state = state + [self.get_clearance()]
+        if self.sensors.velocity:
+            state = state + [self.speed / self.MAX_SPEED]
+        if self.sensors.heading:
+            # Scaled from [-1, 1] to [0, 1] like the other values of the state
+            heading = self.angle % 360
+            state = state + [(SIN[heading] + 1) / 2, (COS[heading] + 1) / 2]
+        return state
+
+    def get_clearance(self):
+        """
+        Get the distance from the center of the car to the nearest wall from the distance field.
+
+        Returns:
+            float: The distance as a percentage of the maximum camera distance, 0 outside of the track.
+        """
+        d = float(self.distance_field.distance(*self.get_centre())) / self.MAX_CAMERA_DISTANCE
+        return min(max(round(d, 2), 0), 1)
 
     def move(self, action):
         """
@@ -103,14 +165,16 @@ class Car:
         """
         # Get the speed and angle change for the selected action
         speed, angle_change = self.actions[action]
+        self.speed = speed
 
         # Store the current position
         old_position = (self.x, self.y)
 
         # Update the position of the car
         self.angle += angle_change
-        self.x -= speed * math.sin(math.radians(self.angle))
-        self.y -= speed * math.cos(math.radians(self.angle))
+        heading = self.angle % 360
+        self.x -= speed * SIN[heading]
+        self.y -= speed * COS[heading]
 
         # Calculate and return the distance travelled by the car
         return self.distance_between_points(old_position, (self.x, self.y))
@@ -179,6 +243,63 @@ class Car:
         # If no collision is found, return False
         return False
 
+    def check_collision(self):
+        """
+        Check for a collision without computing the full camera distances.
+
+        Only the first part of every camera, up to the collision threshold, is
+        tested against the walls, and the test stops at the first hit. This matches
+        is_collision(raytrace_cameras()) at a fraction of the cost, except that it also
+        catches a near wall when a camera crosses a farther wall listed before it.
+
+        Returns:
+            bool: True if there is a collision, False otherwise.
+        """
+        # A rounded distance is below the threshold when the raw distance is
+        # below the threshold minus half of the rounding step
+        probe = COLLISION_THRESHOLD - 0.005
+        cx, cy = self.get_centre()
+        for (xs, ys), (xe, ye) in self.get_cameras():
+            # The distances are relative to the maximum distance of raytrace_cameras, which
+            # differs slightly from the camera length as the start is clipped to whole pixels
+            max_distance = self.MAX_CAMERA_DISTANCE - math.hypot(xs - cx, ys - cy)
+            scale = probe * max_distance / math.hypot(xe - xs, ye - ys)
+            ray = self.make_segment((xs, ys), (xs + (xe - xs) * scale, ys + (ye - ys) * scale))
+            for wall in self.wall_segments:
+                if self.wall_intersection(wall, ray):
+                    return True
+        return False
+
+    def field_collision(self):
+        """
+        Check for a collision with a constant number of distance field lookups.
+
+        The outline of the car (corners and edge midpoints, rotated to its angle)
+        collides when a point is outside of the track or closer to a wall than
+        FIELD_COLLISION_MARGIN. Unlike the cameras, this also sees walls between them.
+
+        Returns:
+            bool: True if there is a collision, False otherwise.
+        """
+        return self.outline_clearance() < FIELD_COLLISION_MARGIN
+
+    def outline_clearance(self):
+        """
+        Get the smallest signed distance field value of the outline of the car.
+
+        Returns:
+            float: The distance, negative if a point of the outline is outside of the track.
+        """
+        cx, cy = self.get_centre()
+        heading = self.angle % 360
+        cos, sin = COS[heading], SIN[heading]
+        clearance = float("inf")
+        for dx, dy in self.outline:
+            x = cx + cos * dx + sin * dy
+            y = cy - sin * dx + cos * dy
+            clearance = min(clearance, self.distance_field.distance(x, y))
+        return float(clearance)
+
     def rotate_point(self, origin, point, angle):
         """
         Rotate a point counterclockwise by a given angle around a given origin.
@@ -209,6 +330,28 @@ class Car:
         # Rotate the start and end coordinates around the origin
         return self.rotate_point(origin, start, rad), self.rotate_point(origin, end, rad)
 
+    def build_camera_table(self):
+        """
+        Precompute the camera directions of the car.
+
+        Returns:
+            tuple: The (x, y) offset of the end of each camera from the center of the car
+                before it is rotated by the heading of the car, and for every integer
+                heading the list of rotated (x, y) end offsets.
+        """
+        ends = []
+        for angle in self.camera_angles:
+            # Rotate the line pointing forward from the center by the camera angle,
+            # which is not necessarily a whole number of degrees
+            rad = math.radians(angle)
+            ends.append((-self.MAX_CAMERA_DISTANCE * math.sin(rad), -self.MAX_CAMERA_DISTANCE * math.cos(rad)))
+
+        table = []
+        for heading in range(360):
+            cos, sin = COS[heading], SIN[heading]
+            table.append([(cos * ux + sin * uy, -sin * ux + cos * uy) for ux, uy in ends])
+        return ends, table
+
     def get_cameras(self):
         """
         Get the cameras for the car.
@@ -217,23 +360,23 @@ class Car:
             tuple: Tuple containing the start and end coordinates of each camera.
         """
         # Get the center of the car
-        c = self.get_centre()
+        cx, cy = self.get_centre()
 
-        # Iterate over each camera angle
-        for angle in self.camera_angles:
-            # Get the camera end coordinates
-            # Rotate the line around the center of the car
-            _, (xe, ye) = self.rotate_line_around(c, (c[0], c[1] - self.MAX_CAMERA_DISTANCE), self.get_centre(), angle)
+        # Get the car rectangle
+        rect = pygame.Rect(self.x, self.y, self.size[0], self.size[1])
 
-            # Get the car rectangle
-            rect = pygame.Rect(self.x, self.y, self.size[0], self.size[1])
+        heading = self.angle % 360
+        cos, sin = COS[heading], SIN[heading]
 
+        # Iterate over each camera
+        for (ux, uy), (ex, ey) in zip(self.camera_ends, self.camera_table[heading]):
             # Get the camera start coordinates
-            # Clip the line with the car rectangle
-            _, (xs, ys) = rect.clipline(c, (xe, ye))
+            # Clip the camera, before it is rotated by the heading, with the car rectangle
+            _, (xs, ys) = rect.clipline((cx, cy), (cx + ux, cy + uy))
 
-            # Yield the camera start and end coordinates
-            yield self.rotate_line_around((xs, ys), (xe, ye), self.get_centre(), self.angle)
+            # Rotate the start around the center of the car, the end is precomputed
+            dx, dy = xs - cx, ys - cy
+            yield (cx + cos * dx + sin * dy, cy - sin * dx + cos * dy), (cx + ex, cy + ey)
 
     def line_intersection(self, p1, p2, p3, p4):
         """
@@ -257,8 +400,9 @@ class Car:
         # Calculate the denominator of the line equations
         denom = (y4 - y3) * (x2 - x1) - (x4 - x3) * (y2 - y1)
 
-        # If the denominator is zero, the lines are parallel
-        if denom == 0:
+        # If the denominator is zero up to rounding errors, the lines are parallel.
+        # The tolerance scales with the (L1) lengths of both segments
+        if abs(denom) <= PARALLEL_EPSILON * (abs(x2 - x1) + abs(y2 - y1)) * (abs(x4 - x3) + abs(y4 - y3)):
             return None
 
         # Calculate the numerators of the line equations
@@ -275,6 +419,57 @@ class Car:
 
         return x, y
 
+    @staticmethod
+    def make_segment(p1, p2):
+        """
+        Precompute the geometry of a line segment for wall_intersection.
+
+        Args:
+            p1 (tuple): Coordinates of the first point of the segment.
+            p2 (tuple): Coordinates of the second point of the segment.
+
+        Returns:
+            tuple: (x1, y1, dx, dy, length, xmin, ymin, xmax, ymax), the layout of DataLoader.get_wall_segments.
+        """
+        x1, y1 = p1
+        x2, y2 = p2
+        return (x1, y1, x2 - x1, y2 - y1, math.hypot(x2 - x1, y2 - y1),
+                min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2))
+
+    def wall_intersection(self, wall, ray):
+        """
+        Calculate the intersection point of a wall and a ray from their precomputed geometry.
+
+        This is line_intersection with the wall as the first segment, but the
+        direction vectors are not recomputed and segments whose bounding boxes
+        do not overlap are rejected before the full solve.
+
+        Args:
+            wall (tuple): Geometry of the wall from DataLoader.get_wall_segments.
+            ray (tuple): Geometry of the ray from make_segment.
+
+        Returns:
+            tuple or None: The coordinates of the intersection point, or None if the segments are parallel or do not intersect.
+        """
+        x1, y1, wdx, wdy, wlen, wxmin, wymin, wxmax, wymax = wall
+        xs, ys, rdx, rdy, rlen, rxmin, rymin, rxmax, rymax = ray
+
+        # Cheap reject: segments with disjoint bounding boxes cannot intersect
+        if wxmax < rxmin or rxmax < wxmin or wymax < rymin or rymax < wymin:
+            return None
+
+        # Same equations as line_intersection
+        denom = rdy * wdx - rdx * wdy
+        if abs(denom) <= PARALLEL_EPSILON * wlen * rlen:
+            return None
+
+        ua = (rdx * (y1 - ys) - rdy * (x1 - xs)) / denom
+        ub = (wdx * (y1 - ys) - wdy * (x1 - xs)) / denom
+        if ua < 0 or ua > 1 or ub < 0 or ub > 1:
+            return None
+
+        return x1 + ua * wdx, y1 + ua * wdy
+
     def raytrace(self, start, end, camera_s, camera_e):
         """
         Calculate the intersection point between a line segment and a ray.
@@ -318,9 +513,67 @@ class Car:
         """
         Compute the distances from each camera to the walls or the end point of the camera.
 
+        All cameras are intersected with all walls at once with numpy, so the cost
+        barely grows with the number of cameras. As in raytrace_cameras_scalar, each
+        camera stops at the first wall in list order it crosses, and the distances
+        are computed as a percentage of the maximum distance.
+
+        Returns:
+            list: List of distances from each camera to the walls or the end point of the camera.
+        """
+        cameras = np.array([camera_s + camera_e for camera_s, camera_e in self.get_cameras()])
+        sx, sy, ex, ey = cameras[:, 0:1], cameras[:, 1:2], cameras[:, 2:3], cameras[:, 3:4]
+
+        # Cheap reject: only the walls whose bounding box overlaps the bounding box
+        # of all cameras can be hit. The walls keep their list order
+        xmin, ymin = cameras[:, 0::2].min(), cameras[:, 1::2].min()
+        xmax, ymax = cameras[:, 0::2].max(), cameras[:, 1::2].max()
+        geometry = self.wall_geometry
+        bbox = geometry["bbox"]
+        near = (bbox[:, 2] >= xmin) & (bbox[:, 0] <= xmax) & (bbox[:, 3] >= ymin) & (bbox[:, 1] <= ymax)
+        x1, y1 = self.wall_array[near, 0], self.wall_array[near, 1]
+        wdx, wdy = geometry["direction"][near].T
+        rdx, rdy = ex - sx, ey - sy
+
+        # Same equations as line_intersection with the wall as the first segment,
+        # one row per camera and one column per wall
+        denom = rdy * wdx - rdx * wdy
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ua = (rdx * (y1 - sy) - rdy * (x1 - sx)) / denom
+            ub = (wdx * (y1 - sy) - wdy * (x1 - sx)) / denom
+        parallel = np.abs(denom) <= PARALLEL_EPSILON * geometry["length"][near] * np.hypot(rdx, rdy)
+        hits = ~parallel & (ua >= 0) & (ua <= 1) & (ub >= 0) & (ub <= 1)
+
+        # End of each camera, or the first wall it crosses
+        hx, hy = ex[:, 0], ey[:, 0]
+        if near.any():
+            rows = np.arange(len(cameras))
+            first = np.argmax(hits, axis=1)
+            hit = hits[rows, first]
+            ua = ua[rows, first]
+            hx = np.where(hit, x1[first] + ua * wdx[first], hx)
+            hy = np.where(hit, y1[first] + ua * wdy[first], hy)
+
+        # Distance from the camera start to the wall or the end of the camera
+        cx, cy = self.get_centre()
+        max_distance = self.MAX_CAMERA_DISTANCE - np.sqrt((sx[:, 0] - cx) ** 2 + (sy[:, 0] - cy) ** 2)
+        d = np.sqrt((hx - sx[:, 0]) ** 2 + (hy - sy[:, 0]) ** 2) / max_distance
+
+        # Round with the builtin round to match the scalar path exactly
+        output = [min(round(v, 2), 1) for v in d.tolist()]
+        # Store the distances in the Car object
+        self.camera_distances = output
+        # Return the distances
+        return output
+
+    def raytrace_cameras_scalar(self):
+        """
+        Compute the distances from each camera to the walls or the end point of the camera.
+
         This function iterates over each camera, computes the distances to the walls,
         and returns a list of distances. The distances are computed as a percentage of
-        the maximum distance.
+        the maximum distance. It is the reference implementation of raytrace_cameras,
+        kept for debugging.
 
         Returns:
             list: List of distances from each camera to the walls or the end point of the camera.
@@ -332,11 +585,11 @@ class Car:
             flag = False
             # Compute the maximum distance to the camera
             max_distance = self.MAX_CAMERA_DISTANCE - self.distance_between_points(self.get_centre(), camera_s)
+            ray = self.make_segment(camera_s, camera_e)
             # Iterate over each wall
-            for x1, y1, x2, y2 in self.walls:
-                start, end = (x1, y1), (x2, y2)
+            for wall in self.wall_segments:
                 # Compute the distance to the wall
-                rt = self.raytrace(start, end, camera_s, camera_e)
+                rt = self.wall_intersection(wall, ray)
                 if rt:
                     # Compute the distance as a percentage of the maximum distance
                     d = self.distance_between_points(camera_s, rt) / max_distance
@@ -390,11 +643,11 @@ class Car:
             flag = False
             # Compute the maximum distance to the camera
             max_distance = self.MAX_CAMERA_DISTANCE - self.distance_between_points(self.get_centre(), camera_s)
+            ray = self.make_segment(camera_s, camera_e)
             # Iterate over each wall
-            for x1, y1, x2, y2 in self.walls:
-                start, end = (x1, y1), (x2, y2)
+            for wall in self.wall_segments:
                 # Compute the distance to the wall
-                rt = self.raytrace(start, end, camera_s, camera_e)
+                rt = self.wall_intersection(wall, ray)
                 if rt:
                     # Compute the distance as a percentage of the maximum distance
                     d = int((self.distance_between_points(camera_s, rt) / max_distance) * 100)
@@ -433,6 +686,8 @@ class Car:
             Returns:
                 list: List of detection points.
             """
+            from shapely.geometry import LineString
+
             line = LineString(([camera_s, camera_e]))
             # Compute the distances between the starting and ending points
             distances = np.linspace(0, line.length, n)
@@ -448,10 +703,10 @@ class Car:
             for camera_s, camera_e in self.get_cameras():
                 flag = False
                 max_distance = self.MAX_CAMERA_DISTANCE - self.distance_between_points(self.get_centre(), camera_s)
+                ray = self.make_segment(camera_s, camera_e)
                 # Iterate over each wall
-                for x1, y1, x2, y2 in self.walls:
-                    start, end = (x1, y1), (x2, y2)
-                    rt = self.raytrace(start, end, camera_s, camera_e)
+                for wall in self.wall_segments:
+                    rt = self.wall_intersection(wall, ray)
                     if rt:
                         # Compute the detection points and distances
                         camera_points.append(getPoints(camera_s, rt))
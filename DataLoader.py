@@ -1,21 +1,66 @@
 
+import inspect
+import numpy as np
+
+# Track loaded when no map file is given
+DEFAULT_MAP = "maps/path1.txt"
+
+
 class SingletonMeta(type):
     _instances = {}
 
     def __call__(cls, *args, **kwargs):
-        if cls not in cls._instances:
+        # One instance per class and constructor arguments, with the defaults
+        # filled in so that DataLoader() and DataLoader(DEFAULT_MAP) are the same
+        bound = inspect.signature(cls.__init__).bind(None, *args, **kwargs)
+        bound.apply_defaults()
+        key = (cls,) + tuple(bound.arguments.values())[1:]
+        if key not in cls._instances:
             instance = super().__call__(*args, **kwargs)
-            cls._instances[cls] = instance
-        return cls._instances[cls]
+            cls._instances[key] = instance
+        return cls._instances[key]
 
 
 class DataLoader(metaclass=SingletonMeta):
-    def __init__(self):
-        self.walls = self.load_walls("maps/path1.txt")
+    def __init__(self, map_file=DEFAULT_MAP):
+        self.map_file = map_file
+        self.walls = self.load_walls(self.map_file)
+        self.wall_array = np.array(self.walls, dtype=np.float64).reshape(-1, 4)
+        self.wall_geometry = self.build_wall_geometry(self.wall_array)
+        # Bounding box (xmin, ymin, xmax, ymax) of the whole track
+        self.bounds = tuple(np.concatenate([self.wall_geometry["bbox"][:, :2].min(axis=0),
+                                            self.wall_geometry["bbox"][:, 2:].max(axis=0)]).tolist())
+        # Per-wall (x1, y1, dx, dy, length, xmin, ymin, xmax, ymax) tuples for the scalar paths
+        self.wall_segments = [tuple(row) for row in np.column_stack(
+            [self.wall_array[:, :2], self.wall_geometry["direction"], self.wall_geometry["length"],
+             self.wall_geometry["bbox"]]).tolist()]
+
+    def get_bounds(self):
+        return self.bounds
 
     def get_walls(self):
         return self.walls
 
+    def get_wall_array(self):
+        return self.wall_array
+
+    def get_wall_geometry(self):
+        return self.wall_geometry
+
+    def get_wall_segments(self):
+        return self.wall_segments
+
+    @staticmethod
+    def build_wall_geometry(wall_array):
+        # Geometry of every wall that does not change while the car drives,
+        # computed once instead of in every intersection test
+        direction = wall_array[:, 2:] - wall_array[:, :2]
+        length = np.hypot(direction[:, 0], direction[:, 1])
+        normal = np.stack([-direction[:, 1], direction[:, 0]], axis=1) / np.maximum(length, 1e-12)[:, None]
+        bbox = np.concatenate([np.minimum(wall_array[:, :2], wall_array[:, 2:]),
+                               np.maximum(wall_array[:, :2], wall_array[:, 2:])], axis=1)
+        return {"direction": direction, "normal": normal, "length": length, "bbox": bbox}
+
     @staticmethod
     def load_walls(filename):
         walls = []
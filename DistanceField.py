@@ -0,0 +1,134 @@
+import hashlib
+import os
+import tempfile
+import numpy as np
+
+
+class DistanceField:
+    """
+    Signed distance field of the track, rasterized on a regular grid.
+
+    Every cell stores the distance from its centre to the nearest wall, positive
+    on the track and negative outside of it, clamped to max_distance. Built once
+    per map from the wall segments and cached on disk next to the map file.
+    """
+
+    def __init__(self, field, resolution=1):
+        """
+        Initialize the DistanceField.
+
+        Args:
+            field (numpy.ndarray): Signed distances of shape (rows, columns).
+            resolution (float): Size of a grid cell in pixels.
+        """
+        self.field = field
+        self.resolution = resolution
+        self.rows, self.columns = field.shape
+
+    @classmethod
+    def build(cls, walls, width, height, resolution=1, max_distance=60):
+        """
+        Rasterize the signed distance field of a track.
+
+        Args:
+            walls (list): Wall segments as (x1, y1, x2, y2) tuples.
+            width (int): Width of the track in pixels.
+            height (int): Height of the track in pixels.
+            resolution (float): Size of a grid cell in pixels.
+            max_distance (float): Distance the field is clamped to.
+
+        Returns:
+            DistanceField: The built distance field.
+        """
+        columns = int(np.ceil(width / resolution))
+        rows = int(np.ceil(height / resolution))
+        xs = (np.arange(columns) + 0.5) * resolution
+        ys = (np.arange(rows) + 0.5) * resolution
+
+        distance = np.full((rows, columns), float(max_distance), dtype=np.float32)
+        crossings = np.zeros((rows, columns + 1), dtype=np.int32)
+
+        for x1, y1, x2, y2 in walls:
+            # Unsigned distance, only updated in the window the wall can reach
+            c0 = max(int((min(x1, x2) - max_distance) / resolution), 0)
+            c1 = min(int((max(x1, x2) + max_distance) / resolution) + 1, columns)
+            r0 = max(int((min(y1, y2) - max_distance) / resolution), 0)
+            r1 = min(int((max(y1, y2) + max_distance) / resolution) + 1, rows)
+            if c0 < c1 and r0 < r1:
+                px = xs[np.newaxis, c0:c1] - x1
+                py = ys[r0:r1, np.newaxis] - y1
+                dx, dy = x2 - x1, y2 - y1
+                length_sq = dx * dx + dy * dy
+                t = np.clip((px * dx + py * dy) / length_sq, 0, 1) if length_sq > 0 else 0
+                window = np.hypot(px - t * dx, py - t * dy)
+                np.minimum(distance[r0:r1, c0:c1], window, out=distance[r0:r1, c0:c1])
+
+            # Even-odd rule: count the walls crossed by a ray going right from every cell
+            if y1 != y2:
+                crossed = np.nonzero((ys >= min(y1, y2)) & (ys < max(y1, y2)))[0]
+                x_cross = x1 + (ys[crossed] - y1) * (x2 - x1) / (y2 - y1)
+                first_left = np.clip(np.ceil(x_cross / resolution - 0.5), 0, columns).astype(int)
+                np.add.at(crossings, (crossed, first_left), 1)
+
+        # Number of crossings to the right of every cell
+        right = np.cumsum(crossings[:, ::-1], axis=1)[:, ::-1][:, 1:]
+        on_track = right % 2 == 1
+        return cls(np.where(on_track, distance, -distance), resolution)
+
+    @classmethod
+    def load_or_build(cls, walls, map_file, width, height, resolution=1, max_distance=60):
+        """
+        Load the distance field of a map from its cache, building it if needed.
+
+        The cache is stored next to the map file and rebuilt whenever the walls
+        or the rasterization parameters change.
+
+        Args:
+            walls (list): Wall segments as (x1, y1, x2, y2) tuples.
+            map_file (str): File name of the map the walls were loaded from.
+            width (int): Width of the track in pixels.
+            height (int): Height of the track in pixels.
+            resolution (float): Size of a grid cell in pixels.
+            max_distance (float): Distance the field is clamped to.
+
+        Returns:
+            DistanceField: The loaded or built distance field.
+        """
+        key = hashlib.sha1(np.asarray(walls, dtype=np.float64).tobytes())
+        key.update(repr((width, height, resolution, max_distance)).encode())
+        key = key.hexdigest()
+        cache_file = os.path.splitext(map_file)[0] + ".sdf.npz"
+
+        if os.path.exists(cache_file):
+            with np.load(cache_file) as cache:
+                if str(cache["key"]) == key:
+                    return cls(cache["field"], float(cache["resolution"]))
+
+        distance_field = cls.build(walls, width, height, resolution, max_distance)
+        # Written to a temporary file and renamed, so concurrent workers never load a partial cache
+        fd, temp_file = tempfile.mkstemp(suffix=".npz", dir=os.path.dirname(cache_file) or ".")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez_compressed(f, key=key, field=distance_field.field, resolution=resolution)
+            os.replace(temp_file, cache_file)
+        except BaseException:
+            os.remove(temp_file)
+            raise
+        return distance_field
+
+    def distance(self, x, y):
+        """
+        Look up the signed distance to the nearest wall.
+
+        Args:
+            x (float): The x coordinate.
+            y (float): The y coordinate.
+
+        Returns:
+            float: The signed distance, negative outside of the track or the grid.
+        """
+        row = int(y // self.resolution)
+        column = int(x // self.resolution)
+        if 0 <= row < self.rows and 0 <= column < self.columns:
+            return self.field[row, column]
+        return -1.0
@@ -1,38 +1,108 @@
+import os
 import pygame
 from Car import Car
-from DataLoader import DataLoader
+from DataLoader import DataLoader, DEFAULT_MAP
 from Checkpoint import Checkpoint
+from DistanceField import DistanceField
 import math
+import time
 
 WIDTH = 1000
 HEIGHT = 700
 
 class Environment:
 
-    def __init__(self, debugging=False):
+    def __init__(self, debugging=False, headless=False, position_noise=0, angle_noise=0, action_repeat=1,
+                 collision="rays", clearance_observation=False, sensors=None, recorder=None, laps=1,
+                 map_file=DEFAULT_MAP):
         """
         Initialize the environment.
 
         Args:
             debugging (bool): Whether to enable debugging mode.
+            headless (bool): Whether to run without opening a window. The environment
+                draws onto an off-screen surface and render should not be called.
+            position_noise (int): Maximum random offset in pixels of the start position
+                when the environment is reset with a random generator.
+            angle_noise (int): Maximum random offset in degrees of the start angle
+                when the environment is reset with a random generator.
+            action_repeat (int): Number of simulation sub-steps every action is applied for.
+            collision (str): How collisions are detected, "rays" from the camera distances
+                or "field" from the precomputed distance field of the track.
+            clearance_observation (bool): Whether the state includes the distance from the
+                car to the nearest wall, looked up in the distance field.
+            sensors (SensorSpec): The sensors of the car, the original 7 cameras by default.
+            recorder (TrajectoryRecorder): Optional recorder every step is streamed to.
+            laps (int): Number of laps per episode, or None to keep driving until a collision.
+                With one lap the episode ends at the last checkpoint, with more the
+                checkpoints wrap around and every lap ends at the start checkpoint.
+            map_file (str): File name of the track, see TrackGenerator for generated tracks.
+                The background image is the .png file next to it, or img/path1.png for
+                the default track. Without an image the walls are drawn on grass.
         """
-        pygame.init()
-        pygame.display.set_caption("Self driving car")
-        self.screen = pygame.display.set_mode((WIDTH, HEIGHT))
-        self.background_img = pygame.image.load("img/path1.png")
+        self.headless = headless
+        if headless:
+            self.screen = pygame.Surface((WIDTH, HEIGHT))
+        else:
+            pygame.init()
+            pygame.display.set_caption("Self driving car")
+            self.screen = pygame.display.set_mode((WIDTH, HEIGHT))
+        self.map_file = map_file
+        self.background_img = None if headless else self.load_background(map_file)
         self.debugging = debugging
-        self.walls = DataLoader().get_walls()
+        self.walls = DataLoader(map_file).get_walls()
         self.checkpoints = self.get_checkpoints()
         self.calculate_checkpoint_percentages()
         self.clock = pygame.time.Clock()
-        self.car = Car(self.screen)
+        self.car = Car(self.screen, sensors, map_file)
+        self.collision = collision
+        if collision == "field" or clearance_observation:
+            # Generated tracks can be larger than the window
+            _, _, xmax, ymax = DataLoader(map_file).get_bounds()
+            self.car.distance_field = DistanceField.load_or_build(
+                self.walls, map_file, max(WIDTH, int(xmax) + 1), max(HEIGHT, int(ymax) + 1))
+        self.car.clearance_observation = clearance_observation
+        self.recorder = recorder
         self.distance = 0
+        self.steps = 0
+        self.last_reward = 0
+        self.action_repeat = action_repeat
+        self.laps = laps
+        self.lap = 0
+        # Steps and seconds of every completed lap, kept across episodes
+        self.lap_times = []
+        self.lap_durations = []
+        self.lap_start_step = 0
+        self.lap_start_time = time.perf_counter()
         self.steering_angle = 0
         self.steering_wheel = pygame.image.load("img/wheel.png")
         # Resize the car image to the specified size
         self.steering_wheel = pygame.transform.scale(self.steering_wheel, (50, 50))
+        self.position_noise = position_noise
+        self.angle_noise = angle_noise
         self.reset()
 
+    def load_background(self, map_file):
+        """
+        Load the background image of a track.
+
+        Args:
+            map_file (str): File name of the track.
+
+        Returns:
+            pygame.Surface: The background image.
+        """
+        image_file = "img/path1.png" if map_file == DEFAULT_MAP else os.path.splitext(map_file)[0] + ".png"
+        if os.path.exists(image_file):
+            return pygame.image.load(image_file)
+
+        # No image: draw the walls on a plain grass background
+        background = pygame.Surface((WIDTH, HEIGHT))
+        background.fill((111, 139, 80))
+        for x1, y1, x2, y2 in DataLoader(map_file).get_walls():
+            pygame.draw.line(background, (255, 255, 255), (x1, y1), (x2, y2), 2)
+        return background
+
     def draw_walls(self):
         """
         Draw the walls on the screen.
@@ -100,15 +170,27 @@ class Environment:
         Returns:
             int: The index of the captured checkpoint.
         """
-        # Already all checkpoints captured
-        if cur_checkpoint_index >= len(self.checkpoints):
+        # Already all checkpoints captured, the single lap ends at the last checkpoint
+        if cur_checkpoint_index >= len(self.checkpoints) and self.laps == 1:
+            if self.lap == 0:
+                self.complete_lap()
             return 0
 
+        # In multi-lap mode the start checkpoint is the one after the last
+        checkpoint = self.checkpoints[cur_checkpoint_index % len(self.checkpoints)]
+
         # Calculate distance to next checkpoint
-        check_point_distance = self.vector2_distance((car.x, car.y), self.checkpoints[cur_checkpoint_index].position)
+        check_point_distance = self.vector2_distance((car.x, car.y), checkpoint.position)
 
         # Check if checkpoint can be captured
-        if check_point_distance <= self.checkpoints[cur_checkpoint_index].capture_radius + 10:
+        if check_point_distance <= checkpoint.capture_radius + 10:
+            if cur_checkpoint_index >= len(self.checkpoints):
+                self.complete_lap()
+                # The lap restarts behind the start checkpoint
+                self.car.next_checkpoint = 1
+                if self.laps is not None and self.lap >= self.laps:
+                    return 0
+                return self.get_captured_checkpoint(car, 1)
             self.car.checkpoint_captured()
             return self.get_captured_checkpoint(car, cur_checkpoint_index + 1)  # Recursively check next checkpoint
         else:
@@ -118,6 +200,33 @@ class Environment:
             # Return checkpoint index instead of completion percentage
             return cur_checkpoint_index
 
+    def complete_lap(self):
+        """
+        Count a completed lap and record its time in steps and seconds.
+        """
+        now = time.perf_counter()
+        self.lap += 1
+        self.lap_times.append(self.steps - self.lap_start_step)
+        self.lap_durations.append(now - self.lap_start_time)
+        self.lap_start_step = self.steps
+        self.lap_start_time = now
+
+    def lap_statistics(self):
+        """
+        Summarize the completed laps of every episode so far.
+
+        Returns:
+            dict: The number of laps, the best, last and mean steps per lap, and the
+                laps per hour of wall clock time. Empty if no lap was completed.
+        """
+        if not self.lap_times:
+            return {}
+        return {"laps": len(self.lap_times),
+                "best_steps": min(self.lap_times),
+                "last_steps": self.lap_times[-1],
+                "steps_per_lap": sum(self.lap_times) / len(self.lap_times),
+                "laps_per_hour": 3600 * len(self.lap_durations) / sum(self.lap_durations)}
+
     def get_completion_percentage(self, checkpoint):
         """
         Calculate the completion percentage of the track.
@@ -144,37 +253,75 @@ class Environment:
 
     def step(self, action):
         """
-        Take a step in the environment.
+        Take a step in the environment and record it if a recorder is set.
 
         Args:
             action (int): The action to take.
 
         Returns:
-            tuple: The reward and game over flag.
+            tuple: The reward summed over the sub-steps and game over flag.
         """
-        reward = 0
-
-        # move car
-        m = self.car.move(action)
-        self.distance += m
+        reward, game_over = self.simulate(action)
+        if self.recorder is not None:
+            self.recorder.record(self.car, action, reward, game_over, self.car.get_state())
+        return reward, game_over
 
-        # game end
-        game_over = False
+    def simulate(self, action):
+        """
+        Simulate one step in the environment.
 
-        # check for collision
-        rc = self.car.raytrace_cameras()
-        if self.car.is_collision(rc):
-            pen = -1
-            game_over = True
-            return pen, game_over
+        The action is applied for action_repeat sub-steps. Collisions and checkpoints
+        are checked at every sub-step, but the full sensor computation only runs at
+        the last one, or when the episode ends early.
 
-        checkpoint_captured = self.get_captured_checkpoint(self.car, self.car.next_checkpoint)
-        reward += checkpoint_captured - 1
+        Args:
+            action (int): The action to take.
 
-        if checkpoint_captured == 0:
-            game_over = True
+        Returns:
+            tuple: The reward summed over the sub-steps and game over flag.
+        """
+        reward = 0
 
-        return reward, game_over
+        for i in range(self.action_repeat):
+            last_sub_step = i == self.action_repeat - 1
+
+            # move car
+            m = self.car.move(action)
+            self.distance += m
+            self.steps += 1
+
+            # check for collision
+            if self.collision == "field":
+                if last_sub_step:
+                    self.car.raytrace_cameras()
+                collision = self.car.field_collision()
+            elif last_sub_step:
+                rc = self.car.raytrace_cameras()
+                collision = self.car.is_collision(rc)
+            else:
+                collision = self.car.check_collision()
+            if collision:
+                if not last_sub_step:
+                    # refresh the sensors so the terminal state matches the final pose
+                    self.car.raytrace_cameras()
+                self.last_reward = -1
+                return reward + self.last_reward, True
+
+            checkpoint_captured = self.get_captured_checkpoint(self.car, self.car.next_checkpoint)
+            self.last_reward = checkpoint_captured - 1
+            if self.laps != 1:
+                # The progress keeps growing over the laps, so the reward stays monotone. A single
+                # lap keeps the original reward, -1 on the step capturing the last checkpoint
+                self.last_reward += self.lap * len(self.checkpoints)
+            reward += self.last_reward
+
+            # game end
+            if self.is_finished():
+                if not last_sub_step:
+                    self.car.raytrace_cameras()
+                return reward, True
+
+        return reward, False
 
     def render(self, action, reward, epsilon):
         """
@@ -244,11 +391,71 @@ class Environment:
         pygame.display.update()
         self.clock.tick()
 
-    def reset(self):
+    @property
+    def observation_size(self):
+        """
+        Get the size of the state returned by the car.
+
+        Returns:
+            int: The number of values in the state.
+        """
+        return self.car.sensors.size + int(self.car.clearance_observation)
+
+    def observe(self):
+        """
+        Compute the camera distances for the current position of the car.
+
+        Returns:
+            list: The state of the car.
+        """
+        self.car.raytrace_cameras()
+        return self.car.get_state()
+
+    def get_completion(self):
+        """
+        Get the fraction of the track completed up to the last captured checkpoint.
+
+        Returns:
+            float: The completed fraction of the track, between 0 and 1, plus the
+                number of completed laps in multi-lap mode.
+        """
+        # A single lap is counted at the last checkpoint, without restarting the checkpoints
+        if self.car.next_checkpoint >= len(self.checkpoints) and self.lap > 0:
+            return float(self.lap)
+        last_captured = min(self.car.next_checkpoint, len(self.checkpoints)) - 1
+        return self.lap + self.checkpoints[last_captured].accumulated_reward
+
+    def is_finished(self):
+        """
+        Check whether the car has driven every lap of the episode.
+
+        Returns:
+            bool: True if the laps are completed. Always False without a lap limit,
+                so a collision after any number of laps still ends in a collision.
+        """
+        return self.laps is not None and self.lap >= self.laps
+
+    def reset(self, rng=None):
         """
         Reset the environment.
+
+        Args:
+            rng (numpy.random.Generator): Optional random generator used to perturb
+                the start position and angle by up to position_noise and angle_noise.
         """
         self.distance = 0
+        self.steps = 0
+        self.last_reward = 0
+        self.lap = 0
+        self.lap_start_step = 0
+        self.lap_start_time = time.perf_counter()
         self.steering_angle = 0
-        self.car.reset()
+        if self.recorder is not None:
+            self.recorder.end_episode()
+        if rng is None:
+            self.car.reset()
+        else:
+            dx, dy = rng.integers(-self.position_noise, self.position_noise, size=2, endpoint=True)
+            d_angle = rng.integers(-self.angle_noise, self.angle_noise, endpoint=True)
+            self.car.reset(int(dx), int(dy), int(d_angle))
 
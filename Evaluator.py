@@ -0,0 +1,236 @@
+import itertools
+import multiprocessing
+import numpy as np
+
+# Environment and models created by the current worker process.
+# They are kept for the lifetime of the worker so that every episode
+# after the first one only pays for the rollout itself.
+_games = {}
+_models = {}
+_normalizers = {}
+
+
+def _init_worker(threads):
+    """
+    Initialize an evaluation worker process.
+
+    Args:
+        threads (int): Number of TensorFlow threads used by the worker.
+    """
+    from Brain import configure_threads
+
+    configure_threads(threads, threads)
+
+
+def _get_model(fname):
+    """
+    Load a saved model once per worker process.
+
+    Args:
+        fname (str): File name of the saved Keras model, or of a policy exported
+            to .npz or .tflite, see Policy.load_policy.
+
+    Returns:
+        Policy: The loaded policy.
+    """
+    if fname not in _models:
+        from Policy import load_policy
+        _models[fname] = load_policy(fname, backend=None)
+    return _models[fname]
+
+
+def _get_normalizer(fname):
+    """
+    Load the normalizer saved next to a model once per worker process.
+
+    Args:
+        fname (str): File name of the saved model.
+
+    Returns:
+        Normalizer: The normalizer, or None if the model was trained without one.
+    """
+    if fname not in _normalizers:
+        import os
+        from Normalizer import Normalizer, normalizer_file
+
+        norm_file = normalizer_file(fname)
+        _normalizers[fname] = Normalizer.load(norm_file) if os.path.exists(norm_file) else None
+    return _normalizers[fname]
+
+
+def _get_game(collision, sensors, position_noise, angle_noise, action_repeat, laps=1, map_file=None):
+    """
+    Create the headless environment once per worker process, collision mode and sensors.
+
+    Args:
+        collision (str): How collisions are detected, "rays" or "field".
+        sensors (SensorSpec): The sensors of the car, the original 7 cameras if None.
+        position_noise (int): Maximum random offset in pixels of the start position.
+        angle_noise (int): Maximum random offset in degrees of the start angle.
+        action_repeat (int): Number of simulation sub-steps every action is applied for.
+        laps (int): Number of laps per episode, or None to drive until a collision.
+        map_file (str): File name of the track, the original track if None.
+
+    Returns:
+        Environment: The headless environment.
+    """
+    key = (collision, repr(sensors), map_file)
+    if key not in _games:
+        from Environment import Environment
+        from DataLoader import DEFAULT_MAP
+        _games[key] = Environment(headless=True, collision=collision, sensors=sensors,
+                                  map_file=map_file or DEFAULT_MAP)
+    game = _games[key]
+    game.position_noise = position_noise
+    game.angle_noise = angle_noise
+    game.action_repeat = action_repeat
+    game.laps = laps
+    return game
+
+
+def rollout(fname, seed, max_steps=5000, epsilon=0.0, position_noise=5, angle_noise=5, action_repeat=1,
+            collision="rays", sensors=None, laps=1, map_file=None, record_states=False):
+    """
+    Roll out one seeded episode of a saved model without rendering.
+
+    The seed drives the perturbation of the start pose and the exploration
+    draws, so the same (model, seed) pair always replays the same episode.
+
+    Args:
+        fname (str): File name of the saved model.
+        seed (int): Seed of the episode.
+        max_steps (int): Maximum number of simulation steps before the episode is cut off.
+        epsilon (float): Probability of taking a random action.
+        position_noise (int): Maximum random offset in pixels of the start position.
+        angle_noise (int): Maximum random offset in degrees of the start angle.
+        action_repeat (int): Number of simulation sub-steps every action is applied for.
+        collision (str): How collisions are detected, "rays" or "field".
+        sensors (SensorSpec): The sensors of the car, they must match the inputs of the model.
+        laps (int): Number of laps per episode, or None to drive until a collision or max_steps.
+        map_file (str): File name of the track, the original track if None.
+        record_states (bool): Whether to return the raw (stacked) states the model acted on.
+
+    Returns:
+        dict: The model, seed, completion, collision and finish flags, step count and lap times,
+            and the states if record_states is set.
+    """
+    game = _get_game(collision, sensors, position_noise, angle_noise, action_repeat, laps, map_file)
+    policy = _get_model(fname)
+    normalizer = _get_normalizer(fname)
+    states = []
+    rng = np.random.default_rng(seed)
+    n_actions = len(game.car.actions)
+
+    frames = None
+    if normalizer is not None and normalizer.n_frames > 1:
+        from Normalizer import FrameStack
+        frames = FrameStack(normalizer.n_frames)
+
+    game.reset(rng)
+    state = np.array(game.observe())
+    if frames is not None:
+        state = frames.reset(state)
+    done = False
+    while not done and game.steps < max_steps:
+        if rng.random() < epsilon:
+            action = int(rng.integers(n_actions))
+        else:
+            if record_states:
+                states.append(state)
+            inputs = state[np.newaxis, :] if normalizer is None else normalizer.normalize(state[np.newaxis, :])
+            action = policy.get_action(inputs)
+        _, done = game.step(action)
+        state = np.array(game.car.get_state())
+        if frames is not None:
+            state = frames.push(state)
+
+    finished = game.is_finished()
+    result = {
+        "model": fname,
+        "seed": seed,
+        "completion": game.get_completion(),
+        "collision": done and not finished,
+        "finished": finished,
+        "steps": game.steps,
+        "lap_steps": game.lap_times[len(game.lap_times) - game.lap:],
+    }
+    if record_states:
+        result["states"] = np.array(states, dtype=np.float32)
+    return result
+
+
+def _rollout(task):
+    """Unpack a task tuple for Pool.imap_unordered."""
+    fname, seed, kwargs = task
+    return rollout(fname, seed, **kwargs)
+
+
+def aggregate(results):
+    """
+    Aggregate episode results per model.
+
+    Args:
+        results (list): Episode results returned by rollout.
+
+    Returns:
+        list: One summary dict per model, sorted from best to worst completion.
+    """
+    summaries = []
+    results = sorted(results, key=lambda r: r["model"])
+    for fname, episodes in itertools.groupby(results, key=lambda r: r["model"]):
+        episodes = list(episodes)
+        finish_steps = [e["steps"] for e in episodes if e["finished"]]
+        lap_steps = [steps for e in episodes for steps in e["lap_steps"]]
+        summaries.append({
+            "model": fname,
+            "episodes": len(episodes),
+            "completion": float(np.mean([e["completion"] for e in episodes])),
+            "collision_rate": float(np.mean([e["collision"] for e in episodes])),
+            "finish_rate": float(np.mean([e["finished"] for e in episodes])),
+            "steps_to_finish": float(np.mean(finish_steps)) if finish_steps else float("nan"),
+            "laps": len(lap_steps),
+            "steps_per_lap": float(np.mean(lap_steps)) if lap_steps else float("nan"),
+        })
+    return sorted(summaries, key=lambda s: (-s["completion"], s["steps_to_finish"]))
+
+
+def format_table(summaries):
+    """
+    Format model summaries as a plain text table.
+
+    Args:
+        summaries (list): Summaries returned by aggregate.
+
+    Returns:
+        str: The formatted table.
+    """
+    width = max([len("model")] + [len(s["model"]) for s in summaries])
+    lines = [f"{'model':<{width}}  episodes  completion  collisions  finished  steps to finish"
+             f"  laps  steps/lap"]
+    for s in summaries:
+        lines.append(f"{s['model']:<{width}}  {s['episodes']:>8}  {s['completion'] * 100:>9.1f}%"
+                     f"  {s['collision_rate'] * 100:>9.1f}%  {s['finish_rate'] * 100:>7.1f}%"
+                     f"  {s['steps_to_finish']:>15.1f}  {s['laps']:>4}  {s['steps_per_lap']:>9.1f}")
+    return "\n".join(lines)
+
+
+def evaluate(model_files, seeds, workers=None, threads=1, **kwargs):
+    """
+    Evaluate several saved models over many seeded episodes across a process pool.
+
+    Args:
+        model_files (list): File names of the saved models.
+        seeds (iterable): Seeds of the episodes played by every model.
+        workers (int): Number of worker processes, defaults to the number of CPUs.
+        threads (int): Number of TensorFlow threads per worker.
+        **kwargs: Extra keyword arguments passed to rollout.
+
+    Returns:
+        list: One summary dict per model, sorted from best to worst.
+    """
+    tasks = [(fname, seed, kwargs) for fname in model_files for seed in seeds]
+    # TensorFlow is not fork-safe, so workers are always spawned
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(workers, initializer=_init_worker, initargs=(threads,)) as pool:
+        results = list(pool.imap_unordered(_rollout, tasks))
+    return aggregate(results)
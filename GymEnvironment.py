@@ -0,0 +1,115 @@
+import functools
+import gymnasium as gym
+import numpy as np
+from gymnasium import spaces
+from Environment import Environment
+
+
+class SelfDrivingCarEnv(gym.Env):
+    """Gymnasium interface to the self driving car Environment."""
+
+    metadata = {"render_modes": ["human"], "render_fps": 60}
+
+    def __init__(self, max_episode_steps=5000, render_mode=None, **kwargs):
+        """
+        Initialize the environment.
+
+        Args:
+            max_episode_steps (int): Number of simulation steps after which the episode is truncated.
+            render_mode (str): "human" to draw the game in a pygame window, None to run headless.
+            **kwargs: Extra keyword arguments passed to Environment, such as
+                action_repeat, collision, position_noise or angle_noise.
+        """
+        self.max_episode_steps = max_episode_steps
+        self.render_mode = render_mode
+        self.game = Environment(headless=render_mode != "human", **kwargs)
+
+        # Every value of the state is a distance as a percentage of the camera length
+        self.observation_space = spaces.Box(low=0.0, high=1.0, shape=(self.game.observation_size,), dtype=np.float32)
+        self.action_space = spaces.Discrete(len(self.game.car.actions))
+
+        self.last_action = 0
+        self.last_reward = 0
+
+    def _get_info(self):
+        """
+        Get the auxiliary information about the episode.
+
+        Returns:
+            dict: The completion, finish flag and simulation step count.
+        """
+        return {"completion": self.game.get_completion(),
+                "finished": self.game.is_finished(),
+                "steps": self.game.steps}
+
+    def reset(self, *, seed=None, options=None):
+        """
+        Reset the environment.
+
+        The start pose is perturbed by the seeded generator of the environment
+        when position_noise or angle_noise is set.
+
+        Args:
+            seed (int): Seed of the random generator.
+            options (dict): Unused.
+
+        Returns:
+            tuple: The first observation and the info dict.
+        """
+        super().reset(seed=seed)
+        self.game.reset(self.np_random)
+        self.last_action = 0
+        self.last_reward = 0
+
+        observation = np.array(self.game.observe(), dtype=np.float32)
+        if self.render_mode == "human":
+            self.render()
+        return observation, self._get_info()
+
+    def step(self, action):
+        """
+        Take a step in the environment.
+
+        Args:
+            action (int): The action to take.
+
+        Returns:
+            tuple: The observation, reward, terminated and truncated flags and the info dict.
+        """
+        reward, terminated = self.game.step(int(action))
+        truncated = not terminated and self.game.steps >= self.max_episode_steps
+        self.last_action = int(action)
+        self.last_reward = reward
+
+        observation = np.array(self.game.car.get_state(), dtype=np.float32)
+        if self.render_mode == "human":
+            self.render()
+        return observation, float(reward), terminated, truncated, self._get_info()
+
+    def render(self):
+        """
+        Draw the game in the pygame window.
+        """
+        if self.render_mode == "human":
+            self.game.render(self.last_action, self.last_reward, 0)
+
+
+gym.register(id="SelfDrivingCar-v0", entry_point="GymEnvironment:SelfDrivingCarEnv")
+
+
+def make_vector_env(num_envs, asynchronous=True, **kwargs):
+    """
+    Create a vector of headless environments for parallel samplers.
+
+    Args:
+        num_envs (int): Number of environments.
+        asynchronous (bool): Whether to step every environment in its own process.
+        **kwargs: Extra keyword arguments passed to SelfDrivingCarEnv.
+
+    Returns:
+        gymnasium.vector.VectorEnv: The vector environment.
+    """
+    env_fns = [functools.partial(SelfDrivingCarEnv, **kwargs) for _ in range(num_envs)]
+    if asynchronous:
+        return gym.vector.AsyncVectorEnv(env_fns, context="spawn")
+    return gym.vector.SyncVectorEnv(env_fns)
@@ -1,21 +1,41 @@
-import matplotlib
-import matplotlib.pyplot as plt
-from IPython.display import clear_output, display
+# matplotlib and IPython are imported on the first call to plot,
+# so importing this module does not pull them in
+plt = None
 
-plt.ion()
+# The figure and its artists are created once and updated in place,
+# so plotting every game does not accumulate matplotlib objects
+_figure = None
+
+
+def plot(scores, mean_scores, first_game=1):
+    global plt, _figure
+    if plt is None:
+        import matplotlib.pyplot as plt
+        plt.ion()
+    from IPython.display import clear_output, display
+
+    if _figure is None:
+        fig, ax = plt.subplots()
+        ax.set_title("Training...")
+        ax.set_xlabel('Number of Games')
+        ax.set_ylabel('Score')
+        scores_line, = ax.plot([], [], label='Scores')
+        mean_line, = ax.plot([], [], label='Mean Scores')
+        ax.legend()
+        _figure = (fig, ax, scores_line, mean_line, ax.text(0, 0, ""), ax.text(0, 0, ""))
+    fig, ax, scores_line, mean_line, scores_text, mean_text = _figure
 
-def plot(scores, mean_scores):
     clear_output(wait=True)
-    plt.clf()
-    plt.title("Training...")
-    plt.xlabel('Number of Games')
-    plt.ylabel('Score')
-    plt.plot(scores, label='Scores')
-    plt.plot(mean_scores, label='Mean Scores')
-    plt.ylim(ymin=0)
-    plt.legend()
-    plt.text(len(scores)-1, scores[-1], str(scores[-1]))
-    plt.text(len(mean_scores)-1, mean_scores[-1], str(mean_scores[-1]))
-    fig = plt.gcf()
+    # scores may be a rolling window, first_game is the number of its first game
+    games = range(first_game, first_game + len(scores))
+    scores_line.set_data(games, list(scores))
+    mean_line.set_data(games, list(mean_scores))
+    scores_text.set_position((games[-1], scores[-1]))
+    scores_text.set_text(str(scores[-1]))
+    mean_text.set_position((games[-1], mean_scores[-1]))
+    mean_text.set_text(str(mean_scores[-1]))
+    ax.relim()
+    ax.autoscale_view()
+    ax.set_ylim(ymin=0)
     display(fig)
     plt.pause(0.001)  # Add a brief pause to update the figure
\ No newline at end of file
@@ -0,0 +1,382 @@
+import os
+import queue
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+import numpy as np
+
+# Environment variable holding the shared secret of a deployment, as hex
+AUTHKEY_ENV = "SELF_DRIVING_CAR_AUTHKEY"
+
+# File the secret is generated in when the variable is not set, readable by the user only
+AUTHKEY_FILE = os.path.join(os.path.expanduser("~"), ".selfDrivingCarRL", "authkey")
+
+# Hosts the server may listen on without allow_remote
+LOOPBACK_HOSTS = ("localhost", "127.0.0.1", "::1")
+
+
+def get_authkey():
+    """
+    Get the shared secret of the server and its clients.
+
+    The connections unpickle what authenticated peers send, so the secret must not be
+    public. It is read from the SELF_DRIVING_CAR_AUTHKEY variable, or from AUTHKEY_FILE,
+    which is created with a random secret on first use.
+
+    Returns:
+        bytes: The secret.
+    """
+    if os.environ.get(AUTHKEY_ENV):
+        return bytes.fromhex(os.environ[AUTHKEY_ENV])
+    try:
+        with open(AUTHKEY_FILE, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        pass
+    os.makedirs(os.path.dirname(AUTHKEY_FILE), mode=0o700, exist_ok=True)
+    authkey = os.urandom(32)
+    try:
+        # Exclusive creation, so concurrent first uses all end up with the same secret
+        fd = os.open(AUTHKEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        with open(AUTHKEY_FILE, "rb") as f:
+            return f.read()
+    with os.fdopen(fd, "wb") as f:
+        f.write(authkey)
+    return authkey
+
+
+def parse_address(address):
+    """
+    Parse a server address.
+
+    Args:
+        address (str): "host:port" for TCP, anything else is a Unix socket path.
+
+    Returns:
+        tuple or str: The address in the format of multiprocessing.connection.
+    """
+    host, _, port = address.rpartition(":")
+    if host and port.isdigit():
+        return host, int(port)
+    return address
+
+
+class InferenceServer:
+    """
+    Hosts one policy for many environment workers.
+
+    Every client connection has a reader thread that puts its requests on a
+    queue. A single batching thread takes the requests that arrive within the
+    latency budget, runs them through the policy in one forward pass and sends
+    every client its rows back. Between batches the model file is watched and
+    reloaded when a new checkpoint is written.
+
+    Clients send raw states. A model trained with a normalizer has it saved
+    next to it, see Normalizer.normalizer_file, and the server normalizes the
+    batches with it before the forward pass, as Evaluator does.
+    """
+
+    def __init__(self, model_file, address=("localhost", 6000), backend="numpy", max_batch=256,
+                 max_latency=0.002, reload_interval=1.0, allow_remote=False):
+        """
+        Initialize the server and load the policy.
+
+        Args:
+            model_file (str): A saved Keras model, or a .npz policy for the numpy backend. Its
+                normalizer is loaded and reloaded with it.
+            address (tuple or str): (host, port) or Unix socket path to listen on.
+            backend (str): "numpy" to serve an exported NumPy policy, "keras" to serve the model itself.
+            max_batch (int): Maximum number of states per forward pass.
+            max_latency (float): Seconds a request waits for other requests to batch with.
+            reload_interval (float): Seconds between two checks of the model file, 0 to never reload.
+            allow_remote (bool): Whether to listen on a host other than the loopback interface.
+                Remote clients need the secret of get_authkey, passed in SELF_DRIVING_CAR_AUTHKEY.
+
+        Raises:
+            ValueError: If the address is not local and allow_remote is not set.
+        """
+        from Policy import load_policy
+
+        if isinstance(address, tuple) and address[0] not in LOOPBACK_HOSTS and not allow_remote:
+            raise ValueError(f"Refusing to listen on {address[0]}, use a loopback host, "
+                             "a Unix socket or allow_remote")
+
+        self.load_policy = load_policy
+        self.model_file = model_file
+        self.backend = backend
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.reload_interval = reload_interval
+        self.policy, self.normalizer = self._load()
+        self.model_mtime = self._mtimes()
+        self.last_reload_check = time.monotonic()
+
+        self.requests = queue.Queue()
+        self.listener = Listener(address, authkey=get_authkey())
+        self.address = self.listener.address
+        self.stopped = threading.Event()
+        # Number of connected clients, a batch never waits for more requests than clients
+        self.clients = 0
+        self.clients_lock = threading.Lock()
+
+        # Statistics of the served batches
+        self.batches = 0
+        self.states = 0
+        self.reloads = 0
+
+    def serve_forever(self):
+        """
+        Accept clients and serve their requests until close is called.
+        """
+        threading.Thread(target=self._accept, daemon=True).start()
+        self._batch()
+
+    def start(self):
+        """
+        Serve in background threads.
+        """
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def close(self):
+        """
+        Stop serving and close the listener.
+        """
+        self.stopped.set()
+        self.listener.close()
+
+    def _accept(self):
+        """
+        Accept client connections, each with its own reader thread.
+        """
+        while not self.stopped.is_set():
+            try:
+                conn = self.listener.accept()
+            except (OSError, EOFError):
+                # Closed listener, or a client that failed to authenticate
+                continue
+            threading.Thread(target=self._read, args=(conn,), daemon=True).start()
+
+    def _read(self, conn):
+        """
+        Queue the requests of one client until it disconnects.
+
+        Args:
+            conn (multiprocessing.connection.Connection): The client connection.
+        """
+        with self.clients_lock:
+            self.clients += 1
+        try:
+            while True:
+                kind, states = conn.recv()
+                if kind == "info":
+                    # Clients wait for every answer, so the batching thread is not sending to them now
+                    conn.send({"input_dims": self.policy.input_dims, "n_actions": self.policy.n_actions})
+                    continue
+                states = np.asarray(states, dtype=np.float32)
+                input_dims = self.policy.input_dims
+                if states.ndim != 2 or states.shape[1] != input_dims:
+                    # Only this client gets the error, a bad batch would fail the whole forward pass
+                    conn.send(ValueError(f"Expected states of shape (n, {input_dims}), got {states.shape}"))
+                    continue
+                self.requests.put((conn, kind, states))
+        except (EOFError, OSError):
+            conn.close()
+        finally:
+            with self.clients_lock:
+                self.clients -= 1
+
+    def _batch(self):
+        """
+        Gather requests within the latency budget and answer them with one forward pass.
+        """
+        while not self.stopped.is_set():
+            self._maybe_reload()
+            try:
+                first = self.requests.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            batch = [first]
+            rows = len(first[2])
+            deadline = time.monotonic() + self.max_latency
+            # Clients wait for their answer, so once every client has a request in the batch no other can come
+            while rows < self.max_batch and len(batch) < self.clients:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self.requests.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                batch.append(request)
+                rows += len(request[2])
+
+            try:
+                states = np.concatenate([states for _, _, states in batch])
+                if self.normalizer is not None:
+                    states = self.normalizer.normalize(states)
+                values = self.policy.predict(states)
+            except Exception as e:
+                # A reloaded model with another input size, or a failing backend, only fails this batch
+                for conn, _, _ in batch:
+                    try:
+                        conn.send(e)
+                    except (EOFError, OSError):
+                        pass
+                continue
+            self.batches += 1
+            self.states += rows
+
+            start = 0
+            for conn, kind, states in batch:
+                output = values[start:start + len(states)]
+                start += len(states)
+                try:
+                    conn.send(output if kind == "values" else np.argmax(output, axis=1))
+                except (EOFError, OSError):
+                    pass
+
+    def _mtimes(self):
+        """
+        Get the modification times of the model file and of its normalizer.
+
+        Returns:
+            tuple: The times, None for a missing normalizer.
+        """
+        from Normalizer import normalizer_file
+
+        norm_file = normalizer_file(self.model_file)
+        return (os.path.getmtime(self.model_file),
+                os.path.getmtime(norm_file) if os.path.exists(norm_file) else None)
+
+    def _load(self):
+        """
+        Load the policy and the normalizer saved next to the model.
+
+        Returns:
+            tuple: The policy, and the normalizer or None if the model was trained without one.
+        """
+        from Normalizer import Normalizer, normalizer_file
+
+        norm_file = normalizer_file(self.model_file)
+        policy = self.load_policy(self.model_file, self.backend)
+        return policy, Normalizer.load(norm_file) if os.path.exists(norm_file) else None
+
+    def _maybe_reload(self):
+        """
+        Reload the policy and its normalizer if either file changed since they were loaded.
+        """
+        if not self.reload_interval or time.monotonic() - self.last_reload_check < self.reload_interval:
+            return
+        self.last_reload_check = time.monotonic()
+        try:
+            mtime = self._mtimes()
+            if mtime == self.model_mtime:
+                return
+            policy, normalizer = self._load()
+        except Exception as e:
+            # The checkpoint may still be being written, try again at the next check
+            print("Could not reload", self.model_file, e)
+            return
+        self.policy, self.normalizer = policy, normalizer
+        self.model_mtime = mtime
+        self.reloads += 1
+        print("Reloaded", self.model_file)
+
+    def statistics(self):
+        """
+        Summarize the served batches.
+
+        Returns:
+            dict: The number of batches, states and reloads and the mean batch size.
+        """
+        return {"batches": self.batches, "states": self.states, "reloads": self.reloads,
+                "mean_batch": self.states / self.batches if self.batches else 0.0}
+
+
+class InferenceClient:
+    """
+    Connection of an environment worker to an InferenceServer.
+
+    The client only depends on NumPy, so workers do not load TensorFlow.
+    """
+
+    def __init__(self, address=("localhost", 6000)):
+        """
+        Connect to the server.
+
+        Args:
+            address (tuple or str): (host, port) or Unix socket path of the server.
+        """
+        self.conn = Client(address, authkey=get_authkey())
+        self.conn.send(("info", None))
+        info = self._recv()
+        self.input_dims = info["input_dims"]
+        self.n_actions = info["n_actions"]
+
+    def predict(self, states):
+        """
+        Compute the outputs of the served model.
+
+        Args:
+            states (numpy.ndarray): States, one row per state.
+
+        Returns:
+            numpy.ndarray: The outputs, one row per state.
+
+        Raises:
+            ValueError: If the server rejected the states.
+        """
+        self.conn.send(("values", np.asarray(states, dtype=np.float32)))
+        return self._recv()
+
+    def get_actions(self, states):
+        """
+        Choose the greedy action of every state.
+
+        Args:
+            states (numpy.ndarray): States, one row per state.
+
+        Returns:
+            numpy.ndarray: The chosen actions.
+
+        Raises:
+            ValueError: If the server rejected the states.
+        """
+        self.conn.send(("actions", np.asarray(states, dtype=np.float32)))
+        return self._recv()
+
+    def _recv(self):
+        """
+        Receive an answer of the server, raising the errors it sends back.
+
+        Returns:
+            object: The answer.
+        """
+        answer = self.conn.recv()
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    def get_action(self, state, epsilon=0.0):
+        """
+        Choose an action with the epsilon-greedy policy.
+
+        Args:
+            state (numpy.ndarray): Current state.
+            epsilon (float): Probability of a random action.
+
+        Returns:
+            int: The chosen action.
+        """
+        rand = np.random.random()
+        if rand < epsilon:
+            return int(np.random.randint(self.n_actions))
+        return int(self.get_actions(np.reshape(state, (1, -1)))[0])
+
+    def close(self):
+        """
+        Close the connection.
+        """
+        self.conn.close()
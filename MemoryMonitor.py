@@ -0,0 +1,150 @@
+import os
+import tracemalloc
+import numpy as np
+
+
+def rss_bytes():
+    """
+    Get the resident set size of this process.
+
+    Returns:
+        int: The current RSS in bytes, or the peak RSS where the current one is not available.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+def replay_bytes(buffer):
+    """
+    Get the memory allocated by a replay buffer.
+
+    Args:
+        buffer (ReplayBuffer): The replay buffer, or a ShardedReplayBuffer.
+
+    Returns:
+        int: The bytes of all its arrays.
+    """
+    # The shards of a sharded buffer are views of the arrays of its storage
+    buffer = getattr(buffer, "storage", buffer)
+    return sum(value.nbytes for value in vars(buffer).values() if isinstance(value, np.ndarray))
+
+
+def variables_bytes(variables):
+    """
+    Get the memory of Keras or TensorFlow variables.
+
+    Args:
+        variables (list): The variables.
+
+    Returns:
+        int: Their bytes.
+    """
+    return sum(int(np.prod(v.shape)) * np.dtype(v.dtype).itemsize for v in variables)
+
+
+def brain_bytes(brain):
+    """
+    Get the memory of the weights and of the optimizer state of a Brain.
+
+    Args:
+        brain (Brain): The brain.
+
+    Returns:
+        tuple: The bytes of the model weights and of the optimizer variables.
+    """
+    optimizer = getattr(brain.model, "optimizer", None)
+    return variables_bytes(brain.model.weights), variables_bytes(optimizer.variables) if optimizer else 0
+
+
+class MemoryMonitor:
+    """
+    Accounts for the memory of a long-running training process.
+
+    The report covers the replay buffer, the model and optimizer variables,
+    the RSS of the process and, with tracemalloc, the Python heap and the
+    source lines it grew the most at since the previous report.
+    """
+
+    def __init__(self, agent=None, trace=True, top=5, rss_limit=None):
+        """
+        Initialize the monitor.
+
+        Args:
+            agent (Agent): The agent whose replay buffer and networks are accounted for.
+            trace (bool): Whether to trace Python allocations with tracemalloc. Tracing
+                slows down allocations, so it can be turned off for long runs.
+            top (int): Number of source lines reported for the Python heap growth.
+            rss_limit (int): RSS in bytes above which over_limit returns True, None for no limit.
+        """
+        self.agent = agent
+        self.trace = trace
+        self.top = top
+        self.rss_limit = rss_limit
+        self.snapshot = None
+        if trace and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def over_limit(self):
+        """
+        Check the RSS of the process against the limit.
+
+        Returns:
+            bool: True if the RSS is above rss_limit.
+        """
+        return self.rss_limit is not None and rss_bytes() > self.rss_limit
+
+    def report(self):
+        """
+        Measure the memory of the process.
+
+        Returns:
+            dict: Bytes of the RSS, the replay buffer, the model and optimizer variables and the
+                Python heap, and the (source line, growth in bytes) pairs of the largest heap growth
+                since the previous report.
+        """
+        report = {"rss": rss_bytes()}
+        if self.agent is not None:
+            report["replay"] = replay_bytes(self.agent.memory)
+            model = optimizer = 0
+            for brain in (self.agent.brain_eval, self.agent.brain_target):
+                weights, slots = brain_bytes(brain)
+                model += weights
+                optimizer += slots
+            report["model"] = model
+            report["optimizer"] = optimizer
+
+        if self.trace and tracemalloc.is_tracing():
+            report["heap"], report["heap_peak"] = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot().filter_traces(
+                [tracemalloc.Filter(False, tracemalloc.__file__)])
+            growth = []
+            if self.snapshot is not None:
+                for stat in snapshot.compare_to(self.snapshot, "lineno")[:self.top]:
+                    frame = stat.traceback[0]
+                    growth.append((f"{frame.filename}:{frame.lineno}", stat.size_diff))
+            report["growth"] = growth
+            self.snapshot = snapshot
+        return report
+
+
+def format_report(report):
+    """
+    Format a memory report as text.
+
+    Args:
+        report (dict): Report returned by MemoryMonitor.report.
+
+    Returns:
+        str: The formatted report, sizes in megabytes.
+    """
+    names = ["rss", "replay", "model", "optimizer", "heap", "heap_peak"]
+    lines = ["Memory: " + ", ".join(f"{name} {report[name] / 2 ** 20:.1f} MB" for name in names if name in report)]
+    for line, size in report.get("growth", []):
+        lines.append(f"  {size / 2 ** 10:+.1f} KB {line}")
+    return "\n".join(lines)
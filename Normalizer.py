@@ -0,0 +1,224 @@
+import os
+import numpy as np
+
+
+def normalizer_file(model_file):
+    """
+    Get the file the normalizer of a model is saved to.
+
+    Args:
+        model_file (str): File name of the model.
+
+    Returns:
+        str: The normalizer file, next to the model.
+    """
+    return os.path.splitext(model_file)[0] + ".norm.npz"
+
+
+class RunningMeanStd:
+    """Mean and variance of a stream of values, updated one batch at a time."""
+
+    def __init__(self, shape=(), epsilon=1e-4):
+        """
+        Initialize the statistics.
+
+        Args:
+            shape (tuple): Shape of one value.
+            epsilon (float): Initial count, it keeps the first updates from dividing by zero.
+        """
+        self.mean = np.zeros(shape, dtype=np.float64)
+        self.var = np.ones(shape, dtype=np.float64)
+        self.count = epsilon
+
+    def update(self, batch):
+        """
+        Merge the statistics of a batch with the parallel algorithm of Chan et al.
+
+        Args:
+            batch (numpy.ndarray): Values, one per row.
+        """
+        batch = np.asarray(batch, dtype=np.float64).reshape((-1,) + self.mean.shape)
+        batch_count = len(batch)
+        if batch_count == 0:
+            return
+        batch_mean = batch.mean(axis=0)
+        batch_var = batch.var(axis=0)
+
+        delta = batch_mean - self.mean
+        total = self.count + batch_count
+        self.mean = self.mean + delta * batch_count / total
+        m2 = self.var * self.count + batch_var * batch_count + delta ** 2 * self.count * batch_count / total
+        self.var = m2 / total
+        self.count = total
+
+    @property
+    def std(self):
+        """Standard deviation of the values."""
+        return np.sqrt(self.var + 1e-8)
+
+
+class FrameStack:
+    """Concatenates the last observations of an episode into one state."""
+
+    def __init__(self, n_frames):
+        """
+        Initialize the frame stack.
+
+        Args:
+            n_frames (int): Number of stacked observations.
+        """
+        self.n_frames = n_frames
+        self.frames = None
+
+    def reset(self, observation):
+        """
+        Start an episode, the first observation fills every frame.
+
+        Args:
+            observation (list): First observation of the episode.
+
+        Returns:
+            numpy.ndarray: The stacked state, oldest observation first.
+        """
+        self.frames = np.tile(np.asarray(observation, dtype=np.float32), self.n_frames)
+        return self.frames.copy()
+
+    def push(self, observation):
+        """
+        Add the next observation of the episode.
+
+        Args:
+            observation (list): The observation.
+
+        Returns:
+            numpy.ndarray: The stacked state, oldest observation first.
+        """
+        size = len(observation)
+        self.frames = np.concatenate([self.frames[size:], np.asarray(observation, dtype=np.float32)])
+        return self.frames.copy()
+
+
+class Normalizer:
+    """
+    Preprocessing of the states and rewards the agent trains on.
+
+    The replay buffer keeps the raw (stacked) states and rewards. They are
+    normalized when a batch is sampled, with running statistics updated at
+    every stored transition, so old transitions follow the latest statistics.
+    """
+
+    def __init__(self, observation_size, n_frames=1, normalize_observations=True, scale_rewards=True,
+                 gamma=0.99, clip=5.0):
+        """
+        Initialize the normalizer.
+
+        Args:
+            observation_size (int): Number of values in one observation.
+            n_frames (int): Number of observations stacked in a state.
+            normalize_observations (bool): Whether to standardize the observations with
+                their running mean and variance.
+            scale_rewards (bool): Whether to divide the rewards by the running standard
+                deviation of the discounted return.
+            gamma (float): Discount factor of the return used to scale the rewards.
+            clip (float): Normalized observations are clipped to [-clip, clip].
+        """
+        self.observation_size = observation_size
+        self.n_frames = n_frames
+        self.normalize_observations = normalize_observations
+        self.scale_rewards = scale_rewards
+        self.gamma = gamma
+        self.clip = clip
+        self.observation_rms = RunningMeanStd((observation_size,))
+        self.return_rms = RunningMeanStd()
+        # Discounted return of the current episode
+        self.ret = 0.0
+
+    def update(self, state, new_state, reward, done):
+        """
+        Update the running statistics with a stored transition.
+
+        Every transition adds the newest observation of its state, so the first
+        observation of an episode is counted, and the last transition of an
+        episode also adds its terminal state.
+
+        Args:
+            state (numpy.ndarray): The raw state the action was taken in.
+            new_state (numpy.ndarray): The raw new state.
+            reward (float): The raw reward.
+            done (bool): Whether the episode ended.
+        """
+        self.observation_rms.update(np.asarray(state)[-self.observation_size:])
+        if done:
+            self.observation_rms.update(np.asarray(new_state)[-self.observation_size:])
+        self.ret = self.ret * self.gamma + reward
+        self.return_rms.update(self.ret)
+        if done:
+            self.ret = 0.0
+
+    def normalize(self, states):
+        """
+        Normalize raw states, vectorized over a batch.
+
+        Args:
+            states (numpy.ndarray): Raw states, one per row, or a single state.
+
+        Returns:
+            numpy.ndarray: The normalized states in float32.
+        """
+        states = np.asarray(states, dtype=np.float32)
+        if not self.normalize_observations:
+            return states
+        # Every stacked frame is normalized with the statistics of one observation
+        mean = np.tile(self.observation_rms.mean, self.n_frames)
+        std = np.tile(self.observation_rms.std, self.n_frames)
+        return np.clip((states - mean) / std, -self.clip, self.clip).astype(np.float32)
+
+    def scale(self, rewards):
+        """
+        Scale raw rewards, vectorized over a batch.
+
+        Args:
+            rewards (numpy.ndarray): Raw rewards.
+
+        Returns:
+            numpy.ndarray: The scaled rewards.
+        """
+        if not self.scale_rewards:
+            return rewards
+        return rewards / self.return_rms.std
+
+    def save(self, fname):
+        """
+        Save the settings and the statistics.
+
+        Args:
+            fname (str): File name, see normalizer_file.
+        """
+        np.savez(fname, observation_size=self.observation_size, n_frames=self.n_frames,
+                 normalize_observations=self.normalize_observations, scale_rewards=self.scale_rewards,
+                 gamma=self.gamma, clip=self.clip,
+                 observation_mean=self.observation_rms.mean, observation_var=self.observation_rms.var,
+                 observation_count=self.observation_rms.count, return_mean=self.return_rms.mean,
+                 return_var=self.return_rms.var, return_count=self.return_rms.count)
+
+    @classmethod
+    def load(cls, fname):
+        """
+        Load a normalizer saved with save.
+
+        Args:
+            fname (str): File name, see normalizer_file.
+
+        Returns:
+            Normalizer: The loaded normalizer.
+        """
+        with np.load(fname) as f:
+            normalizer = cls(int(f["observation_size"]), int(f["n_frames"]), bool(f["normalize_observations"]),
+                             bool(f["scale_rewards"]), float(f["gamma"]), float(f["clip"]))
+            normalizer.observation_rms.mean = f["observation_mean"]
+            normalizer.observation_rms.var = f["observation_var"]
+            normalizer.observation_rms.count = float(f["observation_count"])
+            normalizer.return_rms.mean = f["return_mean"]
+            normalizer.return_rms.var = f["return_var"]
+            normalizer.return_rms.count = float(f["return_count"])
+        return normalizer
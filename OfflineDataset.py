@@ -0,0 +1,182 @@
+import glob
+import os
+import queue
+import threading
+import time
+import numpy as np
+
+
+def transitions_from_recording(directory):
+    """
+    Stream the transitions of a trajectory recording, one chunk at a time.
+
+    A recorded row holds the action, the reward and the state after the step,
+    so a transition pairs every row with the previous row of the same episode.
+    The first step of every episode has no previous state and is skipped.
+
+    Args:
+        directory (str): Directory of a recording made with TrajectoryRecorder,
+            for example of evaluation runs or of demonstration drives.
+
+    Yields:
+        tuple: Arrays of states, actions, rewards, new states and done flags.
+    """
+    previous = None
+    for fname in sorted(glob.glob(os.path.join(directory, "chunk_*.npz"))):
+        with np.load(fname) as chunk:
+            episode, sensors = chunk["episode"], chunk["sensors"]
+            action, reward, done = chunk["action"], chunk["reward"], chunk["done"]
+
+        # Carry the last row of the previous chunk over, episodes can span chunks
+        if previous is not None:
+            episode = np.concatenate([[previous[0]], episode])
+            sensors = np.concatenate([previous[1][np.newaxis], sensors])
+            offset = 1
+        else:
+            offset = 0
+        previous = (episode[-1], sensors[-1])
+
+        same = episode[1:] == episode[:-1]
+        rows = np.nonzero(same)[0]
+        yield (sensors[rows], action[rows + 1 - offset], reward[rows + 1 - offset],
+               sensors[rows + 1], done[rows + 1 - offset])
+
+
+def transitions_from_dump(fname):
+    """
+    Load the transitions of a replay buffer dump.
+
+    Args:
+        fname (str): File written by ReplayBuffer.save.
+
+    Yields:
+        tuple: Arrays of states, actions, rewards, new states and done flags.
+    """
+    with np.load(fname) as dump:
+        yield dump["states"], dump["actions"], dump["rewards"], dump["states_"], dump["dones"]
+
+
+def iter_transitions(source):
+    """
+    Stream the transitions of a recording directory or of a replay buffer dump.
+
+    Args:
+        source (str): Recording directory or file written by ReplayBuffer.save.
+
+    Returns:
+        iterator: Tuples of states, actions, rewards, new states and done flags.
+    """
+    if os.path.isdir(source):
+        return transitions_from_recording(source)
+    return transitions_from_dump(source)
+
+
+def state_size(sources):
+    """
+    Get the number of values in the logged states.
+
+    Args:
+        sources (list): Recording directories and replay buffer dump files.
+
+    Returns:
+        int: The size of the states, or None if the sources hold no transitions.
+    """
+    for source in sources:
+        for batch in iter_transitions(source):
+            if len(batch[0]):
+                return batch[0].shape[1]
+    return None
+
+
+def load_transitions(buffer, sources):
+    """
+    Load logged transitions into a replay buffer.
+
+    Args:
+        buffer (ReplayBuffer): The buffer to fill.
+        sources (list): Recording directories and replay buffer dump files.
+
+    Returns:
+        int: Number of transitions loaded.
+    """
+    loaded = 0
+    for source in sources:
+        for batch in iter_transitions(source):
+            buffer.store_batch(*batch)
+            loaded += len(batch[0])
+    return loaded
+
+
+class Prefetcher:
+    """Samples minibatches from a replay buffer in a background thread."""
+
+    def __init__(self, buffer, batch_size, depth=8):
+        """
+        Initialize the prefetcher and start sampling.
+
+        Args:
+            buffer (ReplayBuffer): The buffer to sample from. It must not be written
+                to while the prefetcher runs.
+            batch_size (int): Number of transitions per minibatch.
+            depth (int): Number of minibatches sampled ahead.
+        """
+        self.buffer = buffer
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=depth)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+        self.thread.start()
+
+    def _sample(self):
+        """
+        Keep the queue full until stop is called.
+        """
+        while not self.stopped.is_set():
+            batch = self.buffer.sample_buffer(self.batch_size)
+            while not self.stopped.is_set():
+                try:
+                    self.queue.put(batch, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+
+    def get(self):
+        """
+        Get the next minibatch.
+
+        Returns:
+            tuple: A batch in the format of ReplayBuffer.sample_buffer.
+        """
+        return self.queue.get()
+
+    def stop(self):
+        """
+        Stop the background sampling.
+        """
+        self.stopped.set()
+        self.thread.join()
+
+
+def pretrain(agent, updates, prefetch=8, log_every=1000):
+    """
+    Train an agent on the transitions of its memory buffer with no environment in the loop.
+
+    Args:
+        agent (Agent): The agent, its memory buffer already filled with load_transitions.
+        updates (int): Number of gradient steps.
+        prefetch (int): Number of minibatches sampled ahead in the background.
+        log_every (int): Number of gradient steps between two progress reports.
+
+    Returns:
+        float: The number of gradient steps per second.
+    """
+    prefetcher = Prefetcher(agent.memory, agent.batch_size, prefetch)
+    start = time.perf_counter()
+    try:
+        for update in range(1, updates + 1):
+            agent.learn(prefetcher.get())
+            if update % log_every == 0:
+                print("Update", update, "of", updates, round(update / (time.perf_counter() - start), 1), "updates/sec")
+    finally:
+        prefetcher.stop()
+    return updates / (time.perf_counter() - start)
@@ -0,0 +1,436 @@
+import os
+import numpy as np
+
+
+def _softmax(x):
+    """Row-wise softmax, shifted by the row maximum for stability."""
+    e = np.exp(x - x.max(axis=1, keepdims=True))
+    return e / e.sum(axis=1, keepdims=True)
+
+
+# Activations of the exported layers, by their Keras name
+ACTIVATIONS = {
+    "linear": lambda x: x,
+    "relu": lambda x: np.maximum(x, 0),
+    "tanh": np.tanh,
+    "sigmoid": lambda x: 1 / (1 + np.exp(-x)),
+    "softmax": _softmax,
+}
+
+
+class Policy:
+    """Greedy action selection on top of the predict method of a subclass."""
+
+    def predict(self, states):
+        """
+        Compute the outputs of the model.
+
+        Args:
+            states (numpy.ndarray): States, one row per state.
+
+        Returns:
+            numpy.ndarray: The outputs, one row per state.
+        """
+        raise NotImplementedError
+
+    def get_actions(self, states):
+        """
+        Choose the greedy action of every state.
+
+        Args:
+            states (numpy.ndarray): States, one row per state.
+
+        Returns:
+            numpy.ndarray: The chosen actions.
+        """
+        return np.argmax(self.predict(states), axis=1)
+
+    def get_action(self, state):
+        """
+        Choose the greedy action of a single state.
+
+        Args:
+            state (numpy.ndarray): Current state.
+
+        Returns:
+            int: The chosen action.
+        """
+        return int(self.get_actions(np.reshape(state, (1, -1)))[0])
+
+
+def _dense(x, kernel, bias):
+    """Fully connected layer."""
+    return x @ kernel + bias
+
+
+def _layer_norm(x, gamma, beta, epsilon):
+    """Layer normalization over the features of every row."""
+    mean = x.mean(axis=1, keepdims=True)
+    var = x.var(axis=1, keepdims=True)
+    return (x - mean) / np.sqrt(var + epsilon) * gamma + beta
+
+
+def _dueling(x, value_kernel, value_bias, advantage_kernel, advantage_bias):
+    """Dueling head, the value plus the advantages minus their mean."""
+    advantage = x @ advantage_kernel + advantage_bias
+    return x @ value_kernel + value_bias + advantage - advantage.mean(axis=1, keepdims=True)
+
+
+def _int8_dense(x, kernel, scale, bias):
+    """Fully connected layer with an int8 kernel, the inputs quantized to int8 row by row."""
+    # Dynamic symmetric scale of every row, so each state uses the whole int8 range
+    x_scale = np.abs(x).max(axis=1, keepdims=True) / 127
+    x_scale[x_scale == 0] = 1
+    xq = np.round(x / x_scale)
+    # Sums of int8 products are exact in float32 below 2 ** 24, that is up to 1040 inputs,
+    # and the BLAS float32 product is much faster than an integer matmul in NumPy
+    return (xq @ kernel.astype(np.float32)) * (x_scale * scale) + bias
+
+
+# Forward functions of the exported layer kinds, called with the layer arrays
+LAYERS = {"dense": _dense, "layer_norm": _layer_norm, "dueling": _dueling, "int8_dense": _int8_dense}
+
+
+class NumpyPolicy(Policy):
+    """
+    Forward pass of a trained Brain model in plain NumPy.
+
+    Acting only needs the weights of the model, so workers that load an
+    exported policy do not need TensorFlow and its memory footprint.
+    """
+
+    def __init__(self, layers):
+        """
+        Initialize the policy.
+
+        Args:
+            layers (list): (kind, arrays, activation) tuples, the kind a key of LAYERS called
+                with the arrays, for example [kernel, bias] of shapes (inputs, outputs) and
+                (outputs,) for "dense", and the activation a key of ACTIVATIONS.
+        """
+        # int8 kernels of quantized layers stay int8, everything else is float32
+        self.layers = [(kind, [np.asarray(a, dtype=np.int8 if np.asarray(a).dtype == np.int8 else np.float32)
+                               for a in arrays], activation)
+                       for kind, arrays, activation in layers]
+        for kind, _, activation in self.layers:
+            if kind not in LAYERS:
+                raise ValueError(f"Unsupported layer {kind}")
+            if activation not in ACTIVATIONS:
+                raise ValueError(f"Unsupported activation {activation}")
+
+    @property
+    def input_dims(self):
+        """Number of values in a state."""
+        return self.layers[0][1][0].shape[0]
+
+    @property
+    def n_actions(self):
+        """Number of actions."""
+        return self.layers[-1][1][-1].shape[-1]
+
+    @classmethod
+    def from_model(cls, model):
+        """
+        Export the layers of a Brain model.
+
+        Args:
+            model (keras.Model): A sequential model of Dense, LayerNormalization,
+                Activation and DuelingHead layers.
+
+        Returns:
+            NumpyPolicy: The exported policy.
+        """
+        layers = []
+        for layer in model.layers:
+            kind = type(layer).__name__
+            if kind == "Dense":
+                layers.append(("dense", layer.get_weights(), layer.activation.__name__))
+            elif kind == "LayerNormalization":
+                gamma, beta = layer.get_weights()
+                layers.append(("layer_norm", [gamma, beta, np.float32(layer.epsilon)], "linear"))
+            elif kind == "DuelingHead":
+                arrays = layer.value.get_weights() + layer.advantage.get_weights()
+                layers.append(("dueling", arrays, "linear"))
+            elif kind == "Activation":
+                # A separate activation replaces the linear activation of the previous layer
+                previous, arrays, _ = layers[-1]
+                layers[-1] = (previous, arrays, layer.activation.__name__)
+            else:
+                raise ValueError(f"Cannot export layer {layer.name} of type {kind}")
+        return cls(layers)
+
+    @classmethod
+    def load(cls, fname):
+        """
+        Load a policy saved with save, or export it from a saved Keras model.
+
+        Args:
+            fname (str): A .npz policy file or a saved Keras model.
+
+        Returns:
+            NumpyPolicy: The loaded policy.
+        """
+        if fname.endswith(".npz"):
+            with np.load(fname) as f:
+                activations = [str(a) for a in f["activations"]]
+                if "kinds" not in f:
+                    # Dense only policies exported before the other layer kinds
+                    return cls([("dense", [f[f"kernel_{i}"], f[f"bias_{i}"]], a) for i, a in enumerate(activations)])
+                layers = []
+                for i, (kind, activation) in enumerate(zip(f["kinds"], activations)):
+                    arrays = [f[f"layer{i}_{j}"] for j in range(int(f["n_arrays"][i]))]
+                    layers.append((str(kind), arrays, activation))
+                return cls(layers)
+        from keras.models import load_model
+        import Brain  # noqa: F401, registers the custom layers of the saved models
+
+        return cls.from_model(load_model(fname))
+
+    def save(self, fname):
+        """
+        Save the policy to a .npz file.
+
+        Args:
+            fname (str): File name of the policy.
+        """
+        arrays = {"kinds": np.array([kind for kind, _, _ in self.layers]),
+                  "activations": np.array([activation for _, _, activation in self.layers]),
+                  "n_arrays": np.array([len(layer_arrays) for _, layer_arrays, _ in self.layers])}
+        for i, (_, layer_arrays, _) in enumerate(self.layers):
+            for j, array in enumerate(layer_arrays):
+                arrays[f"layer{i}_{j}"] = array
+        np.savez(fname, **arrays)
+
+    def predict(self, states):
+        """
+        Compute the outputs of the model.
+
+        Args:
+            states (numpy.ndarray): States, one row per state.
+
+        Returns:
+            numpy.ndarray: The outputs, one row per state.
+        """
+        x = np.asarray(states, dtype=np.float32)
+        for kind, arrays, activation in self.layers:
+            x = ACTIVATIONS[activation](LAYERS[kind](x, *arrays))
+        return x
+
+
+class KerasPolicy(Policy):
+    """Serves a saved Keras model with the interface of NumpyPolicy."""
+
+    def __init__(self, model):
+        """
+        Initialize the policy.
+
+        Args:
+            model (keras.Model): The loaded model.
+        """
+        self.model = model
+
+    @property
+    def input_dims(self):
+        """Number of values in a state."""
+        return self.model.inputs[0].shape[-1]
+
+    @property
+    def n_actions(self):
+        """Number of actions."""
+        return self.model.outputs[0].shape[-1]
+
+    @classmethod
+    def load(cls, fname):
+        """
+        Load a saved Keras model.
+
+        Args:
+            fname (str): File name of the saved model.
+
+        Returns:
+            KerasPolicy: The loaded policy.
+        """
+        from keras.models import load_model
+        import Brain  # noqa: F401, registers the custom layers of the saved models
+
+        return cls(load_model(fname))
+
+    def predict(self, states):
+        """
+        Compute the outputs of the model.
+
+        Args:
+            states (numpy.ndarray): States, one row per state.
+
+        Returns:
+            numpy.ndarray: The outputs, one row per state.
+        """
+        # Calling the model directly skips the per-call setup of predict
+        return np.asarray(self.model(np.asarray(states, dtype=np.float32), training=False))
+
+
+class TFLitePolicy(Policy):
+    """Serves a TFLite flatbuffer, such as the int8 model written by export_tflite."""
+
+    def __init__(self, model_content):
+        """
+        Initialize the policy.
+
+        Args:
+            model_content (bytes): The flatbuffer.
+        """
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+
+        self.interpreter = Interpreter(model_content=model_content)
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        # Batch size the tensors are allocated for
+        self.batch_size = None
+
+    @property
+    def input_dims(self):
+        """Number of values in a state."""
+        return int(self.input["shape"][-1])
+
+    @property
+    def n_actions(self):
+        """Number of actions."""
+        return int(self.output["shape"][-1])
+
+    @classmethod
+    def load(cls, fname):
+        """
+        Load a .tflite file.
+
+        Args:
+            fname (str): File name of the flatbuffer.
+
+        Returns:
+            TFLitePolicy: The loaded policy.
+        """
+        with open(fname, "rb") as f:
+            return cls(f.read())
+
+    def predict(self, states):
+        """
+        Compute the outputs of the model.
+
+        Args:
+            states (numpy.ndarray): States, one row per state.
+
+        Returns:
+            numpy.ndarray: The outputs, one row per state.
+        """
+        x = np.asarray(states, dtype=np.float32)
+        # Reallocating the tensors is only needed when the batch size changes
+        if len(x) != self.batch_size:
+            self.interpreter.resize_tensor_input(self.input["index"], x.shape)
+            self.interpreter.allocate_tensors()
+            self.batch_size = len(x)
+        self.interpreter.set_tensor(self.input["index"], x)
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self.output["index"]).copy()
+
+
+def quantize(policy):
+    """
+    Quantize the dense layers of a NumPy policy to int8.
+
+    Kernels are quantized symmetrically per output channel and the inputs of
+    every layer dynamically per state. Dueling heads are folded into a dense
+    layer first, the layer normalizations stay in float32.
+
+    Args:
+        policy (NumpyPolicy): The float policy.
+
+    Returns:
+        NumpyPolicy: The quantized policy, saved and loaded like the float one.
+    """
+    layers = []
+    for kind, arrays, activation in policy.layers:
+        if kind == "dueling":
+            # V + A - mean(A) is linear in the input
+            value_kernel, value_bias, advantage_kernel, advantage_bias = arrays
+            arrays = [advantage_kernel - advantage_kernel.mean(axis=1, keepdims=True) + value_kernel,
+                      advantage_bias - advantage_bias.mean() + value_bias]
+            kind = "dense"
+        if kind == "dense":
+            kernel, bias = arrays
+            scale = np.abs(kernel).max(axis=0) / 127
+            scale[scale == 0] = 1
+            layers.append(("int8_dense", [np.round(kernel / scale).astype(np.int8), scale, bias], activation))
+        else:
+            layers.append((kind, arrays, activation))
+    return NumpyPolicy(layers)
+
+
+def export_tflite(model, fname, states=None):
+    """
+    Convert a Keras model to an int8 TFLite flatbuffer.
+
+    Args:
+        model (keras.Model): The float model.
+        fname (str): File name of the .tflite file.
+        states (numpy.ndarray): Representative states, one row per state. With them the
+            weights and the activations are int8, calibrated on the states, and only the
+            input and output stay float. Without them only the weights are int8.
+    """
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if states is not None:
+        def representative_dataset():
+            for state in np.asarray(states, dtype=np.float32):
+                yield [state[np.newaxis, :]]
+
+        converter.representative_dataset = representative_dataset
+    with open(fname, "wb") as f:
+        f.write(converter.convert())
+
+
+def greedy_agreement(reference, policy, states):
+    """
+    Compare the greedy actions and outputs of a policy with a reference.
+
+    Args:
+        reference (Policy): The reference policy, usually the float model.
+        policy (Policy): The compared policy, usually a quantized one.
+        states (numpy.ndarray): The states, one row per state.
+
+    Returns:
+        dict: The fraction of states with the same greedy action, and the mean and
+            largest absolute difference of the outputs.
+    """
+    expected = reference.predict(states)
+    outputs = policy.predict(states)
+    error = np.abs(outputs - expected)
+    return {"states": len(states),
+            "agreement": float(np.mean(np.argmax(outputs, axis=1) == np.argmax(expected, axis=1))),
+            "mean_error": float(error.mean()), "max_error": float(error.max())}
+
+
+# Policy classes by backend name
+BACKENDS = {"numpy": NumpyPolicy, "keras": KerasPolicy, "tflite": TFLitePolicy}
+
+
+def load_policy(fname, backend="numpy"):
+    """
+    Load a policy with the given backend.
+
+    Args:
+        fname (str): A saved Keras model, a .npz policy for the numpy backend or a
+            .tflite file for the tflite backend.
+        backend (str): "numpy", "keras" or "tflite", or None to pick it from the file
+            extension, "keras" for saved Keras models.
+
+    Returns:
+        Policy: The loaded policy.
+    """
+    if backend is None:
+        backend = {".npz": "numpy", ".tflite": "tflite"}.get(os.path.splitext(fname)[1], "keras")
+    return BACKENDS[backend].load(fname)
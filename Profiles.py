@@ -0,0 +1,25 @@
+# Settings of the Brain networks, kept apart from Brain so the command line parser
+# can list them without importing TensorFlow.
+
+# CPU training profiles. intra_op None uses every CPU of the machine, batch_size
+# None keeps the batch size of the agent and lr_scaling adapts the learning rate
+# to a larger batch ("linear" or "sqrt" in the ratio to the agent batch size).
+CPU_PROFILES = {
+    "default": {},
+    "threads": {"intra_op": None, "inter_op": 1},
+    "xla": {"intra_op": None, "inter_op": 1, "jit_compile": True},
+    "bf16": {"intra_op": None, "inter_op": 1, "jit_compile": True, "mixed_precision": True},
+    "large-batch": {"intra_op": None, "inter_op": 1, "jit_compile": True, "batch_size": 2048, "lr_scaling": "sqrt"},
+}
+
+# Q-network architectures compared by Benchmark.benchmark_architectures. "softmax" is
+# the original network, its outputs are squashed onto the probability simplex although
+# the Q-targets can be negative or above 1; "linear" and "dueling" heads are not.
+ARCHITECTURES = {
+    "softmax": {"hidden": (256,), "head": "softmax"},
+    "linear": {"hidden": (256,), "head": "linear"},
+    "dueling": {"hidden": (256,), "head": "dueling"},
+    "linear-2x128": {"hidden": (128, 128), "head": "linear"},
+    "dueling-2x128-ln": {"hidden": (128, 128), "head": "dueling", "layer_norm": True},
+    "linear-64": {"hidden": (64,), "head": "linear"},
+}
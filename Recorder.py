@@ -0,0 +1,257 @@
+import glob
+import json
+import os
+import queue
+import threading
+import numpy as np
+
+# Columns of a trajectory chunk and their data types
+COLUMNS = {
+    "episode": np.int32,
+    "step": np.int32,
+    "x": np.float32,
+    "y": np.float32,
+    "angle": np.int16,
+    "checkpoint": np.int16,
+    "action": np.int8,
+    "reward": np.float32,
+    "done": np.bool_,
+}
+
+
+class TrajectoryRecorder:
+    """
+    Streams per-step trajectories to chunked, compressed columnar files.
+
+    Steps are buffered in preallocated column arrays. Full chunks are handed to
+    a background thread that compresses them to chunk_XXXXXX.npz files, so the
+    simulation only pays for copying a few values per step.
+    """
+
+    def __init__(self, directory, chunk_size=4096, metadata=None):
+        """
+        Initialize the recorder.
+
+        Args:
+            directory (str): Directory the chunk files are written to.
+            chunk_size (int): Number of steps per chunk file.
+            metadata (dict): JSON serializable settings of the recording, such as the
+                keyword arguments of the SensorSpec under "sensors".
+        """
+        os.makedirs(directory, exist_ok=True)
+        if metadata is not None:
+            with open(os.path.join(directory, "metadata.json"), "w") as f:
+                json.dump(metadata, f, indent=2)
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.chunk = len(glob.glob(os.path.join(directory, "chunk_*.npz")))
+        self.episode = self._next_episode()
+        self.step = 0
+        self.size = 0
+        self.columns = None
+
+        self.queue = queue.Queue(maxsize=4)
+        # Exception of the background writer, raised by the next flush or close
+        self.error = None
+        self.writer = threading.Thread(target=self._write_chunks, daemon=True)
+        self.writer.start()
+
+    def _next_episode(self):
+        """
+        Find the first episode id not used by the chunks already in the directory.
+
+        Returns:
+            int: The next episode id.
+        """
+        last = -1
+        for fname in glob.glob(os.path.join(self.directory, "chunk_*.npz")):
+            with np.load(fname) as chunk:
+                if len(chunk["episode"]):
+                    last = max(last, int(chunk["episode"].max()))
+        return last + 1
+
+    def _allocate(self, n_sensors):
+        """
+        Allocate the column arrays of a new chunk.
+
+        Args:
+            n_sensors (int): Number of values in the state of the car.
+        """
+        self.columns = {name: np.zeros(self.chunk_size, dtype=dtype) for name, dtype in COLUMNS.items()}
+        self.columns["sensors"] = np.zeros((self.chunk_size, n_sensors), dtype=np.float32)
+        self.size = 0
+
+    def record(self, car, action, reward, done, state):
+        """
+        Record one step.
+
+        Args:
+            car (Car): The car after the step.
+            action (int): The action taken.
+            reward (float): The reward received.
+            done (bool): Whether the episode ended.
+            state (list): The state of the car after the step.
+        """
+        if self.columns is None:
+            self._allocate(len(state))
+        i = self.size
+        c = self.columns
+        c["episode"][i] = self.episode
+        c["step"][i] = self.step
+        c["x"][i] = car.x
+        c["y"][i] = car.y
+        # The angle of the car is unbounded, the heading fits in the column
+        c["angle"][i] = car.angle % 360
+        c["checkpoint"][i] = car.next_checkpoint
+        c["action"][i] = action
+        c["reward"][i] = reward
+        c["done"][i] = done
+        c["sensors"][i] = state
+        self.size += 1
+        self.step += 1
+        if self.size == self.chunk_size:
+            self.flush()
+
+    def end_episode(self):
+        """
+        Start a new episode if the current one has recorded steps.
+        """
+        if self.step:
+            self.episode += 1
+            self.step = 0
+
+    def flush(self):
+        """
+        Hand the buffered steps to the background writer.
+
+        Raises:
+            Exception: The exception the background writer raised on a previous chunk, if any.
+        """
+        if self.error is not None:
+            raise self.error
+        if self.columns is None or self.size == 0:
+            return
+        columns = {name: values[:self.size] for name, values in self.columns.items()}
+        self.queue.put((self.chunk, columns))
+        self.chunk += 1
+        self._allocate(columns["sensors"].shape[1])
+
+    def close(self):
+        """
+        Write the remaining steps and wait for the background writer to finish.
+
+        Raises:
+            Exception: The exception the background writer raised, if any.
+        """
+        try:
+            self.flush()
+        finally:
+            self.queue.put(None)
+            self.writer.join()
+        if self.error is not None:
+            raise self.error
+
+    def _write_chunks(self):
+        """
+        Compress the chunks handed over by flush until close is called.
+
+        After a failed write the remaining chunks are dropped, but the queue is
+        still drained so flush and close never block on a full queue.
+        """
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            if self.error is not None:
+                continue
+            chunk, columns = item
+            try:
+                np.savez_compressed(os.path.join(self.directory, f"chunk_{chunk:06d}.npz"), **columns)
+            except Exception as e:
+                self.error = e
+
+
+class TrajectoryReplayer:
+    """Reads recorded trajectories and re-renders them offline."""
+
+    def __init__(self, directory):
+        """
+        Initialize the replayer.
+
+        Only the episode column of every chunk is read here, the other
+        columns are decompressed when an episode is loaded.
+
+        Args:
+            directory (str): Directory the chunk files were written to.
+        """
+        self.chunks = sorted(glob.glob(os.path.join(directory, "chunk_*.npz")))
+        self.metadata = {}
+        if os.path.exists(os.path.join(directory, "metadata.json")):
+            with open(os.path.join(directory, "metadata.json")) as f:
+                self.metadata = json.load(f)
+        self.index = {}
+        for fname in self.chunks:
+            with np.load(fname) as chunk:
+                for episode in np.unique(chunk["episode"]):
+                    self.index.setdefault(int(episode), []).append(fname)
+
+    def episodes(self):
+        """
+        Get the ids of the recorded episodes.
+
+        Returns:
+            list: The sorted episode ids.
+        """
+        return sorted(self.index)
+
+    def load_episode(self, episode):
+        """
+        Load every column of one episode.
+
+        Args:
+            episode (int): Id of the episode.
+
+        Returns:
+            dict: Column names mapped to arrays, one row per step.
+        """
+        parts = []
+        for fname in self.index[episode]:
+            with np.load(fname) as chunk:
+                rows = chunk["episode"] == episode
+                parts.append({name: chunk[name][rows] for name in chunk.files})
+        return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+    def replay(self, episode, speed=1.0, fps=60, debugging=True):
+        """
+        Re-render a recorded episode in the pygame window.
+
+        Args:
+            episode (int): Id of the episode.
+            speed (float): Number of recorded steps shown per frame.
+            fps (int): Frames per second of the window.
+            debugging (bool): Whether to draw the cameras and the reward.
+        """
+        import pygame
+        from DataLoader import DEFAULT_MAP
+        from Environment import Environment
+        from Sensors import SensorSpec
+
+        data = self.load_episode(episode)
+        game = Environment(debugging=debugging, sensors=SensorSpec(**self.metadata.get("sensors", {})),
+                           map_file=self.metadata.get("map_file", DEFAULT_MAP))
+        position = 0.0
+        while position < len(data["step"]):
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    return
+
+            i = int(position)
+            game.car.x = float(data["x"][i])
+            game.car.y = float(data["y"][i])
+            game.car.angle = int(data["angle"][i])
+            game.car.next_checkpoint = int(data["checkpoint"][i])
+            game.car.camera_distances = data["sensors"][i].tolist()
+            game.render(int(data["action"][i]), float(data["reward"][i]), 0)
+            game.clock.tick(fps)
+            position += speed
+
@@ -0,0 +1,361 @@
+import math
+import os
+import numpy as np
+from DataLoader import DEFAULT_MAP
+
+# Maximum number of pixels a random pose is offset from its checkpoint
+POSE_NOISE = 20
+
+# Distance the distance field is clamped to, the default of DistanceField.load_or_build
+FIELD_MAX_DISTANCE = 60
+
+
+def golden_file(map_file):
+    """
+    Get the file the golden outputs of a track are saved to.
+
+    Args:
+        map_file (str): File name of the track.
+
+    Returns:
+        str: The golden file, next to the track.
+    """
+    return os.path.splitext(map_file)[0] + ".golden.npz"
+
+
+def random_poses(game, n, seed=0):
+    """
+    Sample random poses of the car along the track.
+
+    Every pose is near a random checkpoint, the next checkpoint of the car being
+    that checkpoint or the one after, so some poses capture checkpoints and some
+    collide with the walls.
+
+    Args:
+        game (Environment): The environment of the track.
+        n (int): Number of poses.
+        seed (int): Seed of the poses.
+
+    Returns:
+        dict: The x, y, angle, next_checkpoint and action arrays of the poses.
+    """
+    rng = np.random.default_rng(seed)
+    index = rng.integers(1, len(game.checkpoints), size=n)
+    centres = np.array([game.checkpoints[i].position for i in index], dtype=np.float64)
+    offsets = rng.uniform(-POSE_NOISE, POSE_NOISE, size=(n, 2))
+    return {"x": centres[:, 0] + offsets[:, 0],
+            "y": centres[:, 1] + offsets[:, 1],
+            "angle": rng.integers(360, size=n),
+            "next_checkpoint": index + rng.integers(2, size=n),
+            "action": rng.integers(len(game.car.actions), size=n)}
+
+
+def set_pose(game, poses, i):
+    """
+    Put the car of an environment at a recorded pose, at the start of its first lap.
+
+    Args:
+        game (Environment): The environment.
+        poses (dict): Poses returned by random_poses.
+        i (int): Index of the pose.
+    """
+    car = game.car
+    car.x = float(poses["x"][i])
+    car.y = float(poses["y"][i])
+    car.angle = int(poses["angle"][i])
+    car.next_checkpoint = int(poses["next_checkpoint"][i])
+    car.speed = 0
+    game.lap = 0
+
+
+# The baseline engines below are frozen copies of the original scalar code of
+# Car, before the camera tables, the precomputed wall geometry and the parallel
+# tolerance. They do not call the Car methods being optimized, so the golden
+# outputs they record pin the original semantics rather than the current code.
+
+def _baseline_rotate(origin, point, angle):
+    """Rotate a point counterclockwise around an origin by an angle in degrees."""
+    ox, oy = origin
+    px, py = point
+    rad = math.radians(angle)
+    return (ox + math.cos(rad) * (px - ox) + math.sin(rad) * (py - oy),
+            oy - math.sin(rad) * (px - ox) + math.cos(rad) * (py - oy))
+
+
+def _baseline_cameras(car):
+    """Start and end of every camera, rotated one by one."""
+    import pygame
+
+    c = car.get_centre()
+    rect = pygame.Rect(car.x, car.y, car.size[0], car.size[1])
+    for angle in car.camera_angles:
+        end = _baseline_rotate(c, (c[0], c[1] - car.MAX_CAMERA_DISTANCE), angle)
+        _, start = rect.clipline(c, end)
+        yield _baseline_rotate(c, start, car.angle), _baseline_rotate(c, end, car.angle)
+
+
+def _baseline_intersection(p1, p2, p3, p4):
+    """Intersection point of two segments, None if they are exactly parallel or do not cross."""
+    (x1, y1), (x2, y2), (x3, y3), (x4, y4) = p1, p2, p3, p4
+    denom = (y4 - y3) * (x2 - x1) - (x4 - x3) * (y2 - y1)
+    if denom == 0:
+        return None
+    ua = ((x4 - x3) * (y1 - y3) - (y4 - y3) * (x1 - x3)) / denom
+    ub = ((x2 - x1) * (y1 - y3) - (y2 - y1) * (x1 - x3)) / denom
+    if ua < 0 or ua > 1 or ub < 0 or ub > 1:
+        return None
+    return x1 + ua * (x2 - x1), y1 + ua * (y2 - y1)
+
+
+def _baseline_distances(car, nearest=False):
+    """
+    Camera distances, each camera stopping at the first wall in list order it
+    crosses, or at the nearest wall it crosses if nearest is set.
+    """
+    output = []
+    centre = car.get_centre()
+    for camera_s, camera_e in _baseline_cameras(car):
+        max_distance = car.MAX_CAMERA_DISTANCE - math.dist(centre, camera_s)
+        d = math.dist(camera_s, camera_e)
+        for x1, y1, x2, y2 in car.walls:
+            hit = _baseline_intersection((x1, y1), (x2, y2), camera_s, camera_e)
+            if hit:
+                d = min(d, math.dist(camera_s, hit))
+                if not nearest:
+                    break
+        output.append(min(round(d / max_distance, 2), 1))
+    return output
+
+
+def _baseline_raytrace(game, action):
+    """Camera distances of the pose."""
+    return _baseline_distances(game.car)
+
+
+def _baseline_move(game, action):
+    """Pose after one action, and the distance travelled."""
+    car = game.car
+    speed, angle_change = car.actions[action]
+    angle = car.angle + angle_change
+    x = car.x - speed * math.sin(math.radians(angle))
+    y = car.y - speed * math.cos(math.radians(angle))
+    return [x, y, angle, math.dist((car.x, car.y), (x, y))]
+
+
+def _baseline_collision(game, action):
+    """Collision of the pose from the camera distances."""
+    from Car import COLLISION_THRESHOLD
+
+    return [any(d < COLLISION_THRESHOLD for d in _baseline_distances(game.car))]
+
+
+def _baseline_nearest_collision(game, action):
+    """Collision of the pose from the distances of the cameras to the nearest walls."""
+    from Car import COLLISION_THRESHOLD
+
+    return [any(d < COLLISION_THRESHOLD for d in _baseline_distances(game.car, nearest=True))]
+
+
+def _exact_clearance(game, action):
+    """
+    Smallest exact signed distance of the outline of the car to the walls,
+    positive on the track by the even-odd rule and clamped as the field.
+    """
+    car = game.car
+    walls = np.asarray(car.walls, dtype=np.float64)
+    x1, y1, x2, y2 = walls.T
+    dx, dy = x2 - x1, y2 - y1
+    length_sq = dx * dx + dy * dy
+    cx, cy = car.get_centre()
+    rad = math.radians(car.angle)
+    clearance = math.inf
+    for ox, oy in car.outline:
+        x = cx + math.cos(rad) * ox + math.sin(rad) * oy
+        y = cy - math.sin(rad) * ox + math.cos(rad) * oy
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t = np.where(length_sq > 0, np.clip(((x - x1) * dx + (y - y1) * dy) / length_sq, 0, 1), 0)
+            # Walls crossed by a ray going right from the point
+            crossed = (np.minimum(y1, y2) <= y) & (y < np.maximum(y1, y2))
+            x_cross = x1 + (y - y1) * dx / dy
+        distance = min(float(np.hypot(x - x1 - t * dx, y - y1 - t * dy).min()), FIELD_MAX_DISTANCE)
+        on_track = np.count_nonzero(crossed & (x_cross >= x)) % 2 == 1
+        clearance = min(clearance, distance if on_track else -distance)
+    return [clearance]
+
+
+def _raytrace(method):
+    """Engine returning the camera distances of the pose with a Car method."""
+    return lambda game, action: getattr(game.car, method)()
+
+
+def _move(game, action):
+    """Pose after one action, and the distance travelled."""
+    distance = game.car.move(action)
+    return [game.car.x, game.car.y, game.car.angle, distance]
+
+
+def _is_collision(game, action):
+    """Collision of the pose from the full camera distances."""
+    return [game.car.is_collision(game.car.raytrace_cameras())]
+
+
+def _check_collision(game, action):
+    """Collision of the pose from the early exit camera test."""
+    return [game.car.check_collision()]
+
+
+def _field_clearance(game, action):
+    """Smallest distance field value of the outline of the car, see Car.field_collision."""
+    return [game.car.outline_clearance()]
+
+
+def _checkpoint(game, action):
+    """Captured checkpoint index of the pose, and the next checkpoint of the car after it."""
+    captured = game.get_captured_checkpoint(game.car, game.car.next_checkpoint)
+    return [captured, game.car.next_checkpoint]
+
+
+# Implementations of every checked function: the reference, whose outputs are
+# recorded, comes first and the engines checked against it follow. A faster
+# engine is added here, or with register_engine, and checked with check_golden.
+# check_collision stops at any wall near a camera, so it is checked against the
+# nearest walls rather than against the first wall in list order of the cameras.
+# field_collision thresholds the outline clearance, checked against the exact
+# geometry. The checkpoint reference is the current code, the baseline one only
+# differs by the lap it does not count, which random poses do not see.
+ENGINES = {
+    "raytrace": {"baseline": _baseline_raytrace, "scalar": _raytrace("raytrace_cameras_scalar"),
+                 "vectorized": _raytrace("raytrace_cameras")},
+    "move": {"baseline": _baseline_move, "scalar": _move},
+    "collision": {"baseline": _baseline_collision, "is_collision": _is_collision},
+    "nearest_collision": {"baseline": _baseline_nearest_collision, "check_collision": _check_collision},
+    "clearance": {"exact": _exact_clearance, "field_collision": _field_clearance},
+    "checkpoint": {"scalar": _checkpoint},
+}
+
+# Absolute tolerance of every checked function. The camera distances are rounded
+# to 0.01, so engines may round a distance at the boundary the other way. The
+# distance field is sampled at the centre of the cell of a point, at most half a
+# cell diagonal away, and the signed distance changes no faster than the position
+TOLERANCES = {"raytrace": 0.01, "move": 1e-9, "collision": 0, "nearest_collision": 0,
+              "clearance": math.sqrt(0.5) + 1e-3, "checkpoint": 0}
+
+
+def register_engine(function, name, engine):
+    """
+    Add an alternate implementation of a checked function.
+
+    Args:
+        function (str): Name of the checked function, a key of ENGINES.
+        name (str): Name of the engine.
+        engine (callable): Called with the environment, its car at the pose, and the
+            action of the pose. Returns the outputs of the pose as a list of numbers.
+    """
+    ENGINES[function][name] = engine
+
+
+def record_golden(map_file=DEFAULT_MAP, poses=10000, seed=0):
+    """
+    Record the outputs of the reference implementations on random poses.
+
+    Args:
+        map_file (str): File name of the track.
+        poses (int): Number of random poses.
+        seed (int): Seed of the poses.
+
+    Returns:
+        dict: The poses and the reference outputs of every function, one row per pose.
+    """
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    from Environment import Environment
+
+    # The distance field is loaded for the clearance engines
+    game = Environment(headless=True, map_file=map_file, collision="field")
+    golden = random_poses(game, poses, seed)
+    for function, engines in ENGINES.items():
+        reference = next(iter(engines.values()))
+        outputs = []
+        for i in range(poses):
+            set_pose(game, golden, i)
+            outputs.append(reference(game, int(golden["action"][i])))
+        golden[function] = np.array(outputs, dtype=np.float64)
+    return golden
+
+
+def save_golden(fname, golden):
+    """
+    Save golden outputs.
+
+    Args:
+        fname (str): File name, see golden_file.
+        golden (dict): Golden outputs returned by record_golden.
+    """
+    np.savez_compressed(fname, **golden)
+
+
+def load_golden(fname):
+    """
+    Load golden outputs saved with save_golden.
+
+    Args:
+        fname (str): File name, see golden_file.
+
+    Returns:
+        dict: The poses and the reference outputs.
+    """
+    with np.load(fname) as f:
+        return {name: f[name] for name in f.files}
+
+
+def check_golden(golden, map_file=DEFAULT_MAP, functions=None, engines=None):
+    """
+    Check every engine against golden outputs.
+
+    Args:
+        golden (dict): Golden outputs returned by record_golden or load_golden.
+        map_file (str): File name of the track the outputs were recorded on.
+        functions (list): Names of the checked functions, all of ENGINES by default.
+        engines (list): Names of the checked engines, all of them by default.
+
+    Returns:
+        list: One result per function and engine, with the number of poses and of
+            mismatching poses, the largest error and whether the engine passed, every
+            pose being within tolerance.
+    """
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    from Environment import Environment
+
+    game = Environment(headless=True, map_file=map_file, collision="field")
+    n = len(golden["x"])
+    results = []
+    for function in functions or ENGINES:
+        expected = golden[function]
+        for name, engine in ENGINES[function].items():
+            if engines is not None and name not in engines:
+                continue
+            outputs = []
+            for i in range(n):
+                set_pose(game, golden, i)
+                outputs.append(engine(game, int(golden["action"][i])))
+            error = np.abs(np.array(outputs, dtype=np.float64) - expected).max(axis=1)
+            mismatches = int(np.count_nonzero(error > TOLERANCES[function]))
+            results.append({"function": function, "engine": name, "poses": n, "mismatches": mismatches,
+                            "max_error": float(error.max()), "passed": mismatches == 0})
+    return results
+
+
+def format_regression_table(results):
+    """
+    Format regression check results as a plain text table.
+
+    Args:
+        results (list): Results returned by check_golden.
+
+    Returns:
+        str: The formatted table.
+    """
+    lines = ["function           engine           poses  mismatches  max error  result"]
+    for r in results:
+        lines.append(f"{r['function']:<17}  {r['engine']:<15}  {r['poses']:>5}  {r['mismatches']:>10}"
+                     f"  {r['max_error']:>9.2g}  {'ok' if r['passed'] else 'FAILED'}")
+    return "\n".join(lines)
@@ -1,3 +1,4 @@
+import copy
 import numpy as np
 
 
@@ -24,11 +25,11 @@ class ReplayBuffer(object):
         # Whether the actions are discrete or continuous
         self.discrete = discrete
 
-        # Memory for storing states
-        self.state_memory = np.zeros((self.mem_size, input_shape))
+        # Memory for storing states, in float32 like the network inputs to halve the footprint
+        self.state_memory = np.zeros((self.mem_size, input_shape), dtype=np.float32)
 
         # Memory for storing new states
-        self.new_state_memory = np.zeros((self.mem_size, input_shape))
+        self.new_state_memory = np.zeros((self.mem_size, input_shape), dtype=np.float32)
 
         # Data type for storing actions
         dtype = np.int8 if self.discrete else np.float32
@@ -37,7 +38,7 @@ class ReplayBuffer(object):
         self.action_memory = np.zeros((self.mem_size, n_actions), dtype=dtype)
 
         # Memory for storing rewards
-        self.reward_memory = np.zeros(self.mem_size)
+        self.reward_memory = np.zeros(self.mem_size, dtype=np.float32)
 
         # Memory for storing terminal flags
         self.terminal_memory = np.zeros(self.mem_size, dtype=np.float32)
@@ -75,6 +76,98 @@ class ReplayBuffer(object):
         # Increment the memory counter
         self.mem_cntr += 1
 
+    def store_batch(self, states, actions, rewards, states_, dones):
+        """
+        Store a batch of transitions in the buffer with vectorized writes.
+
+        Args:
+            states (ndarray): Current states, one row per transition.
+            actions (ndarray): Taken actions, indices if the actions are discrete.
+            rewards (ndarray): Received rewards.
+            states_ (ndarray): New states.
+            dones (ndarray): Whether each episode is done.
+        """
+        n = len(states)
+        # Only the last mem_size transitions of a large batch would survive
+        if n > self.mem_size:
+            self.mem_cntr += n - self.mem_size
+            states, actions, rewards, states_, dones = (
+                a[-self.mem_size:] for a in (states, actions, rewards, states_, dones))
+            n = self.mem_size
+
+        # Indices of the batch in the ring, wrapping around the end of the buffer
+        index = (self.mem_cntr + np.arange(n)) % self.mem_size
+
+        self.state_memory[index] = states
+        self.new_state_memory[index] = states_
+
+        if self.discrete:
+            # Store one hot encoding of the actions
+            self.action_memory[index] = 0
+            self.action_memory[index, np.asarray(actions, dtype=int)] = 1
+        else:
+            self.action_memory[index] = actions
+
+        self.reward_memory[index] = rewards
+        self.terminal_memory[index] = 1 - np.asarray(dones, dtype=np.float32)
+
+        self.mem_cntr += n
+
+    def split(self, n_shards):
+        """
+        Split the buffer into shards over disjoint slices of its arrays.
+
+        Every shard is a ReplayBuffer with its own ring and counter, so each can
+        have its own writer, while the transitions stay in the arrays of this buffer.
+
+        Args:
+            n_shards (int): Number of shards, it must divide mem_size.
+
+        Returns:
+            list: The shards, shard i over slots [i * mem_size / n_shards, (i + 1) * mem_size / n_shards).
+        """
+        if self.mem_size % n_shards:
+            raise ValueError(f"{n_shards} shards do not divide a buffer of {self.mem_size} transitions")
+        size = self.mem_size // n_shards
+        shards = []
+        for i in range(n_shards):
+            shard = copy.copy(self)
+            shard.mem_size = size
+            shard.mem_cntr = 0
+            for name, value in vars(self).items():
+                if isinstance(value, np.ndarray):
+                    setattr(shard, name, value[i * size:(i + 1) * size])
+            shards.append(shard)
+        return shards
+
+    def stored_indices(self):
+        """
+        Get the slots of the stored transitions.
+
+        Returns:
+            numpy.ndarray: The slots, oldest transition first.
+        """
+        max_mem = min(self.mem_cntr, self.mem_size)
+        return (self.mem_cntr - max_mem + np.arange(max_mem)) % self.mem_size
+
+    def save(self, fname, order=None):
+        """
+        Save the stored transitions to a compressed file.
+
+        Args:
+            fname (str): File name of the dump.
+            order (numpy.ndarray): Slots to save, the stored transitions oldest first by default.
+        """
+        # Oldest transition first, so the dump can be replayed in order
+        if order is None:
+            order = self.stored_indices()
+        actions = self.action_memory[order]
+        if self.discrete:
+            actions = np.argmax(actions, axis=1)
+        np.savez_compressed(fname, states=self.state_memory[order], actions=actions,
+                            rewards=self.reward_memory[order], states_=self.new_state_memory[order],
+                            dones=1 - self.terminal_memory[order])
+
     def sample_buffer(self, batch_size):
         """
         Sample a batch from the buffer.
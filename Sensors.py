@@ -0,0 +1,58 @@
+class SensorSpec:
+    """Description of the sensors of the car and of the state they produce."""
+
+    def __init__(self, n_rays=7, fov=180, max_distance=60, velocity=False, heading=False):
+        """
+        Initialize the SensorSpec.
+
+        The default spec is the original sensor array: 7 cameras of 60 pixels
+        spread every 30 degrees from the left to the right of the car.
+
+        Args:
+            n_rays (int): Number of cameras.
+            fov (float): Angle in degrees between the leftmost and the rightmost camera.
+            max_distance (float): Length of the cameras in pixels from the center of the car.
+            velocity (bool): Whether the state includes the speed of the car.
+            heading (bool): Whether the state includes the sine and cosine of the car angle.
+        """
+        self.n_rays = n_rays
+        self.fov = fov
+        self.max_distance = max_distance
+        self.velocity = velocity
+        self.heading = heading
+
+    def as_dict(self):
+        """
+        Get the keyword arguments this spec was created with.
+
+        Returns:
+            dict: The keyword arguments of SensorSpec.
+        """
+        return {"n_rays": self.n_rays, "fov": self.fov, "max_distance": self.max_distance,
+                "velocity": self.velocity, "heading": self.heading}
+
+    def __repr__(self):
+        return (f"SensorSpec(n_rays={self.n_rays}, fov={self.fov}, max_distance={self.max_distance}, "
+                f"velocity={self.velocity}, heading={self.heading})")
+
+    def camera_angles(self):
+        """
+        Get the angle of every camera relative to the front of the car.
+
+        Returns:
+            list: Angles in degrees, from the leftmost to the rightmost camera.
+        """
+        if self.n_rays == 1:
+            return [0]
+        step = self.fov / (self.n_rays - 1)
+        return [-self.fov / 2 + i * step for i in range(self.n_rays)]
+
+    @property
+    def size(self):
+        """
+        Get the number of values the sensors add to the state.
+
+        Returns:
+            int: The size of the sensor state.
+        """
+        return self.n_rays + int(self.velocity) + 2 * int(self.heading)
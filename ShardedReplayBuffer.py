@@ -0,0 +1,137 @@
+import numpy as np
+from ReplayBuffer import ReplayBuffer
+
+
+class ShardedReplayBuffer(object):
+    """
+    Replay buffer split into shards that concurrent collectors write without locks.
+
+    Every collector owns one shard, a ReplayBuffer with its own ring and counter
+    over a slice of shared arrays, and is its only writer. The learner reads the
+    shard counters without a lock and samples across the shards proportionally
+    to their fill. A shard increments its counter after writing a transition, so
+    a sample only sees complete transitions, except for a slot being overwritten
+    by a full shard while it is gathered, which replay tolerates as any old sample.
+    """
+    def __init__(self, max_size, input_shape, n_actions, n_shards=1, discrete=False):
+        """
+        Initialize the replay buffer.
+
+        Args:
+            max_size (int): Maximum size of the buffer, rounded down to a multiple of n_shards.
+            input_shape (tuple): Shape of the input state.
+            n_actions (int): Number of possible actions.
+            n_shards (int): Number of shards, one per collector.
+            discrete (bool): Whether the actions are discrete or continuous.
+        """
+        # Every shard has the same size, so the slots of shard i start at i * shard_size
+        self.shard_size = max_size // n_shards
+        self.storage = ReplayBuffer(self.shard_size * n_shards, input_shape, n_actions, discrete=discrete)
+        self.shards = self.storage.split(n_shards)
+        self.discrete = discrete
+
+    @property
+    def mem_size(self):
+        """Maximum number of transitions of all shards."""
+        return self.storage.mem_size
+
+    @property
+    def mem_cntr(self):
+        """Number of transitions written to all shards."""
+        return sum(shard.mem_cntr for shard in self.shards)
+
+    def fills(self):
+        """
+        Get the number of stored transitions of every shard.
+
+        Returns:
+            numpy.ndarray: The fill of every shard.
+        """
+        # Every counter is read once, so the fills are a consistent snapshot of each shard
+        return np.array([min(shard.mem_cntr, shard.mem_size) for shard in self.shards])
+
+    def store_transition(self, state, action, reward, state_, done, shard=0):
+        """
+        Store a transition in a shard.
+
+        Args:
+            state (ndarray): Current state.
+            action (int or ndarray): Taken action.
+            reward (float): Received reward.
+            state_ (ndarray): New state.
+            done (bool): Whether the episode is done.
+            shard (int): The shard of the collector.
+        """
+        self.shards[shard].store_transition(state, action, reward, state_, done)
+
+    def store_batch(self, states, actions, rewards, states_, dones, shard=0):
+        """
+        Store a batch of transitions in a shard with vectorized writes.
+
+        Args:
+            states (ndarray): Current states, one row per transition.
+            actions (ndarray): Taken actions, indices if the actions are discrete.
+            rewards (ndarray): Received rewards.
+            states_ (ndarray): New states.
+            dones (ndarray): Whether each episode is done.
+            shard (int): The shard of the collector.
+        """
+        self.shards[shard].store_batch(states, actions, rewards, states_, dones)
+
+    def save(self, fname):
+        """
+        Save the stored transitions of every shard to a compressed file.
+
+        Args:
+            fname (str): File name of the dump, in the format of ReplayBuffer.save.
+        """
+        # Shard after shard, each oldest transition first
+        order = np.concatenate([shard.stored_indices() + i * self.shard_size
+                                for i, shard in enumerate(self.shards)])
+        self.storage.save(fname, order)
+
+    def sample_indices(self, batch_size, fills=None):
+        """
+        Sample slots across the shards, proportionally to their fill.
+
+        The stored transitions of all shards are laid end to end and split into
+        batch_size equal strata, with one uniform sample per stratum. Each sample
+        is mapped to its shard with a binary search of the cumulative fills.
+
+        Args:
+            batch_size (int): Size of the batch.
+            fills (numpy.ndarray): Fill of every shard, read from the shards by default.
+
+        Returns:
+            numpy.ndarray: The sampled slots of the shared arrays.
+        """
+        if fills is None:
+            fills = self.fills()
+        ends = np.cumsum(fills)
+        total = ends[-1]
+
+        # Stratified positions in [0, total), one per stratum
+        positions = ((np.arange(batch_size) + np.random.random(batch_size)) * (total / batch_size)).astype(np.int64)
+        positions = np.minimum(positions, total - 1)
+
+        # Shard of every position, and its slot in the ring of the shard
+        shard = np.searchsorted(ends, positions, side="right")
+        local = positions - (ends - fills)[shard]
+        return shard * self.shard_size + local
+
+    def sample_buffer(self, batch_size):
+        """
+        Sample a batch across the shards.
+
+        Args:
+            batch_size (int): Size of the batch.
+
+        Returns:
+            tuple: Tuple containing states, actions, rewards,
+                   next states, and terminal flags.
+        """
+        # The batch is ordered by shard, which one gradient step on the whole batch does not mind
+        batch = self.sample_indices(batch_size)
+        storage = self.storage
+        return (storage.state_memory[batch], storage.action_memory[batch], storage.reward_memory[batch],
+                storage.new_state_memory[batch], storage.terminal_memory[batch])
@@ -0,0 +1,218 @@
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import random
+import statistics
+import numpy as np
+
+# Default search space, every value is either a list of choices or a
+# {"low": ..., "high": ...} range, sampled log-uniformly when "log" is true and
+# as integers when "int" is true or both bounds are integers
+DEFAULT_SPACE = {
+    "alpha": {"low": 1e-4, "high": 1e-2, "log": True},
+    "gamma": [0.95, 0.99],
+    "batch_size": [128, 256, 512],
+    "mem_size": [10000, 25000, 50000],
+    "replace_target": [500, 2000, 5000],
+    "epsilon_dec": [0.999, 0.9995, 0.9997],
+    "epsilon_min": [0.01, 0.05, 0.10],
+}
+
+# Index of the current worker process, used to pin it to its own CPUs
+_worker_index = None
+
+
+def grid_search(space):
+    """
+    Enumerate every combination of the choices of a search space.
+
+    Args:
+        space (dict): Hyperparameter names mapped to lists of choices.
+
+    Returns:
+        list: One config dict per combination.
+
+    Raises:
+        ValueError: If a hyperparameter is a range instead of a list of choices.
+    """
+    names = list(space)
+    for name in names:
+        if not isinstance(space[name], list):
+            raise ValueError(f"Grid search needs a list of choices for {name}, got {space[name]}")
+    return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+
+def random_search(space, n_trials, seed=0):
+    """
+    Sample random configs from a search space.
+
+    Args:
+        space (dict): Hyperparameter names mapped to a list of choices or a
+            {"low": ..., "high": ..., "log": ..., "int": ...} range. A range samples
+            integers if "int" is set, by default if both of its bounds are integers.
+        n_trials (int): Number of configs to sample.
+        seed (int): Seed of the sampler.
+
+    Returns:
+        list: The sampled config dicts.
+    """
+    rng = random.Random(seed)
+    configs = []
+    for _ in range(n_trials):
+        config = {}
+        for name, values in space.items():
+            if isinstance(values, list):
+                config[name] = rng.choice(values)
+                continue
+            low, high = values["low"], values["high"]
+            integer = values.get("int", isinstance(low, int) and isinstance(high, int))
+            if values.get("log", False):
+                value = math.exp(rng.uniform(math.log(low), math.log(high)))
+                # Rounded, then clamped as the rounding can leave the range of non-integer bounds
+                config[name] = min(max(round(value), math.ceil(low)), math.floor(high)) if integer else value
+            elif integer:
+                config[name] = rng.randint(math.ceil(low), math.floor(high))
+            else:
+                config[name] = rng.uniform(low, high)
+        configs.append(config)
+    return configs
+
+
+def _init_worker(counter, threads):
+    """
+    Pin a sweep worker process to its own CPUs and limit its TensorFlow threads.
+
+    Args:
+        counter (multiprocessing.Value): Shared counter handing out worker indices.
+        threads (int): Number of CPUs and TensorFlow threads per worker.
+    """
+    global _worker_index
+    with counter.get_lock():
+        _worker_index = counter.value
+        counter.value += 1
+
+    if hasattr(os, "sched_setaffinity"):
+        cpus = sorted(os.sched_getaffinity(0))
+        first = (_worker_index * threads) % len(cpus)
+        os.sched_setaffinity(0, {cpus[(first + i) % len(cpus)] for i in range(threads)})
+
+    from Brain import configure_threads
+
+    configure_threads(threads, 1)
+
+
+def should_stop(board, trial, episode, grace):
+    """
+    Median stopping rule: stop a trial whose best completion so far is below
+    the median of the other trials at the same episode.
+
+    Args:
+        board (dict): Trial ids mapped to their best completion after every episode.
+        trial (int): Id of the trial.
+        episode (int): Number of episodes played by the trial.
+        grace (int): Number of episodes every trial plays before it can be stopped.
+
+    Returns:
+        bool: True if the trial should stop.
+    """
+    if episode < grace:
+        return False
+    others = [curve[episode - 1] for other, curve in board.items() if other != trial and len(curve) >= episode]
+    if len(others) < 2:
+        return False
+    return board[trial][episode - 1] < statistics.median(others)
+
+
+def train_trial(trial, config, episodes=300, max_steps=5000, grace=50, board=None):
+    """
+    Train an agent headless with a config and record its learning curve.
+
+    Args:
+        trial (int): Id of the trial.
+        config (dict): Agent arguments overriding the defaults of build_agent.
+        episodes (int): Maximum number of episodes.
+        max_steps (int): Maximum number of simulation steps per episode.
+        grace (int): Number of episodes played before the trial can be stopped early.
+        board (dict): Shared learning curves of all trials, used for early stopping.
+
+    Returns:
+        dict: The trial id, config, per-episode scores and completions and whether it was stopped.
+    """
+    from Environment import Environment
+    from selfDrivingCarRL import build_agent
+
+    game = Environment(headless=True)
+    agent = build_agent(True, input_dims=game.observation_size, **config)
+    scores, completions, best = [], [], []
+    stopped = False
+
+    for n_games in range(1, episodes + 1):
+        game.reset()
+        score = 0
+        state = np.array(game.observe())
+        done = False
+        while not done and game.steps < max_steps:
+            action = agent.get_action(state)
+            reward, done = game.step(action)
+            state_ = np.array(game.car.get_state())
+            agent.remember(state, action, reward, state_, int(done))
+            state = state_
+            agent.learn()
+            score = max(game.last_reward, score)
+
+        scores.append(score)
+        completions.append(game.get_completion())
+        best.append(max(completions))
+        if board is not None:
+            board[trial] = best
+            if should_stop(board, trial, n_games, grace):
+                stopped = True
+                break
+
+    return {"trial": trial, "config": config, "scores": scores, "completions": completions,
+            "best": best[-1], "stopped": stopped}
+
+
+def _train_trial(task):
+    """Unpack a task tuple for Pool.imap_unordered."""
+    trial, config, kwargs = task
+    return train_trial(trial, config, **kwargs)
+
+
+def sweep(configs, results_file, workers=None, threads=1, **kwargs):
+    """
+    Train one headless agent per config across a process pool.
+
+    Every finished trial is appended as one JSON line to the results file.
+
+    Args:
+        configs (list): Agent configs, see grid_search and random_search.
+        results_file (str): File the learning curves are appended to.
+        workers (int): Number of worker processes, defaults to the number of CPUs divided by threads.
+        threads (int): Number of CPUs and TensorFlow threads per worker.
+        **kwargs: Extra keyword arguments passed to train_trial.
+
+    Returns:
+        list: The results of every trial, sorted from best to worst.
+    """
+    if workers is None:
+        workers = max(1, (os.cpu_count() or 1) // threads)
+
+    # TensorFlow is not fork-safe, so workers are always spawned
+    ctx = multiprocessing.get_context("spawn")
+    counter = ctx.Value("i", 0)
+    results = []
+    with ctx.Manager() as manager:
+        kwargs["board"] = manager.dict()
+        tasks = [(trial, config, kwargs) for trial, config in enumerate(configs)]
+        with ctx.Pool(workers, initializer=_init_worker, initargs=(counter, threads)) as pool:
+            with open(results_file, "a") as f:
+                for result in pool.imap_unordered(_train_trial, tasks):
+                    f.write(json.dumps(result) + "\n")
+                    f.flush()
+                    results.append(result)
+                    print("Trial", result["trial"], "best completion", round(result["best"], 3),
+                          "stopped early" if result["stopped"] else "", result["config"])
+    return sorted(results, key=lambda r: -r["best"])
@@ -0,0 +1,193 @@
+import math
+import numpy as np
+
+# Colors of the original background image
+GRASS_COLOR = (111, 139, 80)
+ROAD_COLOR = (75, 74, 74)
+CURB_COLOR = (255, 255, 255)
+
+# Empty border around the track in pixels
+MARGIN = 50
+
+
+def centerline(rng, segments, complexity, roughness, aspect=1.4):
+    """
+    Sample a random smooth closed loop.
+
+    The loop is a unit circle whose radius is perturbed by random harmonics,
+    stretched horizontally and resampled to equally spaced points.
+
+    Args:
+        rng (numpy.random.Generator): Random generator.
+        segments (int): Number of points of the loop.
+        complexity (int): Number of harmonics, more harmonics give more turns.
+        roughness (float): Amplitude of the harmonics relative to the radius.
+        aspect (float): Horizontal stretch of the loop.
+
+    Returns:
+        numpy.ndarray: The (segments, 2) points of the loop.
+    """
+    # Densely sampled polar curve
+    theta = np.linspace(0, 2 * np.pi, 8 * segments, endpoint=False)
+    r = np.ones_like(theta)
+    for k in range(2, complexity + 2):
+        r += rng.uniform(-1, 1) * roughness / math.sqrt(k - 1) * np.sin(k * theta + rng.uniform(0, 2 * np.pi))
+    r = np.maximum(r, 0.2)
+    dense = np.stack([aspect * r * np.cos(theta), r * np.sin(theta)], axis=1)
+
+    # Resample at equal arc length so every segment has about the same length
+    closed = np.vstack([dense, dense[:1]])
+    arc = np.concatenate([[0], np.cumsum(np.hypot(*np.diff(closed, axis=0).T))])
+    s = np.linspace(0, arc[-1], segments, endpoint=False)
+    return np.stack([np.interp(s, arc, closed[:, 0]), np.interp(s, arc, closed[:, 1])], axis=1)
+
+
+def boundaries(points, width):
+    """
+    Offset a closed loop into the two boundaries of a track.
+
+    The loop is first rotated to start at its leftmost point heading down,
+    which is where Car.reset puts the car, 30 pixels right of the first wall.
+
+    Args:
+        points (numpy.ndarray): The (n, 2) points of the loop.
+        width (float): Width of the track in pixels.
+
+    Returns:
+        tuple: The outer and inner (n, 2) boundary points.
+    """
+    start = int(np.argmin(points[:, 0]))
+    points = np.roll(points, -start, axis=0)
+    # Drive down (+y) from the leftmost point
+    if points[1, 1] < points[0, 1]:
+        points = np.roll(points[::-1], 1, axis=0)
+
+    tangent = np.roll(points, -1, axis=0) - np.roll(points, 1, axis=0)
+    tangent /= np.hypot(tangent[:, 0], tangent[:, 1])[:, np.newaxis]
+    # Heading down at the leftmost point, the outside of the loop is on the left
+    normal = np.stack([-tangent[:, 1], tangent[:, 0]], axis=1)
+    return points + normal * width / 2, points - normal * width / 2
+
+
+def is_valid(outer, inner):
+    """
+    Check that the boundaries of a track are simple and do not touch.
+
+    Args:
+        outer (numpy.ndarray): The outer boundary points.
+        inner (numpy.ndarray): The inner boundary points.
+
+    Returns:
+        bool: True if the track is drivable.
+    """
+    from shapely.geometry import Polygon
+
+    outer_polygon, inner_polygon = Polygon(outer), Polygon(inner)
+    return (outer_polygon.is_valid and inner_polygon.is_valid
+            and outer_polygon.buffer(-1).contains(inner_polygon))
+
+
+def generate_track(segments=60, width=70, complexity=4, roughness=0.3, segment_length=None, seed=None,
+                   max_tries=100):
+    """
+    Generate a random closed track.
+
+    Args:
+        segments (int): Number of walls per boundary, and of checkpoints.
+        width (float): Width of the track in pixels.
+        complexity (int): Number of harmonics of the centerline, more harmonics give more turns.
+        roughness (float): Amplitude of the turns relative to the size of the track.
+        segment_length (float): Mean length of a wall in pixels. By default the track
+            is scaled to fit the window, with at least 4 pixels per wall.
+        seed (int): Seed of the generator.
+        max_tries (int): Number of loops sampled before giving up.
+
+    Returns:
+        tuple: The outer and inner (segments, 2) boundary points, translated to
+            positive coordinates.
+
+    Raises:
+        ValueError: If no drivable track was found, typically because the track
+            is too wide for the complexity and roughness.
+    """
+    from Environment import WIDTH, HEIGHT
+
+    rng = np.random.default_rng(seed)
+    for _ in range(max_tries):
+        points = centerline(rng, segments, complexity, roughness)
+        mean_length = np.mean(np.hypot(*(np.roll(points, -1, axis=0) - points).T))
+        if segment_length is None:
+            size = points.max(axis=0) - points.min(axis=0)
+            scale = min((WIDTH - 2 * MARGIN - width) / size[0], (HEIGHT - 2 * MARGIN - width) / size[1])
+            scale = max(scale, 4 / mean_length)
+        else:
+            scale = segment_length / mean_length
+        outer, inner = boundaries(points * scale, width)
+        # Walls are stored with whole pixel coordinates
+        offset = MARGIN - np.minimum(outer.min(axis=0), inner.min(axis=0))
+        outer, inner = np.round(outer + offset), np.round(inner + offset)
+        if is_valid(outer, inner):
+            return outer, inner
+    raise ValueError(f"No drivable track found in {max_tries} tries, lower the width, complexity or roughness")
+
+
+def write_track(fname, outer, inner):
+    """
+    Write a track in the wall format of DataLoader.
+
+    The first half of the walls is the outer boundary and the second half the
+    inner boundary, wall i of both halves facing each other.
+
+    Args:
+        fname (str): File name of the track.
+        outer (numpy.ndarray): The outer boundary points.
+        inner (numpy.ndarray): The inner boundary points.
+    """
+    with open(fname, "w") as f:
+        f.write("x1,y1,x2,y2\n")
+        for boundary in (outer, inner):
+            for (x1, y1), (x2, y2) in zip(boundary, np.roll(boundary, -1, axis=0)):
+                f.write(f"{x1:.2f},{y1:.2f} {x2:.2f},{y2:.2f}\n")
+
+
+def render_background(fname, outer, inner):
+    """
+    Draw the background image of a track in the style of img/path1.png.
+
+    Args:
+        fname (str): File name of the image.
+        outer (numpy.ndarray): The outer boundary points.
+        inner (numpy.ndarray): The inner boundary points.
+    """
+    import pygame
+
+    size = np.maximum(outer.max(axis=0), inner.max(axis=0)) + MARGIN
+    surface = pygame.Surface((int(size[0]), int(size[1])))
+    surface.fill(GRASS_COLOR)
+    pygame.draw.polygon(surface, ROAD_COLOR, outer.tolist())
+    pygame.draw.polygon(surface, GRASS_COLOR, inner.tolist())
+    pygame.draw.lines(surface, CURB_COLOR, True, outer.tolist(), 2)
+    pygame.draw.lines(surface, CURB_COLOR, True, inner.tolist(), 2)
+    pygame.image.save(surface, fname)
+
+
+def generate(fname, image=True, **kwargs):
+    """
+    Generate a random track and write it with its background image.
+
+    Args:
+        fname (str): File name of the track, the image is written next to it as .png.
+        image (bool): Whether to draw the background image. Very large tracks can
+            be generated without one and used headless.
+        **kwargs: Keyword arguments passed to generate_track.
+
+    Returns:
+        tuple: The outer and inner boundary points.
+    """
+    import os
+
+    outer, inner = generate_track(**kwargs)
+    write_track(fname, outer, inner)
+    if image:
+        render_background(os.path.splitext(fname)[0] + ".png", outer, inner)
+    return outer, inner
@@ -0,0 +1,154 @@
+import queue
+import threading
+from DataLoader import DEFAULT_MAP
+
+# Commands the viewer sends to the simulation thread
+TOGGLE_MODE = "toggle_mode"
+RESET = "reset"
+QUIT = "quit"
+
+
+class Viewer:
+    """
+    Interactive pygame window decoupled from the simulation.
+
+    pygame windows must be driven from the main thread, so the viewer runs
+    there at a fixed frame rate while the simulation steps as fast as it can in
+    a background thread. After every step the simulation publishes a snapshot
+    of the car, and every frame the viewer draws the latest one on its own
+    display environment. Key presses reach the simulation as commands on a
+    thread-safe queue, polled between two steps.
+    """
+
+    def __init__(self, sensors=None, map_file=DEFAULT_MAP, debugging=False, fps=30, plotting=True):
+        """
+        Initialize the viewer and open its window.
+
+        Args:
+            sensors (SensorSpec): The sensors of the simulated car, drawn in debugging mode.
+            map_file (str): File name of the simulated track.
+            debugging (bool): Whether to start in debugging mode.
+            fps (int): Frames per second of the window.
+            plotting (bool): Whether to plot the score histories published by the simulation.
+        """
+        import pygame
+        from Environment import Environment
+
+        self.pygame = pygame
+        # Display-only environment, its car mirrors the snapshots of the simulated one
+        self.game = Environment(debugging=debugging, sensors=sensors, map_file=map_file)
+        self.clock = pygame.time.Clock()
+        self.fps = fps
+        self.plotting = plotting
+        self.commands = queue.Queue()
+        # Latest snapshot and score histories, replaced as a whole by the simulation thread
+        self.snapshot = None
+        self.scores = None
+        self.plotted = None
+        self.error = None
+
+    def publish(self, game, action, reward, epsilon):
+        """
+        Publish the state of the simulation after a step, called from the simulation thread.
+
+        Args:
+            game (Environment): The simulated environment.
+            action (int): The action taken.
+            reward (float): The reward.
+            epsilon (float): The exploration rate of the agent.
+        """
+        car = game.car
+        # A single assignment, so the viewer never sees a half-updated snapshot
+        self.snapshot = (car.x, car.y, car.angle, car.next_checkpoint, action, reward, epsilon)
+
+    def publish_scores(self, scores, mean_scores, first_game):
+        """
+        Publish the score histories after a game, called from the simulation thread.
+
+        matplotlib is not thread-safe, so the plot is drawn by the viewer.
+
+        Args:
+            scores (collections.deque): Scores of the last games.
+            mean_scores (collections.deque): Mean scores of the last games.
+            first_game (int): Number of the first game of the histories.
+        """
+        self.scores = (list(scores), list(mean_scores), first_game)
+
+    def poll(self):
+        """
+        Take the pending commands, called from the simulation thread.
+
+        Returns:
+            list: The commands sent since the last poll, oldest first.
+        """
+        commands = []
+        while True:
+            try:
+                commands.append(self.commands.get_nowait())
+            except queue.Empty:
+                return commands
+
+    def run(self, target, *args, **kwargs):
+        """
+        Run the simulation in a background thread and the window until either stops.
+
+        Args:
+            target (callable): The simulation loop, it should return when it polls QUIT.
+            *args: Positional arguments of target.
+            **kwargs: Keyword arguments of target.
+
+        Raises:
+            Exception: The exception the simulation loop raised, if any.
+        """
+        def simulate():
+            try:
+                target(*args, **kwargs)
+            except BaseException as e:
+                self.error = e
+
+        thread = threading.Thread(target=simulate, name="simulation", daemon=True)
+        thread.start()
+        try:
+            self.loop(thread)
+        finally:
+            self.commands.put(QUIT)
+            thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def loop(self, thread):
+        """
+        Handle the input and draw the latest snapshot at a fixed frame rate.
+
+        Args:
+            thread (threading.Thread): The simulation thread, the loop ends with it.
+        """
+        pygame = self.pygame
+        while thread.is_alive():
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    return
+                elif event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_t:
+                        # Switch between learning and evaluating modes
+                        self.commands.put(TOGGLE_MODE)
+                    if event.key == pygame.K_d:
+                        # Debugging mode only changes what is drawn
+                        self.game.debugging = not self.game.debugging
+                    if event.key == pygame.K_r:
+                        # Reset the game
+                        self.commands.put(RESET)
+
+            snapshot = self.snapshot
+            if snapshot is not None:
+                car = self.game.car
+                car.x, car.y, car.angle, car.next_checkpoint, action, reward, epsilon = snapshot
+                self.game.render(action, reward, epsilon)
+
+            scores = self.scores
+            if self.plotting and scores is not None and scores is not self.plotted:
+                from Helper import plot
+                plot(*scores)
+                self.plotted = scores
+
+            self.clock.tick(self.fps)
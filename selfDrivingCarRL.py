@@ -1,48 +1,88 @@
 # Import necessary libraries
-import pygame
-import numpy as np
-from Agent import Agent
-from Helper import plot
-from Environment import Environment
-
-# Initialize the game environment
-game = Environment(debugging=False)
-
-# If training is True, the agent will learn from scratch
-# If training is False, the agent will load an existing model
-training = False
+# Heavy subsystems (pygame, TensorFlow/Keras, matplotlib) are imported lazily
+# inside the functions that use them, so importing this module stays cheap
+import argparse
 
 # Constants for the agent
-REPLACE_TARGET = 25  # Frequency to update the target network
+REPLACE_TARGET = 2000  # Number of gradient steps between two target network updates
 MAX_MEMORY = 25000  # Maximum number of experiences stored in the memory
 BATCH_SIZE = 512  # Batch size for training the model
 LR = 0.001  # Learning rate for the optimizer
 
-# Initialize the agent
-agent = Agent(alpha=LR,  # Learning rate
-              gamma=0.99,  # Discount factor
-              n_actions=7,  # Number of actions
-              epsilon=1.00 if training else 0.00,  # Exploration rate
-              epsilon_min=0.10 if training else 0.00,  # Minimum exploration rate
-              epsilon_dec=0.9997,  # Exponential decay rate for exploration rate
-              replace_target=REPLACE_TARGET,  # Frequency to update the target network
-              batch_size=BATCH_SIZE,  # Batch size for training the model
-              mem_size=MAX_MEMORY,  # Maximum number of experiences stored in the memory
-              input_dims=7)  # Input dimensions for the agent
 
-# Load an existing model if not in training mode
-if not training:
-    agent.load_model()
+def build_agent(training, input_dims=7, **kwargs):
+    """
+    Create the agent and load an existing model if not in training mode.
 
+    Args:
+        training (bool): If True, the agent will learn from scratch.
+            If False, the agent will load an existing model.
+        input_dims (int): Input dimensions for the agent.
+        **kwargs: Agent arguments overriding the defaults below.
 
-def start():
+    Returns:
+        Agent: The initialized agent.
+    """
+    from Agent import Agent
+
+    config = dict(alpha=LR,  # Learning rate
+                  gamma=0.99,  # Discount factor
+                  n_actions=7,  # Number of actions
+                  epsilon=1.00 if training else 0.00,  # Exploration rate
+                  epsilon_min=0.10 if training else 0.00,  # Minimum exploration rate
+                  epsilon_dec=0.9997,  # Exponential decay rate for exploration rate
+                  replace_target=REPLACE_TARGET,  # Gradient steps between two target network updates
+                  batch_size=BATCH_SIZE,  # Batch size for training the model
+                  mem_size=MAX_MEMORY,  # Maximum number of experiences stored in the memory
+                  input_dims=input_dims)  # Input dimensions for the agent
+    config.update(kwargs)
+
+    # A model trained with a normalizer expects its preprocessed (stacked) states
+    if not training:
+        import os
+        from Normalizer import Normalizer, normalizer_file
+
+        norm_file = normalizer_file(config.get("fname", "model/model.keras"))
+        if os.path.exists(norm_file):
+            config["normalizer"] = Normalizer.load(norm_file)
+            config["input_dims"] = config["normalizer"].observation_size * config["normalizer"].n_frames
+
+    agent = Agent(**config)
+
+    # Load an existing model if not in training mode
+    if not training:
+        agent.load_model()
+
+    return agent
+
+
+def start(game, agent, training=False, plotting=True, history=None, monitor=None, memory_report_every=0,
+          viewer=None):
     """
     Starts the game and the agent.
+
+    The loop never waits for the window: with a viewer it publishes every step
+    and polls the viewer commands between steps, without one it runs headless.
+
+    Args:
+        game (Environment): The game environment.
+        agent (Agent): The agent playing the game.
+        training (bool): Whether the agent starts in learning mode.
+        plotting (bool): Whether to plot the training progress.
+        history (int): Number of games kept in the score histories, None to keep all of them.
+        monitor (MemoryMonitor): Optional memory monitor. The session is saved and stopped
+            when the process goes over its RSS limit.
+        memory_report_every (int): Number of games between two memory reports, 0 for none.
+        viewer (Viewer): Optional window showing the game, run in another thread.
     """
-    global training
+    import numpy as np
+    from Viewer import TOGGLE_MODE, RESET, QUIT
+    from collections import deque
+
     n_games = 1  # Number of games played
-    plot_scores = []  # List to store the scores of each game
-    plot_mean_scores = []  # List to store the mean scores of each game
+    laps_done = len(game.lap_times)  # Number of laps reported so far
+    plot_scores = deque(maxlen=history)  # Scores of the last games
+    plot_mean_scores = deque(maxlen=history)  # Mean scores of the last games
     total_score = 0  # Total score accumulated over all games
     record = 0  # Record score achieved
 
@@ -51,27 +91,35 @@ def start():
         """
         Switches between learning and evaluating modes.
         """
-        global training
-        nonlocal n_games, record
+        nonlocal training, record
         agent.save_model()
         training = not training
         record = 0
 
+    # Stack the last observations into the state when the normalizer asks for it
+    frames = None
+    if agent.normalizer is not None and agent.normalizer.n_frames > 1:
+        from Normalizer import FrameStack
+        frames = FrameStack(agent.normalizer.n_frames)
+
     while True:
         game.reset()  # Reset the game environment
 
         score = 0  # Initialize the game score
 
-        action = agent.get_action(game.car.raytrace_cameras())
+        state = game.observe()
+        if frames is not None:
+            state = frames.reset(state)
+        action = agent.get_action(state)
         reward, done = game.step(action)
         state_ = game.car.get_state()
-        state = np.array(state_)
+        state = np.array(state_ if frames is None else frames.push(state_))
 
         while not done:
             action = agent.get_action(state)
             reward, done = game.step(action)
             state_ = game.car.get_state()
-            state_ = np.array(state_)
+            state_ = np.array(state_ if frames is None else frames.push(state_))
 
             agent.remember(state, action, reward, state_, int(done))
             state = state_
@@ -79,26 +127,29 @@ def start():
             if training:
                 agent.learn()
 
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    return
-                elif event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_t:
+            if viewer is not None:
+                for command in viewer.poll():
+                    if command == QUIT:
+                        return
+                    elif command == TOGGLE_MODE:
                         # Switch mode
                         switch_mode()
-                    if event.key == pygame.K_d:
-                        # Set the debug mode
-                        game.debugging = not game.debugging
-                    if event.key == pygame.K_r:
+                    elif command == RESET:
                         # Reset the game
                         done = True
 
-            score = max(reward, score)
+            # the reward is summed over repeated actions, the score is the progress
+            score = max(game.last_reward, score)
 
-            game.render(action, reward, agent.epsilon)
+            if len(game.lap_times) > laps_done:
+                laps_done = len(game.lap_times)
+                stats = game.lap_statistics()
+                print('Lap', game.lap, 'in', stats['last_steps'], 'steps, best', stats['best_steps'],
+                      'mean', round(stats['steps_per_lap'], 1), 'steps/lap,',
+                      round(stats['laps_per_hour'], 1), 'laps/hour')
 
-        if n_games % REPLACE_TARGET == 0 and n_games > REPLACE_TARGET:
-            agent.update_network_parameters()
+            if viewer is not None:
+                viewer.publish(game, action, reward, agent.epsilon)
 
         if training:
             if score > record and n_games % 5 == 0:
@@ -112,12 +163,643 @@ def start():
             total_score += score
             mean_score = total_score / n_games
             plot_mean_scores.append(mean_score)
-            print(plot_scores, plot_mean_scores)
-            plot(plot_scores, plot_mean_scores)
+            print(list(plot_scores), list(plot_mean_scores))
+            if viewer is not None:
+                # matplotlib must run in the thread of the window
+                viewer.publish_scores(plot_scores, plot_mean_scores, n_games - len(plot_scores) + 1)
+            elif plotting:
+                from Helper import plot
+                plot(plot_scores, plot_mean_scores, first_game=n_games - len(plot_scores) + 1)
+
+        if monitor is not None:
+            if memory_report_every and n_games % memory_report_every == 0:
+                from MemoryMonitor import format_report
+                print(format_report(monitor.report()))
+            if monitor.over_limit():
+                from MemoryMonitor import format_report
+                print("Memory limit reached, saving the model and stopping.")
+                print(format_report(monitor.report()))
+                agent.save_model()
+                return
 
         n_games += 1
         game.reset()
 
 
+def add_sensor_arguments(parser):
+    """
+    Add the sensor spec options to a command line parser.
+
+    Args:
+        parser (argparse.ArgumentParser): The parser of a subcommand.
+    """
+    parser.add_argument("--rays", type=int, default=7, help="Number of cameras.")
+    parser.add_argument("--fov", type=float, default=180, help="Field of view of the cameras in degrees.")
+    parser.add_argument("--ray-range", type=float, default=60, help="Length of the cameras in pixels.")
+    parser.add_argument("--velocity", action="store_true", help="Add the speed of the car to the state.")
+    parser.add_argument("--heading", action="store_true", help="Add the angle of the car to the state.")
+
+
+def get_sensors(args):
+    """
+    Create the sensor spec from the parsed command line arguments.
+
+    Args:
+        args (argparse.Namespace): Parsed command line arguments.
+
+    Returns:
+        SensorSpec: The sensor spec.
+    """
+    from Sensors import SensorSpec
+
+    return SensorSpec(n_rays=args.rays, fov=args.fov, max_distance=args.ray_range,
+                      velocity=args.velocity, heading=args.heading)
+
+
+def run(args):
+    """
+    Run the interactive pygame session.
+
+    The simulation runs in a background thread and the window in the main
+    thread, so drawing and input handling do not slow down training.
+
+    Args:
+        args (argparse.Namespace): Parsed command line arguments.
+    """
+    from Environment import Environment
+
+    sensors = get_sensors(args)
+    recorder = None
+    if args.record:
+        from Recorder import TrajectoryRecorder
+        recorder = TrajectoryRecorder(args.record, metadata={"sensors": sensors.as_dict(),
+                                                              "action_repeat": args.action_repeat,
+                                                              "map_file": args.map})
+
+    # Initialize the game environment, the viewer draws it on its own display environment
+    game = Environment(headless=True, action_repeat=args.action_repeat, collision=args.collision,
+                       clearance_observation=args.clearance, sensors=sensors, recorder=recorder,
+                       laps=args.laps or None, map_file=args.map)
+    from Brain import ARCHITECTURES, apply_profile
+
+    alpha, batch_size, brain_options = apply_profile(args.profile, LR, BATCH_SIZE)
+    # The architecture only applies to a new model, a loaded model keeps its own
+    brain_options.update(ARCHITECTURES[args.arch])
+    if args.hidden:
+        brain_options["hidden"] = tuple(args.hidden)
+    if args.head:
+        brain_options["head"] = args.head
+    if args.layer_norm:
+        brain_options["layer_norm"] = True
+    normalizer = None
+    if args.train and (args.normalize or args.frame_stack > 1 or args.scale_rewards):
+        from Normalizer import Normalizer
+        normalizer = Normalizer(game.observation_size, n_frames=args.frame_stack,
+                                normalize_observations=args.normalize, scale_rewards=args.scale_rewards)
+    agent = build_agent(args.train, input_dims=game.observation_size * args.frame_stack, tau=args.tau,
+                        alpha=alpha, batch_size=batch_size, brain_options=brain_options, normalizer=normalizer)
+    monitor = None
+    if args.memory_report or args.rss_limit:
+        from MemoryMonitor import MemoryMonitor
+        monitor = MemoryMonitor(agent, trace=args.trace_malloc,
+                                rss_limit=args.rss_limit * 2 ** 20 if args.rss_limit else None)
+    options = dict(training=args.train, plotting=not args.no_plot, history=args.history or None,
+                   monitor=monitor, memory_report_every=args.memory_report)
+    try:
+        if args.no_window:
+            start(game, agent, **options)
+        else:
+            from Viewer import Viewer
+            viewer = Viewer(sensors=sensors, map_file=args.map, debugging=args.debug, fps=args.fps,
+                            plotting=not args.no_plot)
+            viewer.run(start, game, agent, viewer=viewer, **options)
+    finally:
+        if recorder is not None:
+            recorder.close()
+        if args.dump_replay:
+            agent.memory.save(args.dump_replay)
+
+
+def bench_raytrace(args):
+    """
+    Benchmark ray casting on tracks of growing size.
+
+    Args:
+        args (argparse.Namespace): Parsed command line arguments.
+    """
+    import os
+    from Benchmark import benchmark_raytrace, format_raytrace_table
+
+    # A faster engine only counts if it still computes the same simulation
+    if not args.no_check:
+        from Regression import check_golden, format_regression_table, golden_file, load_golden
+
+        for map_file in args.maps:
+            if os.path.exists(golden_file(map_file)):
+                results = check_golden(load_golden(golden_file(map_file)), map_file)
+                print(format_regression_table(results))
+                if not all(r["passed"] for r in results):
+                    raise SystemExit(f"Regression check failed on {map_file}")
+
+    results = [benchmark_raytrace(map_file, poses=args.poses, scalar=not args.no_scalar) for map_file in args.maps]
+    print(format_raytrace_table(results))
+
+
+def regression(args):
+    """
+    Record or check the golden outputs of the simulator on random poses.
+
+    Args:
+        args (argparse.Namespace): Parsed command line arguments.
+    """
+    from Regression import (check_golden, format_regression_table, golden_file, load_golden, record_golden,
+                            save_golden)
+
+    fname = args.golden or golden_file(args.map)
+    if args.record:
+        save_golden(fname, record_golden(args.map, poses=args.poses, seed=args.seed))
+        print("Recorded", args.poses, "poses to", fname)
+        return
+    results = check_golden(load_golden(fname), args.map, functions=args.functions, engines=args.engines)
+    print(format_regression_table(results))
+    if not all(r["passed"] for r in results):
+        raise SystemExit(1)
+
+
+def serve(args):
+    """
+    Serve a model to environment workers with request batching.
+
+    Args:
+        args (argparse.Namespace): Parsed command line arguments.
+    """
+    from InferenceServer import InferenceServer, parse_address
+
+    server = InferenceServer(args.model, parse_address(args.address), backend=args.backend,
+                             max_batch=args.max_batch, max_latency=args.max_latency / 1000,
+                             reload_interval=args.reload_interval, allow_remote=args.allow_remote)
+    print("Serving", args.model, "on", server.address)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(server.statistics())
+    finally:
+        server.close()
+
+
+def export_policy(args):
+    """
+    Export a saved model to a NumPy policy file.
+
+    Args:
+        args (argparse.Namespace): Parsed command line arguments.
+    """
+    from Policy import NumpyPolicy
+
+    NumpyPolicy.load(args.model).save(args.output)
+    print("Exported", args.model, "to", args.output)
+
+
+def export_int8(args):
+    """
+    Export a saved model to an int8 policy and check it against the float model.
+
+    Args:
+        args (argparse.Namespace): Parsed command line arguments.
+    """
+    import os
+    import shutil
+    import numpy as np
+    from Benchmark import benchmark_policy, format_policy_table
+    from Normalizer import Normalizer, normalizer_file
+    from Policy import NumpyPolicy, TFLitePolicy, export_tflite, greedy_agreement, quantize
+
+    # NumPy int8 layers quantize their inputs and convert their kernels at every call, so only
+    # the TFLite int8 kernels are faster than float32
+    if not args.output.endswith(".tflite") and not args.force:
+        raise SystemExit("A NumPy int8 policy is slower than the float32 one, export to a .tflite file "
+                         "or pass --force")
+
+    # States to calibrate and check the quantization on, from recordings or from greedy rollouts
+    if args.states:
+        from OfflineDataset import iter_transitions
+        states = np.concatenate([batch[0] for source in args.states for batch in iter_transitions(source)])
+    else:
+        from Evaluator import rollout
+        states = np.concatenate([rollout(args.model, seed, max_steps=args.max_steps, sensors=get_sensors(args),
+                                         map_file=args.map, record_states=True)["states"]
+                                 for seed in range(args.episodes)])
+    norm_file = normalizer_file(args.model)
+    if os.path.exists(norm_file):
+        states = Normalizer.load(norm_file).normalize(states)
+
+    reference = NumpyPolicy.load(args.model)
+    if states.shape[1] != reference.input_dims:
+        raise SystemExit(f"The states have {states.shape[1]} values, the model expects {reference.input_dims}")
+    calibration = states[np.random.default_rng(0).permutation(len(states))[:args.calibration]]
+
+    # Nothing is written to the output until the policy passes the agreement check
+    tflite_file = None
+    if args.output.endswith(".tflite"):
+        from keras.models import load_model
+        import Brain  # noqa: F401, registers the custom layers of the saved models
+
+        # The converter writes a file, so it goes to a temporary one next to the output
+        tflite_file = args.output + ".tmp"
+        export_tflite(load_model(args.model), tflite_file, calibration)
+        policy = TFLitePolicy.load(tflite_file)
+    else:
+        policy = quantize(reference)
+
+    try:
+        check = greedy_agreement(reference, policy, states)
+        print(f"Greedy action agreement {check['agreement']:.4f} on {check['states']} states,"
+              f" output error mean {check['mean_error']:.2g} max {check['max_error']:.2g}")
+        print(format_policy_table({"float32 (numpy)": benchmark_policy(reference, states),
+                                   "int8": benchmark_policy(policy, states)}))
+        if check["agreement"] < args.min_agreement:
+            raise SystemExit(f"Agreement below {args.min_agreement}, keep the float model")
+
+        if tflite_file is not None:
+            os.replace(tflite_file, args.output)
+        else:
+            policy.save(args.output)
+    finally:
+        if tflite_file is not None and os.path.exists(tflite_file):
+            os.remove(tflite_file)
+    # The exported policy is evaluated with the same preprocessing
+    if os.path.exists(norm_file):
+        shutil.copyfile(norm_file, normalizer_file(args.output))
+    print("Exported", args.model, "to", args.output)
+
+
+def generate_track(args):
+    """
+    Generate random tracks.
+
+    Args:
+        args (argparse.Namespace): Parsed command line arguments.
+    """
+    import os
+    import TrackGenerator
+
+    os.makedirs(args.directory, exist_ok=True)
+    for i in range(args.count):
+        seed = args.seed + i
+        fname = os.path.join(args.directory, f"track_{seed}.txt")
+        TrackGenerator.generate(fname, image=not args.no_image, segments=args.segments, width=args.width,
+                                complexity=args.complexity, roughness=args.roughness,
+                                segment_length=args.segment_length, seed=seed)
+        print("Generated", fname)
+
+
+def run_pretrain(args):
+    """
+    Pretrain a new model offline from logged transitions.
+
+    Args:
+        args (argparse.Namespace): Parsed command line arguments.
+    """
+    import OfflineDataset
+
+    input_dims = OfflineDataset.state_size(args.sources)
+    if input_dims is None:
+        print("No transitions found in", args.sources)
+        return
+    agent = build_agent(True, input_dims=input_dims, fname=args.output,
+                        batch_size=args.batch_size, mem_size=args.mem_size)
+    loaded = OfflineDataset.load_transitions(agent.memory, args.sources)
+    print("Loaded", loaded, "transitions, kept", min(loaded, args.mem_size))
+    if min(loaded, args.mem_size) <= args.batch_size:
+        print("Not enough transitions for a batch of", args.batch_size)
+        return
+
+    updates_per_sec = OfflineDataset.pretrain(agent, args.updates, prefetch=args.prefetch)
+    print("Pretrained", args.updates, "updates at", round(updates_per_sec, 1), "updates/sec")
+    agent.save_model()
+
+
+def replay(args):
+    """
+    Re-render a recorded episode.
+
+    Args:
+        args (argparse.Namespace): Parsed command line arguments.
+    """
+    from Recorder import TrajectoryReplayer
+
+    replayer = TrajectoryReplayer(args.directory)
+    episodes = replayer.episodes()
+    if not episodes:
+        print("No episodes recorded in", args.directory)
+        return
+    episode = episodes[-1] if args.episode is None else args.episode
+    print("Replaying episode", episode, "of", len(episodes))
+    replayer.replay(episode, speed=args.speed, fps=args.fps)
+
+
+def evaluate(args):
+    """
+    Evaluate saved models headless over many seeded episodes.
+
+    Args:
+        args (argparse.Namespace): Parsed command line arguments.
+    """
+    from Evaluator import evaluate as evaluate_models, format_table
+
+    seeds = range(args.seed, args.seed + args.episodes)
+    summaries = evaluate_models(args.models, seeds, workers=args.workers, threads=args.threads,
+                                max_steps=args.max_steps, epsilon=args.epsilon,
+                                position_noise=args.position_noise, angle_noise=args.angle_noise,
+                                action_repeat=args.action_repeat, collision=args.collision,
+                                sensors=get_sensors(args), laps=args.laps or None, map_file=args.map)
+    print(format_table(summaries))
+
+
+def run_sweep(args):
+    """
+    Run a parallel hyperparameter sweep of headless training runs.
+
+    Args:
+        args (argparse.Namespace): Parsed command line arguments.
+    """
+    import json
+    import Sweep
+
+    space = Sweep.DEFAULT_SPACE
+    if args.space:
+        with open(args.space) as f:
+            space = json.load(f)
+    if args.search == "grid":
+        configs = Sweep.grid_search(space)
+    else:
+        configs = Sweep.random_search(space, args.trials, seed=args.seed)
+
+    results = Sweep.sweep(configs, args.results, workers=args.workers, threads=args.threads,
+                          episodes=args.episodes, max_steps=args.max_steps, grace=args.grace)
+    print("Best trial", results[0]["trial"], "completion", round(results[0]["best"], 3), results[0]["config"])
+
+
+def bench_brain(args):
+    """
+    Benchmark the training throughput of the CPU training profiles.
+
+    Args:
+        args (argparse.Namespace): Parsed command line arguments.
+    """
+    from Benchmark import benchmark_profiles, format_table
+
+    print(format_table(benchmark_profiles(args.profiles, updates=args.updates)))
+
+
+def bench_arch(args):
+    """
+    Benchmark the training throughput and the learning of Q-network architectures.
+
+    Args:
+        args (argparse.Namespace): Parsed command line arguments.
+    """
+    from Benchmark import benchmark_architectures, format_architecture_table
+
+    results = benchmark_architectures(args.architectures, episodes=args.episodes, max_steps=args.max_steps,
+                                      updates=args.updates, seed=args.seed)
+    print(format_architecture_table(results))
+
+
+def build_parser():
+    """
+    Build the command line parser.
+
+    Every subcommand stores its handler in ``func``; the handler imports
+    its subsystem only when it runs.
+
+    Returns:
+        argparse.ArgumentParser: The command line parser.
+    """
+    from DataLoader import DEFAULT_MAP
+    from Profiles import ARCHITECTURES, CPU_PROFILES
+
+    parser = argparse.ArgumentParser(prog="selfDrivingCarRL",
+                                     description="Self driving car reinforcement learning.")
+    subparsers = parser.add_subparsers(dest="command")
+
+    run_parser = subparsers.add_parser("run", help="Train or evaluate the agent in the pygame window (default).")
+    run_parser.add_argument("--train", action="store_true",
+                            help="Learn from scratch instead of loading the existing model.")
+    run_parser.add_argument("--debug", action="store_true", help="Start in debugging mode.")
+    run_parser.add_argument("--no-plot", action="store_true", help="Do not plot the training progress.")
+    run_parser.add_argument("--fps", type=int, default=30,
+                            help="Frames per second of the window, the simulation is not tied to it.")
+    run_parser.add_argument("--no-window", action="store_true",
+                            help="Run without a window, stop with Ctrl+C.")
+    run_parser.add_argument("--action-repeat", type=int, default=1,
+                            help="Number of simulation sub-steps every action is applied for.")
+    run_parser.add_argument("--collision", choices=("rays", "field"), default="rays",
+                            help="Detect collisions from the cameras or from the track distance field.")
+    run_parser.add_argument("--clearance", action="store_true",
+                            help="Add the distance to the nearest wall to the state.")
+    run_parser.add_argument("--tau", type=float, default=None,
+                            help="Polyak average the target network with this weight after every gradient step.")
+    run_parser.add_argument("--profile", default="default", choices=tuple(CPU_PROFILES),
+                            help="CPU training profile, see Profiles.CPU_PROFILES and the bench-brain subcommand.")
+    run_parser.add_argument("--arch", default="softmax", choices=tuple(ARCHITECTURES),
+                            help="Q-network architecture of a new model, see Profiles.ARCHITECTURES and bench-arch.")
+    run_parser.add_argument("--hidden", type=int, nargs="+", metavar="UNITS",
+                            help="Units of every hidden layer, overriding the architecture.")
+    run_parser.add_argument("--head", choices=("softmax", "linear", "dueling"),
+                            help="Output layer, overriding the architecture.")
+    run_parser.add_argument("--layer-norm", action="store_true",
+                            help="Normalize every hidden layer before its activation.")
+    run_parser.add_argument("--record", metavar="DIRECTORY",
+                            help="Stream every step to compressed trajectory files in this directory.")
+    run_parser.add_argument("--dump-replay", metavar="FILE",
+                            help="Save the replay buffer to this file on exit, for the pretrain subcommand.")
+    run_parser.add_argument("--normalize", action="store_true",
+                            help="Standardize the states with running statistics saved next to the model.")
+    run_parser.add_argument("--frame-stack", type=int, default=1,
+                            help="Number of consecutive observations stacked into a state.")
+    run_parser.add_argument("--scale-rewards", action="store_true",
+                            help="Divide the rewards by the running standard deviation of the return.")
+    run_parser.add_argument("--history", type=int, default=1000,
+                            help="Number of games kept in the score histories and plot, 0 to keep all.")
+    run_parser.add_argument("--memory-report", type=int, default=0, metavar="GAMES",
+                            help="Print a memory report every GAMES games.")
+    run_parser.add_argument("--trace-malloc", action="store_true",
+                            help="Trace Python allocations in the memory reports (slower).")
+    run_parser.add_argument("--rss-limit", type=int, default=None, metavar="MB",
+                            help="Save the model and stop when the process uses more memory than this.")
+    run_parser.add_argument("--map", default=DEFAULT_MAP, help="Track file, see the generate-track subcommand.")
+    run_parser.add_argument("--laps", type=int, default=1,
+                            help="Laps per episode, 0 to keep driving laps until a collision.")
+    add_sensor_arguments(run_parser)
+    run_parser.set_defaults(func=run)
+
+    eval_parser = subparsers.add_parser("evaluate", help="Rank saved models over many seeded headless episodes.")
+    eval_parser.add_argument("models", nargs="+", help="Saved model files.")
+    eval_parser.add_argument("--episodes", type=int, default=20, help="Number of seeded episodes per model.")
+    eval_parser.add_argument("--seed", type=int, default=0, help="Seed of the first episode.")
+    eval_parser.add_argument("--workers", type=int, default=None, help="Number of worker processes.")
+    eval_parser.add_argument("--threads", type=int, default=1, help="TensorFlow threads per worker.")
+    eval_parser.add_argument("--max-steps", type=int, default=5000, help="Maximum steps per episode.")
+    eval_parser.add_argument("--epsilon", type=float, default=0.0, help="Probability of a random action.")
+    eval_parser.add_argument("--position-noise", type=int, default=5,
+                             help="Maximum start position offset in pixels.")
+    eval_parser.add_argument("--angle-noise", type=int, default=5, help="Maximum start angle offset in degrees.")
+    eval_parser.add_argument("--action-repeat", type=int, default=1,
+                             help="Number of simulation sub-steps every action is applied for.")
+    eval_parser.add_argument("--collision", choices=("rays", "field"), default="rays",
+                             help="Detect collisions from the cameras or from the track distance field.")
+    eval_parser.add_argument("--map", default=DEFAULT_MAP, help="Track file, see the generate-track subcommand.")
+    eval_parser.add_argument("--laps", type=int, default=1,
+                             help="Laps per episode, 0 to keep driving laps until a collision or --max-steps.")
+    add_sensor_arguments(eval_parser)
+    eval_parser.set_defaults(func=evaluate)
+
+    sweep_parser = subparsers.add_parser("sweep", help="Run a parallel hyperparameter sweep.")
+    sweep_parser.add_argument("--space", help="JSON file with the search space, see Sweep.DEFAULT_SPACE.")
+    sweep_parser.add_argument("--search", choices=("random", "grid"), default="random", help="Search strategy.")
+    sweep_parser.add_argument("--trials", type=int, default=16, help="Number of random search trials.")
+    sweep_parser.add_argument("--seed", type=int, default=0, help="Seed of the random search.")
+    sweep_parser.add_argument("--episodes", type=int, default=300, help="Maximum number of episodes per trial.")
+    sweep_parser.add_argument("--max-steps", type=int, default=5000, help="Maximum steps per episode.")
+    sweep_parser.add_argument("--grace", type=int, default=50,
+                              help="Episodes played before a trial can be stopped early.")
+    sweep_parser.add_argument("--workers", type=int, default=None, help="Number of worker processes.")
+    sweep_parser.add_argument("--threads", type=int, default=1, help="CPUs and TensorFlow threads per worker.")
+    sweep_parser.add_argument("--results", default="sweep.jsonl", help="File the learning curves are appended to.")
+    sweep_parser.set_defaults(func=run_sweep)
+
+    bench_parser = subparsers.add_parser("bench-brain", help="Report updates/sec of the CPU training profiles.")
+    bench_parser.add_argument("--profiles", nargs="+", choices=tuple(CPU_PROFILES),
+                              default=list(CPU_PROFILES),
+                              help="Profiles to benchmark.")
+    bench_parser.add_argument("--updates", type=int, default=200, help="Number of timed gradient steps.")
+    bench_parser.set_defaults(func=bench_brain)
+
+    arch_parser = subparsers.add_parser("bench-arch",
+                                        help="Report updates/sec and lap completion of Q-network architectures.")
+    arch_parser.add_argument("--architectures", nargs="+", choices=tuple(ARCHITECTURES),
+                             default=list(ARCHITECTURES),
+                             help="Architectures to benchmark, see Profiles.ARCHITECTURES.")
+    arch_parser.add_argument("--episodes", type=int, default=100, help="Training episodes per architecture.")
+    arch_parser.add_argument("--max-steps", type=int, default=5000, help="Maximum steps per episode.")
+    arch_parser.add_argument("--updates", type=int, default=200, help="Number of timed gradient steps.")
+    arch_parser.add_argument("--seed", type=int, default=0, help="Seed of the weights and of the exploration.")
+    arch_parser.set_defaults(func=bench_arch)
+
+    replay_parser = subparsers.add_parser("replay", help="Re-render a recorded episode.")
+    replay_parser.add_argument("directory", help="Directory of the recording.")
+    replay_parser.add_argument("--episode", type=int, default=None, help="Episode to replay, the last one by default.")
+    replay_parser.add_argument("--speed", type=float, default=1.0, help="Recorded steps shown per frame.")
+    replay_parser.add_argument("--fps", type=int, default=60, help="Frames per second.")
+    replay_parser.set_defaults(func=replay)
+
+    serve_parser = subparsers.add_parser("serve", help="Serve a model to many workers with request batching.")
+    serve_parser.add_argument("model", help="Saved Keras model, or .npz policy from export-policy.")
+    serve_parser.add_argument("--address", default="localhost:6000", help="host:port or Unix socket path.")
+    serve_parser.add_argument("--allow-remote", action="store_true",
+                              help="Allow a non-loopback host. Clients must share the secret of "
+                                   "~/.selfDrivingCarRL/authkey, as hex in SELF_DRIVING_CAR_AUTHKEY.")
+    serve_parser.add_argument("--backend", choices=("numpy", "keras", "tflite"), default="numpy",
+                              help="Run the forward pass in NumPy, in TensorFlow or with a .tflite file "
+                                   "written by export-int8.")
+    serve_parser.add_argument("--max-batch", type=int, default=256, help="Maximum states per forward pass.")
+    serve_parser.add_argument("--max-latency", type=float, default=2.0,
+                              help="Milliseconds a request waits for others to batch with.")
+    serve_parser.add_argument("--reload-interval", type=float, default=1.0,
+                              help="Seconds between checks for a new checkpoint, 0 to never reload.")
+    serve_parser.set_defaults(func=serve)
+
+    export_parser = subparsers.add_parser("export-policy", help="Export a model to a NumPy policy file.")
+    export_parser.add_argument("model", help="Saved Keras model.")
+    export_parser.add_argument("output", help="Output .npz file.")
+    export_parser.set_defaults(func=export_policy)
+
+    int8_parser = subparsers.add_parser("export-int8",
+                                        help="Export a model to an int8 policy and check its greedy actions.")
+    int8_parser.add_argument("model", help="Saved Keras model.")
+    int8_parser.add_argument("output", help="Output .tflite file, or .npz for a NumPy int8 policy with --force.")
+    int8_parser.add_argument("--states", nargs="+", metavar="SOURCE",
+                             help="Recording directories or replay dumps to take the states from. "
+                                  "By default the states of greedy rollouts of the model.")
+    int8_parser.add_argument("--episodes", type=int, default=10, help="Rollouts recorded without --states.")
+    int8_parser.add_argument("--max-steps", type=int, default=5000, help="Maximum steps per rollout.")
+    int8_parser.add_argument("--map", default=DEFAULT_MAP, help="Track file of the rollouts.")
+    int8_parser.add_argument("--calibration", type=int, default=1000,
+                             help="Number of states the TFLite activation ranges are calibrated on.")
+    int8_parser.add_argument("--min-agreement", type=float, default=0.98,
+                             help="Fail if fewer greedy actions than this fraction match the float model.")
+    int8_parser.add_argument("--force", action="store_true",
+                             help="Export a NumPy int8 policy, although it is slower than the float32 one.")
+    add_sensor_arguments(int8_parser)
+    int8_parser.set_defaults(func=export_int8)
+
+    raytrace_parser = subparsers.add_parser("bench-raytrace", help="Report the ray casting cost on tracks.")
+    raytrace_parser.add_argument("maps", nargs="*", default=[DEFAULT_MAP], help="Track files.")
+    raytrace_parser.add_argument("--poses", type=int, default=100, help="Number of timed poses per track.")
+    raytrace_parser.add_argument("--no-scalar", action="store_true", help="Skip the slow scalar reference.")
+    raytrace_parser.add_argument("--no-check", action="store_true",
+                                 help="Skip the regression check against the golden outputs of the tracks.")
+    raytrace_parser.set_defaults(func=bench_raytrace)
+
+    regression_parser = subparsers.add_parser("regression",
+                                              help="Check the simulator engines against golden outputs.")
+    regression_parser.add_argument("--record", action="store_true",
+                                   help="Record the golden outputs with the reference implementations.")
+    regression_parser.add_argument("--map", default=DEFAULT_MAP, help="Track file.")
+    regression_parser.add_argument("--golden", default=None,
+                                   help="Golden outputs file, next to the track by default.")
+    regression_parser.add_argument("--poses", type=int, default=10000, help="Number of recorded random poses.")
+    regression_parser.add_argument("--seed", type=int, default=0, help="Seed of the recorded poses.")
+    regression_parser.add_argument("--functions", nargs="+", default=None,
+                                   help="Checked functions, see Regression.ENGINES. All by default.")
+    regression_parser.add_argument("--engines", nargs="+", default=None, help="Checked engines. All by default.")
+    regression_parser.set_defaults(func=regression)
+
+    track_parser = subparsers.add_parser("generate-track", help="Generate random closed tracks.")
+    track_parser.add_argument("directory", help="Directory the tracks and their images are written to.")
+    track_parser.add_argument("--count", type=int, default=1, help="Number of tracks.")
+    track_parser.add_argument("--seed", type=int, default=0, help="Seed of the first track.")
+    track_parser.add_argument("--segments", type=int, default=60, help="Walls per boundary.")
+    track_parser.add_argument("--width", type=float, default=70, help="Width of the track in pixels.")
+    track_parser.add_argument("--complexity", type=int, default=4, help="Number of harmonics of the centerline.")
+    track_parser.add_argument("--roughness", type=float, default=0.3, help="Amplitude of the turns.")
+    track_parser.add_argument("--segment-length", type=float, default=None,
+                              help="Mean wall length in pixels, by default the track fits the window.")
+    track_parser.add_argument("--no-image", action="store_true",
+                              help="Skip the background image, for large tracks used headless.")
+    track_parser.set_defaults(func=generate_track)
+
+    pretrain_parser = subparsers.add_parser("pretrain", help="Pretrain a model offline from logged transitions.")
+    pretrain_parser.add_argument("sources", nargs="+",
+                                 help="Recording directories and replay buffer dumps (.npz).")
+    pretrain_parser.add_argument("--output", default="model/pretrained.keras", help="File the model is saved to.")
+    pretrain_parser.add_argument("--updates", type=int, default=20000, help="Number of gradient steps.")
+    pretrain_parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Batch size of every update.")
+    pretrain_parser.add_argument("--mem-size", type=int, default=1000000,
+                                 help="Maximum number of transitions kept in memory.")
+    pretrain_parser.add_argument("--prefetch", type=int, default=8, help="Number of minibatches sampled ahead.")
+    pretrain_parser.set_defaults(func=run_pretrain)
+
+    return parser
+
+
+def main(argv=None):
+    """
+    Command line entry point.
+
+    Args:
+        argv (list): Command line arguments, defaults to ``sys.argv[1:]``.
+    """
+    import sys
+
+    argv = sys.argv[1:] if argv is None else list(argv)
+    # Default to the interactive session when no subcommand is given
+    if not argv or (argv[0].startswith("-") and argv[0] not in ("-h", "--help")):
+        argv = ["run"] + argv
+    args = build_parser().parse_args(argv)
+    args.func(args)
+
+
 if __name__ == '__main__':
-    start()
+    main()
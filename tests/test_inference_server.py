@@ -0,0 +1,72 @@
+import threading
+import numpy as np
+import pytest
+from InferenceServer import AUTHKEY_ENV, InferenceClient, InferenceServer
+from Normalizer import Normalizer, normalizer_file
+from Policy import NumpyPolicy
+
+
+@pytest.fixture
+def policy(tmp_path, monkeypatch):
+    """Small NumPy policy with 7 inputs, saved to a file."""
+    monkeypatch.setenv(AUTHKEY_ENV, "00" * 32)
+    rng = np.random.default_rng(0)
+    policy = NumpyPolicy([("dense", [rng.normal(size=(7, 16)), np.zeros(16)], "relu"),
+                          ("dense", [rng.normal(size=(16, 3)), np.zeros(3)], "linear")])
+    model_file = str(tmp_path / "policy.npz")
+    policy.save(model_file)
+    return policy, model_file
+
+
+@pytest.fixture
+def server(policy, tmp_path):
+    """Server of the policy on a Unix socket."""
+    policy, model_file = policy
+    server = InferenceServer(model_file, str(tmp_path / "server.sock"), reload_interval=0)
+    server.start()
+    yield server, policy
+    server.close()
+
+
+def test_serves_the_policy(server):
+    server, policy = server
+    client = InferenceClient(server.address)
+    states = np.random.default_rng(1).normal(size=(5, 7)).astype(np.float32)
+    np.testing.assert_allclose(client.predict(states), policy.predict(states), rtol=1e-5)
+    np.testing.assert_array_equal(client.get_actions(states), policy.get_actions(states))
+    client.close()
+
+
+def test_malformed_request_only_fails_its_client(server):
+    server, policy = server
+    bad = InferenceClient(server.address)
+    good = InferenceClient(server.address)
+    with pytest.raises(ValueError):
+        bad.predict(np.zeros((2, 5), dtype=np.float32))
+    with pytest.raises(ValueError):
+        bad.predict(np.zeros(7, dtype=np.float32))
+
+    # The batching thread survived, both clients are still served
+    answers = {}
+    thread = threading.Thread(target=lambda: answers.update(good=good.predict(np.ones((3, 7)))))
+    thread.start()
+    thread.join(timeout=10)
+    assert not thread.is_alive()
+    assert answers["good"].shape == (3, 3)
+    assert bad.predict(np.ones((1, 7))).shape == (1, 3)
+    bad.close()
+    good.close()
+
+
+def test_normalizes_the_states(policy, tmp_path):
+    policy, model_file = policy
+    normalizer = Normalizer(7)
+    normalizer.observation_rms.update(np.random.default_rng(2).normal(3.0, 2.0, size=(100, 7)))
+    normalizer.save(normalizer_file(model_file))
+    server = InferenceServer(model_file, str(tmp_path / "server.sock"), reload_interval=0)
+    server.start()
+    client = InferenceClient(server.address)
+    states = np.random.default_rng(1).normal(3.0, 2.0, size=(5, 7)).astype(np.float32)
+    np.testing.assert_allclose(client.predict(states), policy.predict(normalizer.normalize(states)), rtol=1e-5)
+    client.close()
+    server.close()
@@ -0,0 +1,27 @@
+import numpy as np
+from Normalizer import Normalizer, RunningMeanStd
+
+
+def test_running_mean_std_matches_numpy():
+    values = np.random.default_rng(0).normal(5.0, 3.0, size=(1000, 4))
+    rms = RunningMeanStd((4,))
+    # Uneven batches, the merged statistics do not depend on the batching
+    for batch in np.split(values, [1, 10, 250, 600]):
+        rms.update(batch)
+    np.testing.assert_allclose(rms.mean, values.mean(axis=0), rtol=1e-5)
+    np.testing.assert_allclose(rms.var, values.var(axis=0), rtol=1e-4)
+
+
+def test_update_counts_every_observation_of_an_episode():
+    observations = np.random.default_rng(1).normal(size=(6, 3))
+    normalizer = Normalizer(3)
+    for i in range(5):
+        normalizer.update(observations[i], observations[i + 1], 0.0, i == 4)
+    np.testing.assert_allclose(normalizer.observation_rms.count, 6, atol=1e-3)
+    np.testing.assert_allclose(normalizer.observation_rms.mean, observations.mean(axis=0), atol=1e-3)
+
+
+def test_update_uses_the_newest_stacked_frame():
+    normalizer = Normalizer(2, n_frames=2)
+    normalizer.update(np.array([100.0, 100.0, 1.0, 2.0]), np.array([1.0, 2.0, 1.0, 2.0]), 0.0, False)
+    np.testing.assert_allclose(normalizer.observation_rms.mean, [1.0, 2.0], atol=1e-3)
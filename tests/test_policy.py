@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+from Policy import NumpyPolicy, greedy_agreement, load_policy, quantize
+
+
+def make_policy(head="dense"):
+    """Float policy with 7 inputs and 7 actions, like the saved model."""
+    rng = np.random.default_rng(0)
+    layers = [("dense", [rng.normal(0, 0.5, size=(7, 64)), rng.normal(0, 0.1, size=64)], "relu")]
+    if head == "dueling":
+        layers.append(("dueling", [rng.normal(0, 0.2, size=(64, 1)), np.zeros(1),
+                                   rng.normal(0, 0.2, size=(64, 7)), np.zeros(7)], "linear"))
+    else:
+        layers.append(("dense", [rng.normal(0, 0.2, size=(64, 7)), np.zeros(7)], "softmax"))
+    return NumpyPolicy(layers)
+
+
+@pytest.mark.parametrize("head", ["dense", "dueling"])
+def test_quantize_agrees_with_the_float_policy(head):
+    policy = make_policy(head)
+    quantized = quantize(policy)
+    assert [kind for kind, _, _ in quantized.layers] == ["int8_dense", "int8_dense"]
+    assert quantized.layers[0][1][0].dtype == np.int8
+
+    states = np.random.default_rng(1).uniform(0, 1, size=(2000, 7)).astype(np.float32)
+    check = greedy_agreement(policy, quantized, states)
+    assert check["states"] == 2000
+    assert check["agreement"] >= 0.98
+    assert check["max_error"] < 0.05
+
+
+def test_quantized_policy_round_trips(tmp_path):
+    quantized = quantize(make_policy())
+    fname = str(tmp_path / "policy.npz")
+    quantized.save(fname)
+    loaded = load_policy(fname, backend=None)
+    assert loaded.layers[0][1][0].dtype == np.int8
+    states = np.random.default_rng(2).uniform(0, 1, size=(10, 7)).astype(np.float32)
+    np.testing.assert_array_equal(loaded.predict(states), quantized.predict(states))
+
+
+def test_greedy_agreement_of_identical_policies():
+    policy = make_policy()
+    states = np.random.default_rng(3).uniform(0, 1, size=(50, 7)).astype(np.float32)
+    check = greedy_agreement(policy, policy, states)
+    assert check["agreement"] == 1.0
+    assert check["max_error"] == 0.0
@@ -0,0 +1,59 @@
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from Recorder import TrajectoryRecorder, TrajectoryReplayer
+
+
+def record_episode(recorder, steps, angle=0):
+    """Record an episode of a car driving right, its step as reward."""
+    for step in range(steps):
+        car = SimpleNamespace(x=float(step), y=2.0, angle=angle + step, next_checkpoint=step // 10)
+        recorder.record(car, step % 3, float(step), step == steps - 1, [step / steps] * 7)
+    recorder.end_episode()
+
+
+def test_round_trip(tmp_path):
+    recorder = TrajectoryRecorder(str(tmp_path), chunk_size=16, metadata={"sensors": {}})
+    record_episode(recorder, 40)
+    record_episode(recorder, 5)
+    recorder.close()
+
+    replayer = TrajectoryReplayer(str(tmp_path))
+    assert replayer.episodes() == [0, 1]
+    assert replayer.metadata == {"sensors": {}}
+    episode = replayer.load_episode(0)
+    np.testing.assert_array_equal(episode["step"], np.arange(40))
+    np.testing.assert_array_equal(episode["x"], np.arange(40))
+    np.testing.assert_array_equal(episode["reward"], np.arange(40))
+    np.testing.assert_array_equal(episode["done"], np.arange(40) == 39)
+    assert episode["sensors"].shape == (40, 7)
+    assert len(replayer.load_episode(1)["step"]) == 5
+
+
+def test_new_recorder_continues_the_episodes(tmp_path):
+    recorder = TrajectoryRecorder(str(tmp_path), chunk_size=16)
+    record_episode(recorder, 20)
+    recorder.close()
+    recorder = TrajectoryRecorder(str(tmp_path), chunk_size=16)
+    record_episode(recorder, 20)
+    recorder.close()
+    assert TrajectoryReplayer(str(tmp_path)).episodes() == [0, 1]
+
+
+def test_unbounded_angle_is_stored_as_a_heading(tmp_path):
+    recorder = TrajectoryRecorder(str(tmp_path))
+    record_episode(recorder, 3, angle=-100000)
+    recorder.close()
+    np.testing.assert_array_equal(TrajectoryReplayer(str(tmp_path)).load_episode(0)["angle"],
+                                  np.arange(-100000, -99997) % 360)
+
+
+def test_writer_error_is_raised_instead_of_blocking(tmp_path):
+    recorder = TrajectoryRecorder(str(tmp_path), chunk_size=1)
+    recorder.directory = str(tmp_path / "missing")
+    # Many more chunks than the queue holds, the writer keeps draining after its error
+    with pytest.raises(FileNotFoundError):
+        record_episode(recorder, 50)
+    with pytest.raises(FileNotFoundError):
+        recorder.close()
+    assert not recorder.writer.is_alive()
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+from ShardedReplayBuffer import ShardedReplayBuffer
+
+
+def fill(buffer, shard, n):
+    """Store n transitions in a shard, every reward being the shard."""
+    for _ in range(n):
+        buffer.store_transition(np.zeros(3), 0, shard, np.zeros(3), False, shard=shard)
+
+
+def test_samples_every_shard_proportionally_to_its_fill():
+    np.random.seed(0)
+    buffer = ShardedReplayBuffer(300, 3, 2, n_shards=3, discrete=True)
+    fill(buffer, 0, 100)
+    fill(buffer, 1, 50)
+    fill(buffer, 2, 10)
+    assert buffer.fills().tolist() == [100, 50, 10]
+
+    rewards = np.concatenate([buffer.sample_buffer(160)[2] for _ in range(20)])
+    counts = np.bincount(rewards.astype(int), minlength=3)
+    # Stratified sampling draws every shard in proportion to its fill, up to one sample per batch
+    np.testing.assert_allclose(counts / 20, [100, 50, 10], atol=1)
+
+
+def test_samples_only_stored_slots():
+    buffer = ShardedReplayBuffer(40, 3, 2, n_shards=4, discrete=True)
+    fill(buffer, 1, 3)
+    fill(buffer, 3, 25)  # wraps around its ring of 10 slots
+    slots = buffer.sample_indices(1000)
+    shard, local = slots // buffer.shard_size, slots % buffer.shard_size
+    assert set(shard.tolist()) == {1, 3}
+    assert local[shard == 1].max() < 3
+
+
+def test_agent_writes_to_the_shard_of_each_collector():
+    pytest.importorskip("tensorflow")
+    from Agent import Agent
+
+    agent = Agent(alpha=0.001, gamma=0.99, n_actions=2, epsilon=0, batch_size=8, input_dims=3,
+                  epsilon_dec=1, epsilon_min=0, mem_size=30, replace_target=10, replay_shards=3)
+    for shard in range(3):
+        for _ in range(5):
+            agent.remember(np.zeros(3), 0, shard, np.zeros(3), False, shard=shard)
+    assert agent.memory.fills().tolist() == [5, 5, 5]
+    rewards = agent.memory.sample_buffer(30)[2]
+    assert set(rewards.astype(int).tolist()) == {0, 1, 2}
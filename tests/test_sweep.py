@@ -0,0 +1,33 @@
+from Sweep import DEFAULT_SPACE, random_search, should_stop
+
+
+def test_random_search_samples_integer_ranges_as_integers():
+    space = {"batch": {"low": 32, "high": 512, "log": True}, "layers": {"low": 1, "high": 3},
+             "width": {"low": 8.0, "high": 16.0, "int": True}, "alpha": {"low": 1e-4, "high": 1e-2, "log": True}}
+    configs = random_search(space, 200)
+    for config in configs:
+        assert isinstance(config["batch"], int) and 32 <= config["batch"] <= 512
+        assert isinstance(config["layers"], int) and 1 <= config["layers"] <= 3
+        assert isinstance(config["width"], int) and 8 <= config["width"] <= 16
+        assert isinstance(config["alpha"], float) and 1e-4 <= config["alpha"] <= 1e-2
+    # Both bounds of a linear integer range are drawn
+    assert {config["layers"] for config in configs} == {1, 2, 3}
+
+
+def test_random_search_is_seeded():
+    assert random_search(DEFAULT_SPACE, 5, seed=1) == random_search(DEFAULT_SPACE, 5, seed=1)
+    assert random_search(DEFAULT_SPACE, 5, seed=1) != random_search(DEFAULT_SPACE, 5, seed=2)
+
+
+def test_should_stop_below_the_median_of_the_other_trials():
+    board = {0: [0.1, 0.2, 0.3], 1: [0.2, 0.4, 0.6], 2: [0.3, 0.5, 0.7], 3: [0.1, 0.1]}
+    assert should_stop(board, 0, 3, grace=2)
+    assert not should_stop(board, 2, 3, grace=2)
+
+
+def test_should_stop_waits_for_the_grace_period_and_other_trials():
+    board = {0: [0.0, 0.0], 1: [0.5, 0.5], 2: [0.5, 0.5]}
+    assert not should_stop(board, 0, 1, grace=2)
+    assert should_stop(board, 0, 2, grace=2)
+    # Only one other trial reached the episode
+    assert not should_stop({0: [0.0, 0.0], 1: [0.5, 0.5], 2: [0.5]}, 0, 2, grace=1)